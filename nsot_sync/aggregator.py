@@ -0,0 +1,222 @@
+'''
+Aggregator
+----------
+
+Push aggregation, for fleets too big for every host to talk to NSoT itself.
+
+Agents run their driver as usual but with ``--push URL``, which sends what
+they collected to ``nsot_sync serve`` rather than syncing it. The aggregator
+buffers submissions for a time window, coalescing them by natural key so a
+network a thousand hosts report is written once, then syncs everything
+buffered through one driver over one connection pool.
+'''
+
+from __future__ import print_function
+import hmac
+import logging
+import threading
+import requests
+from collections import OrderedDict
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+from nsot_sync import serializers
+from nsot_sync.common import natural_key, RESOURCE_TYPES
+
+PATH = '/submit'
+SECRET_HEADER = 'X-NSoT-Sync-Secret'
+
+logger = logging.getLogger(__name__)
+
+
+def push(url, resources, site_id, required_attrs=(), secret=None,
+         timeout=30):  # -> dict
+    '''Submits a driver's resources to an aggregator
+
+    Args:
+        url (str): Aggregator to submit to, eg http://127.0.0.1:8700/submit
+        resources (dict): Same format as returned by .get_resources, with
+            extra attributes already added
+        site_id (int): NSoT site the resources belong in
+        required_attrs (list): The driver's REQUIRED_ATTRS
+        secret (str): Shared secret the aggregator was started with
+
+    Raises:
+        requests.RequestException: If it couldn't be submitted
+    '''
+    payload = {
+        'site_id': site_id,
+        'resources': resources,
+        'required_attrs': list(required_attrs),
+    }
+    headers = {'content-type': 'application/json'}
+    if secret:
+        headers[SECRET_HEADER] = secret
+    resp = requests.post(url, data=serializers.dumps(payload),
+                         headers=headers, timeout=timeout)
+    resp.raise_for_status()
+    return resp.json()
+
+
+class Buffer(object):
+    '''One site's submissions, coalesced by natural key
+
+    A resource submitted again replaces what was buffered for it, since each
+    submission is the host's current view of it. Resources keep the order
+    they were first submitted in.
+    '''
+
+    def __init__(self):
+        self.resources = dict((rtype, OrderedDict())
+                              for rtype in RESOURCE_TYPES)
+        self.required = OrderedDict()
+        self.submissions = 0
+
+    def __len__(self):
+        return sum(len(r) for r in self.resources.values())
+
+    def add(self, resources, required_attrs=()):
+        '''
+        Raises:
+            KeyError, TypeError, ValueError: If resources are malformed
+        '''
+        staged = []
+        for rtype in RESOURCE_TYPES:
+            for resource in resources.get(rtype) or []:
+                if not isinstance(resource, dict):
+                    raise TypeError('%s must be objects' % rtype)
+                staged.append((rtype, natural_key(rtype, resource), resource))
+        for rtype, key, resource in staged:
+            self.resources[rtype][key] = resource
+        for attr in required_attrs:
+            self.required.setdefault((attr['resource_name'], attr['name']),
+                                     attr)
+        self.submissions += 1
+
+    def drain(self):  # -> Dict[str, list]
+        return dict((rtype, list(self.resources[rtype].values()))
+                    for rtype in RESOURCE_TYPES)
+
+
+class Aggregator(object):
+    '''Buffers submissions, applying them once per time window
+
+    Args:
+        apply (callable): Called with (site_id, resources, required_attrs)
+            for each site with anything buffered. Only ever called from one
+            thread at a time
+        window (float): Seconds submissions are buffered for
+        max_buffered (int): Apply early once this many resources are
+            buffered, across every site
+    '''
+
+    def __init__(self, apply, window=5, max_buffered=10000):
+        self.apply = apply
+        self.window = window
+        self.max_buffered = max_buffered
+        self.buffers = {}
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def submit(self, payload):  # -> int
+        '''Buffers a submission from .push(), returning how many resources
+
+        Raises:
+            KeyError, TypeError, ValueError: If the payload is malformed
+        '''
+        site_id = int(payload['site_id'])
+        resources = payload['resources']
+        if not isinstance(resources, dict):
+            raise TypeError('resources must be an object')
+        with self.lock:
+            buf = self.buffers.setdefault(site_id, Buffer())
+            buf.add(resources, payload.get('required_attrs') or [])
+            buffered = sum(len(b) for b in self.buffers.values())
+        if buffered >= self.max_buffered:
+            self.wakeup.set()
+        return sum(len(resources.get(rtype) or []) for rtype in RESOURCE_TYPES)
+
+    def flush(self):
+        '''Applies everything buffered so far, site by site'''
+        with self.flush_lock:
+            with self.lock:
+                buffers, self.buffers = self.buffers, {}
+            for site_id, buf in sorted(buffers.items()):
+                logger.info('Applying %d resources from %d submissions to '
+                            'site %d', len(buf), buf.submissions, site_id)
+                try:
+                    self.apply(site_id, buf.drain(),
+                               list(buf.required.values()))
+                except Exception:
+                    logger.exception('flush, applying site %d', site_id)
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.wakeup.wait(self.window)
+            self.wakeup.clear()
+            self.flush()
+        self.flush()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        '''Stops the window thread, applying whatever's still buffered'''
+        self.stopped.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+
+
+class SubmitHandler(BaseHTTPRequestHandler):
+    def log_message(self, fmt, *args):
+        logger.debug(fmt, *args)
+
+    def reply(self, status, data):
+        body = serializers.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        if self.path.rstrip('/') != PATH:
+            return self.reply(404, {'error': 'Not found: %s' % self.path})
+        secret = self.headers.get(SECRET_HEADER) or ''
+        if server.secret and not hmac.compare_digest(str(secret),
+                                                     str(server.secret)):
+            return self.reply(403, {'error': 'Bad or missing secret'})
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            payload = serializers.loads(self.rfile.read(length))
+            queued = server.aggregator.submit(payload)
+        except (KeyError, TypeError, ValueError) as e:
+            return self.reply(400, {'error': 'Bad submission: %s' % e})
+        self.reply(202, {'queued': queued})
+
+
+class AggregatorServer(ThreadingMixIn, HTTPServer):
+    '''HTTP front end taking .push() submissions for an Aggregator
+
+    Args:
+        address (tuple): (host, port) to listen on
+        aggregator (Aggregator): Where submissions are buffered
+        secret (str): If set, submissions must carry it
+    '''
+
+    daemon_threads = True
+
+    def __init__(self, address, aggregator, secret=None):
+        HTTPServer.__init__(self, address, SubmitHandler)
+        self.aggregator = aggregator
+        self.secret = secret
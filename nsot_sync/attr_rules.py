@@ -0,0 +1,204 @@
+'''
+Attribute rules
+---------------
+
+Per-resource attributes derived from patterns, eg a rack from the hostname or
+a VLAN from the interface name.
+
+Rules are given per resource type in a JSON file passed to ``--attr-rules``.
+Each may ``match`` fields of the resource against regular expressions, and
+sets ``attributes`` from templates filled in with the expressions' named
+groups and the resource's own fields:
+
+>>> {
+      "devices": [
+        {
+          "match": {"hostname": "^(?P<dc>[a-z]+)-r(?P<rack>[0-9]+)-"},
+          "attributes": {"dc": "{dc}", "rack": "{rack}"}
+        }
+      ],
+      "interfaces": [
+        {
+          "match": {"name": "^vlan(?P<vlan>[0-9]+)$"},
+          "attributes": {"vlan": "{vlan}"}
+        },
+        {"attributes": {"desc": "{name} on {device}"}}
+      ]
+    }
+
+A rule without ``match`` applies to every resource of its type, and rules
+apply in order, later ones overriding earlier ones. Static attributes from
+``--device-attrs`` and friends are compiled as rules of that kind, applied
+last. Attributes that render empty aren't set, save for those from
+``--device-attrs`` and friends, which are set just as given, eg ``foo=`` to
+an empty string.
+
+Everything is compiled once, so applying rules is a single pass over the
+resources with no parsing along the way, and every attribute a rule can set
+is known up front to be added to REQUIRED_ATTRS.
+'''
+
+from __future__ import print_function
+import re
+import string
+from nsot_sync.common import RESOURCE_TYPES
+
+# Resource type for each --[resource]-attrs option's key in EXTRA_ATTRS
+EXTRA_ATTRS_TYPES = {
+    'device_attrs': 'devices',
+    'network_attrs': 'networks',
+    'interface_attrs': 'interfaces',
+}
+
+
+class Fields(dict):
+    '''Template values, rendering missing ones as empty'''
+
+    def __missing__(self, key):
+        return ''
+
+
+class Template(object):
+    '''Template like '{field} on {device}', parsed once
+
+    Only plain field names are supported, no attribute access, indexing, or
+    format specs.
+
+    Raises:
+        ValueError: If the template uses anything else
+    '''
+
+    def __init__(self, template):
+        self.parts = []
+        for literal, field, spec, conv in string.Formatter().parse(template):
+            if spec or conv or (field and not re.match(r'^\w+$', field)):
+                raise ValueError('Unsupported template: %s' % template)
+            self.parts.append((literal, field))
+        self.constant = None
+        if not any(field for _, field in self.parts):
+            self.constant = ''.join(literal for literal, _ in self.parts)
+
+    def render(self, values):  # -> str
+        if self.constant is not None:
+            return self.constant
+        return ''.join(literal + (field and '%s' % values[field] or '')
+                       for literal, field in self.parts).strip()
+
+
+class Rule(object):
+    '''One compiled rule for a resource type
+
+    Args:
+        spec (dict): With 'attributes', mapping names to templates, and
+            optionally 'match', mapping fields to regular expressions
+        keep_empty (bool): Whether attributes rendering empty are set too
+
+    Raises:
+        ValueError: If a template or expression is invalid
+    '''
+
+    def __init__(self, spec, keep_empty=False):
+        try:
+            self.match = [(field, re.compile(pattern))
+                          for field, pattern in
+                          sorted((spec.get('match') or {}).items())]
+        except re.error as e:
+            raise ValueError('Bad match expression: %s' % e)
+        self.attributes = [(name, Template(template))
+                           for name, template in
+                           sorted((spec.get('attributes') or {}).items())]
+        self.static = not self.match and all(
+            t.constant is not None for _, t in self.attributes)
+        self.keep_empty = keep_empty
+
+    def apply(self, resource):
+        '''Sets this rule's attributes on resource, if it matches'''
+        attrs = resource.setdefault('attributes', {})
+        if self.static:
+            attrs.update((name, t.constant) for name, t in self.attributes
+                         if t.constant or self.keep_empty)
+            return
+        values = Fields()
+        for field, regex in self.match:
+            found = regex.search('%s' % resource.get(field, ''))
+            if found is None:
+                return
+            values.update(found.groupdict())
+        for field, value in resource.items():
+            if field != 'attributes':
+                values.setdefault(field, value)
+        for name, template in self.attributes:
+            value = template.render(values)
+            if value or self.keep_empty:
+                attrs[name] = value
+
+
+class RuleSet(object):
+    '''Every rule, compiled and grouped by resource type
+
+    Args:
+        rules (dict): Resource type mapped to a list of rule specs
+        extra_attrs (dict): EXTRA_ATTRS from the CLI, applied after rules
+
+    Raises:
+        ValueError: If the rules are malformed
+    '''
+
+    def __init__(self, rules=None, extra_attrs=None):
+        rules = rules or {}
+        unknown = set(rules) - set(RESOURCE_TYPES)
+        if unknown:
+            raise ValueError('Unknown resource types in attribute rules: %s' %
+                             ', '.join(sorted(unknown)))
+        self.rules = dict((rtype, []) for rtype in RESOURCE_TYPES)
+        for rtype in RESOURCE_TYPES:
+            specs = rules.get(rtype) or []
+            if isinstance(specs, dict):
+                specs = [specs]
+            self.rules[rtype].extend(Rule(spec) for spec in specs)
+        for option, attrs in sorted((extra_attrs or {}).items()):
+            if attrs:
+                # Given literally, so braces aren't template fields
+                attrs = dict((k, v.replace('{', '{{').replace('}', '}}'))
+                             for k, v in attrs.items())
+                rtype = EXTRA_ATTRS_TYPES[option]
+                self.rules[rtype].append(Rule({'attributes': attrs},
+                                              keep_empty=True))
+
+    def __bool__(self):
+        return any(self.rules.values())
+    __nonzero__ = __bool__
+
+    def required_attrs(self):  # -> list
+        '''NSoT attribute dicts for every attribute the rules can set'''
+        required = []
+        seen = set()
+        for rtype in RESOURCE_TYPES:
+            rname = rtype[:-1].title()
+            for rule in self.rules[rtype]:
+                for name, _ in rule.attributes:
+                    if (rname, name) not in seen:
+                        seen.add((rname, name))
+                        required.append({
+                            'name': name,
+                            'resource_name': rname,
+                            'required': False,
+                        })
+        return required
+
+    def apply_one(self, rtype, resource):
+        for rule in self.rules[rtype]:
+            rule.apply(resource)
+        return resource
+
+    def apply(self, resources):  # -> dict
+        '''Applies the rules to resources in .get_resources format, in place
+        '''
+        for rtype in RESOURCE_TYPES:
+            rules = self.rules[rtype]
+            if not rules:
+                continue
+            for resource in resources.get(rtype, []):
+                for rule in rules:
+                    rule.apply(resource)
+        return resources
@@ -0,0 +1,125 @@
+'''
+Cache
+-----
+
+On-host read-through cache of NSoT lookups, shared by every nsot_sync run that
+points at the same file.
+
+Objects are keyed by site, resource type, and natural key, and expire after a
+TTL. Drivers write through to the cache after every successful POST/PATCH so
+sibling runs (other drivers, other cron entries) see what was just written
+without asking the server again.
+'''
+
+from __future__ import print_function
+import os
+import time
+import sqlite3
+import logging
+import threading
+from nsot_sync import serializers
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS lookups (
+    site_id INTEGER NOT NULL,
+    resource_type TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (site_id, resource_type, key)
+)
+'''
+
+
+class LookupCache(object):
+    '''SQLite-backed cache of NSoT objects by natural key
+
+    Safe to share between processes: the database runs in WAL mode so readers
+    never block on writers, and writers wait on each other for up to
+    ``timeout`` seconds. Each thread gets its own connection.
+
+    Only objects that exist are cached. A miss always goes to the server, so
+    a resource created elsewhere is never hidden behind a stale negative.
+
+    Args:
+        path (str): SQLite database file. Created if missing
+        ttl (int): Seconds a cached object stays valid
+        timeout (int): Seconds to wait on another process's write lock
+    '''
+
+    def __init__(self, path, ttl=300, timeout=30):
+        self.path = os.path.expanduser(path)
+        self.ttl = ttl
+        self.timeout = timeout
+        self.logger = logging.getLogger(__name__)
+        self._local = threading.local()
+
+        dirname = os.path.dirname(self.path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+
+        conn = self.conn
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(SCHEMA)
+        self.purge()
+
+    @property
+    def conn(self):
+        '''Per-thread connection, in autocommit mode'''
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout,
+                                   isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, site_id, rtype, key):
+        '''Returns the cached object, or None if missing or expired'''
+        row = self.conn.execute(
+            'SELECT value FROM lookups WHERE site_id = ? AND '
+            'resource_type = ? AND key = ? AND expires > ?',
+            (site_id, rtype, key, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        self.logger.debug('Cache hit: %s %s', rtype, key)
+        return serializers.loads(row[0])
+
+    def set(self, site_id, rtype, key, obj):
+        '''Caches a single object, replacing what was there'''
+        self.set_many(site_id, rtype, [(key, obj)])
+
+    def set_many(self, site_id, rtype, items):
+        '''Caches (key, obj) tuples in a single transaction'''
+        if not items:
+            return
+        expires = time.time() + self.ttl
+        rows = [(site_id, rtype, key, serializers.dumps(obj), expires)
+                for key, obj in items]
+        conn = self.conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                'INSERT OR REPLACE INTO lookups '
+                '(site_id, resource_type, key, value, expires) '
+                'VALUES (?, ?, ?, ?, ?)',
+                rows
+            )
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def invalidate(self, site_id, rtype, key):
+        '''Drops a cached object, eg after the server disagreed with it'''
+        self.conn.execute(
+            'DELETE FROM lookups WHERE site_id = ? AND resource_type = ? '
+            'AND key = ?',
+            (site_id, rtype, key)
+        )
+
+    def purge(self):
+        '''Removes every expired object'''
+        self.conn.execute('DELETE FROM lookups WHERE expires <= ?',
+                          (time.time(),))
@@ -11,7 +11,11 @@ Click command. This is where the driver entrypoints should be.
 
 from __future__ import print_function
 import os
+import json
 import click
+from nsot_sync import attr_rules, selection
+from nsot_sync.common import validate_csv
+from nsot_sync.client import TOKEN_CACHE
 
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 PLUGIN_FOLDERS = [
@@ -66,9 +70,37 @@ def validate_attrs(ctx, param, value):  # -> Dict[str, str]
         raise click.BadParameter(validate_attrs.__doc__)
 
 
+def validate_attr_rules(ctx, param, value):  # -> Dict[str, list]
+    '''Attribute rules file must be JSON, see nsot_sync.attr_rules'''
+    if value is None:
+        return None
+    try:
+        rules = json.load(value)
+        attr_rules.RuleSet(rules)
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        raise click.BadParameter(str(e))
+    return rules
+
+
+def validate_selection(ctx, param, value):  # -> list
+    '''Comma separated resource types, or CIDRs, see nsot_sync.selection'''
+    values = validate_csv(ctx, param, value)
+    check = {
+        'only': {'types': values},
+        'only_networks': {'cidrs': values},
+    }
+    try:
+        selection.Selection(**check.get(param.name, {}))
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    return values
+
+
 @click.command(cls=DynamicLoader, context_settings=CONTEXT_SETTINGS)
 @click.version_option(None, '-V', '--version')
 @click.option('--noop', is_flag=True, help='no-op mode')
+@click.option('--output-format', type=click.Choice(['json', 'ndjson']),
+              default='json', help='How no-op mode writes resources')
 @click.option('--verbose', '-v', count=True, help='Verbose logging')
 @click.option(
     '--site-id',
@@ -83,13 +115,80 @@ def validate_attrs(ctx, param, value):  # -> Dict[str, str]
               help='List of static attributes to add to networks')
 @click.option('--interface-attrs', callback=validate_attrs, default={},
               help='List of static attributes to add to interfaces')
+@click.option('--attr-rules', envvar='NSOT_SYNC_ATTR_RULES', default=None,
+              type=click.File('rb'), callback=validate_attr_rules,
+              help='JSON file of rules deriving attributes per resource')
+@click.option('--only', callback=validate_selection, default=None,
+              metavar='TYPES',
+              help='Only sync these resource types, eg devices,interfaces')
+@click.option('--only-interfaces', callback=validate_selection,
+              default=None, metavar='GLOBS',
+              help='Only sync interfaces named like these, eg eth*,bond0')
+@click.option('--only-networks', callback=validate_selection, default=None,
+              metavar='CIDRS',
+              help='Only sync networks inside these, eg 10.0.0.0/8')
+@click.option('--spool-dir', envvar='NSOT_SYNC_SPOOL_DIR', default=None,
+              type=click.Path(file_okay=False),
+              help='Journal writes here if NSoT is unreachable, for replay')
+@click.option('--cache', envvar='NSOT_SYNC_CACHE', default=None,
+              type=click.Path(dir_okay=False),
+              help='SQLite file to share NSoT lookups between runs')
+@click.option('--cache-ttl', envvar='NSOT_SYNC_CACHE_TTL', default=300,
+              type=int, help='Seconds cached lookups stay valid')
+@click.option('--token-cache', envvar='NSOT_SYNC_TOKEN_CACHE',
+              default=TOKEN_CACHE, type=click.Path(dir_okay=False),
+              help='Keep auth_token logins here between runs, "" to disable')
+@click.option('--staging', envvar='NSOT_SYNC_STAGING', default=None,
+              type=click.Path(dir_okay=False),
+              help='Stage resources in this SQLite file instead of memory')
+@click.option('--quarantine', envvar='NSOT_SYNC_QUARANTINE', default=None,
+              type=click.Path(dir_okay=False),
+              help='Append resources failing validation to this file')
+@click.option('--push', envvar='NSOT_SYNC_PUSH', default=None, metavar='URL',
+              help='Submit resources to nsot_sync serve at URL instead')
+@click.option('--push-secret', envvar='NSOT_SYNC_PUSH_SECRET', default=None,
+              help='Shared secret nsot_sync serve was started with')
+@click.option('--deadline', envvar='NSOT_SYNC_DEADLINE', default=None,
+              type=float, metavar='SECONDS',
+              help='Stop in time to finish within this long, most important '
+                   'writes first')
+@click.option('--retries', envvar='NSOT_SYNC_RETRIES', default=3, type=int,
+              help='Times to retry requests NSoT failed, 0 to disable')
+@click.option('--timeout', envvar='NSOT_SYNC_TIMEOUT', default=30,
+              type=float, metavar='SECONDS',
+              help='How long to wait on NSoT for each request')
+@click.option('--workers', '-w', default=1, type=int,
+              help='How many resources to write to NSoT at once')
+@click.option('--progress-interval', default=5, type=int,
+              help='Seconds between progress lines, 0 to disable')
+@click.option('--log-objects', is_flag=True,
+              help='Log every resource in full as it is written')
 @click.pass_context
 def cli(ctx,
         noop=False,
+        output_format='json',
         site_id=1,
         device_attrs={},
         network_attrs={},
         interface_attrs={},
+        attr_rules=None,
+        only=None,
+        only_interfaces=None,
+        only_networks=None,
+        spool_dir=None,
+        cache=None,
+        cache_ttl=300,
+        token_cache=TOKEN_CACHE,
+        staging=None,
+        quarantine=None,
+        push=None,
+        push_secret=None,
+        deadline=None,
+        retries=3,
+        timeout=30,
+        workers=1,
+        progress_interval=5,
+        log_objects=False,
         verbose=0):
     '''nsot_sync creates/updates resources in an NSoT instance
 
@@ -110,11 +209,34 @@ def cli(ctx,
     elif verbose == 0:
         log_level = 'WARNING'
 
+    # Full resources are logged at INFO, so asking for them implies it
+    if log_objects and log_level == 'WARNING':
+        log_level = 'INFO'
+
     coloredlogs.install(level=log_level)
 
     ctx.obj['SITE_ID'] = site_id
     ctx.obj['NOOP'] = noop
+    ctx.obj['OUTPUT_FORMAT'] = output_format
     ctx.obj['VERBOSE'] = verbose
+    ctx.obj['SPOOL_DIR'] = spool_dir
+    ctx.obj['CACHE'] = cache
+    ctx.obj['CACHE_TTL'] = cache_ttl
+    ctx.obj['TOKEN_CACHE'] = token_cache
+    ctx.obj['STAGING'] = staging
+    ctx.obj['QUARANTINE'] = quarantine
+    ctx.obj['PUSH'] = push
+    ctx.obj['PUSH_SECRET'] = push_secret
+    ctx.obj['DEADLINE'] = deadline
+    ctx.obj['RETRIES'] = retries
+    ctx.obj['TIMEOUT'] = timeout
+    ctx.obj['WORKERS'] = workers
+    ctx.obj['PROGRESS_INTERVAL'] = progress_interval
+    ctx.obj['LOG_OBJECTS'] = log_objects
+    ctx.obj['ATTR_RULES'] = attr_rules
+    ctx.obj['ONLY'] = only
+    ctx.obj['ONLY_INTERFACES'] = only_interfaces
+    ctx.obj['ONLY_NETWORKS'] = only_networks
     ctx.obj['EXTRA_ATTRS'] = {
         'network_attrs': network_attrs,
         'device_attrs': device_attrs,
@@ -0,0 +1,243 @@
+'''
+Client
+------
+
+One pynsot client per process, over one keep-alive connection pool.
+
+Every driver and handler in a run shares the client from ``get_client()``,
+so connections to NSoT are set up once and reused rather than per driver.
+Every request over it is retried and guarded by a circuit breaker as set out
+in nsot_sync.retry.
+
+With ``auth_method = auth_token`` in ``~/.pynsotrc``, the token NSoT hands
+out is also kept on disk (readable only by its owner) until it's about to
+expire, so back to back runs don't each log in again. A token NSoT no longer
+accepts is dropped and replaced transparently.
+'''
+
+from __future__ import print_function
+import os
+import json
+import time
+import click
+import logging
+import threading
+from requests import Session
+from pynsot import constants, dotfile
+from pynsot.client import (AuthTokenAuthentication, AuthTokenClient,
+                           get_auth_client_info)
+from pynsot.util import get_result
+from pynsot.vendor.slumber.exceptions import HttpClientError
+from nsot_sync.retry import RetryAdapter
+
+# NSoT's default AUTH_TOKEN_EXPIRY, in seconds
+TOKEN_EXPIRY = 600
+
+# Cached tokens this close to expiring are treated as expired
+TOKEN_MARGIN = 60
+
+TOKEN_CACHE = os.path.join('~', '.cache', 'nsot_sync', 'tokens')
+
+POOL_SIZE = 10
+
+logger = logging.getLogger(__name__)
+_client = None
+_lock = threading.Lock()
+
+
+class TokenCache(object):
+    '''Auth tokens on disk, keyed by API URL and email
+
+    The secret key is never written, only the token it was traded for.
+
+    Args:
+        path (str): File to keep tokens in. It and its directory are only
+            accessible by the current user
+        expiry (int): Seconds a token is valid for after NSoT issues it
+    '''
+
+    def __init__(self, path, expiry=TOKEN_EXPIRY):
+        self.path = os.path.expanduser(path)
+        self.expiry = expiry
+        self.lock = threading.Lock()
+
+    def ident(self, url, email):
+        return '%s %s' % (url, email)
+
+    def read(self):  # -> dict
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def write(self, tokens):
+        dirname = os.path.dirname(self.path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname, 0o700)
+        tmp = '%s.%d' % (self.path, os.getpid())
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(tokens, f)
+        os.rename(tmp, self.path)
+
+    def get(self, url, email):
+        '''Returns a cached token with time left on it, or None'''
+        entry = self.read().get(self.ident(url, email))
+        if not entry:
+            return None
+        if time.time() - entry['obtained'] > self.expiry - TOKEN_MARGIN:
+            return None
+        return entry['token']
+
+    def set(self, url, email, token):
+        with self.lock:
+            tokens = self.read()
+            now = time.time()
+            tokens = dict((k, v) for k, v in tokens.items()
+                          if now - v['obtained'] < self.expiry)
+            tokens[self.ident(url, email)] = {'token': token,
+                                              'obtained': now}
+            self.write(tokens)
+
+    def invalidate(self, url, email):
+        with self.lock:
+            tokens = self.read()
+            if tokens.pop(self.ident(url, email), None) is not None:
+                self.write(tokens)
+
+
+class CachedAuthTokenAuthentication(AuthTokenAuthentication):
+    '''AuthTokenAuthentication that reuses tokens from a TokenCache
+
+    Logs in over the shared session rather than a one-off connection. If NSoT
+    rejects a cached token, a new one is fetched and the request sent again.
+    '''
+
+    def __init__(self, client):
+        self.token_cache = client._kwargs.pop('token_cache', None)
+        self.session = client._kwargs.get('session')
+        self.secret_key = client._kwargs.get('secret_key')
+        super(CachedAuthTokenAuthentication, self).__init__(client)
+
+    def get_token(self, base_url, email, secret_key):
+        if self.token_cache is not None:
+            token = self.token_cache.get(base_url, email)
+            if token:
+                logger.debug('Using cached auth_token for %s', email)
+                return token
+        token = self.login(base_url, email, secret_key)
+        if token and self.token_cache is not None:
+            self.token_cache.set(base_url, email, token)
+        return token
+
+    def login(self, base_url, email, secret_key):
+        '''Trade the secret key for a fresh token'''
+        data = json.dumps({'email': email, 'secret_key': secret_key})
+        headers = {'content-type': 'application/json'}
+        try:
+            resp = self.session.post(base_url + '/authenticate/', data=data,
+                                     headers=headers)
+        except Exception as err:
+            self.client.error(err)
+        if not resp.ok:
+            msg = 'Failed to fetch auth_token from %s' % base_url
+            err = HttpClientError(msg, response=resp, content=resp.content)
+            self.client.error(err)
+        return get_result(resp)['auth_token']
+
+    def __call__(self, r):
+        r = super(CachedAuthTokenAuthentication, self).__call__(r)
+        r.register_hook('response', self.retry_rejected)
+        return r
+
+    def retry_rejected(self, resp, **kwargs):
+        '''Response hook that logs in again once if the token was refused'''
+        if resp.status_code != 401 or getattr(resp.request, 'retried', False):
+            return resp
+        logger.debug('auth_token rejected, logging in again')
+        if self.token_cache is not None:
+            self.token_cache.invalidate(self.base_url, self.email)
+        self.auth_token = self.get_token(self.base_url, self.email,
+                                         self.secret_key)
+
+        # Release the connection back to the pool before reusing it
+        resp.content
+        resp.close()
+        prep = resp.request.copy()
+        prep.retried = True
+        auth = 'AuthToken %s:%s' % (self.email, self.auth_token)
+        prep.headers['Authorization'] = auth
+        retried = resp.connection.send(prep, **kwargs)
+        retried.history.append(resp)
+        retried.request = prep
+        return retried
+
+
+class CachedAuthTokenClient(AuthTokenClient):
+    authentication_class = CachedAuthTokenAuthentication
+
+
+def get_session(pool_size=POOL_SIZE, policy=None):  # -> requests.Session
+    '''Keep-alive session with room for pool_size concurrent connections
+
+    Requests are retried per policy, a retry.RetryPolicy, or its defaults.
+    '''
+    session = Session()
+    adapter = RetryAdapter(policy, pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_client(token_cache=None, pool_size=POOL_SIZE, policy=None):
+    '''Returns the process's pynsot client, creating it on first use
+
+    Configured from ``~/.pynsotrc`` like pynsot.client.get_api_client, but
+    over a shared session and, for auth_token, with a cached token.
+
+    Args:
+        token_cache (TokenCache): Where to keep auth tokens, or None to log
+            in every time
+        pool_size (int): Most connections kept open to NSoT at once. Should
+            be at least the number of threads making requests
+        policy (retry.RetryPolicy): How requests are retried, or None for
+            the defaults
+    '''
+    global _client
+    with _lock:
+        if _client is None:
+            _client = make_client(token_cache, pool_size, policy)
+        return _client
+
+
+def make_client(token_cache=None, pool_size=POOL_SIZE, policy=None):
+    try:
+        args = dotfile.Dotfile().read()
+    except dotfile.DotfileError as err:
+        raise click.UsageError(err.message)
+
+    auth_method = args.pop('auth_method')
+    url = args.pop('url')
+    if auth_method == 'auth_token':
+        client_class = CachedAuthTokenClient
+    else:
+        try:
+            client_class = get_auth_client_info(auth_method)
+        except KeyError:
+            raise click.UsageError('Invalid auth_method: %s' % auth_method)
+
+    allowed = (client_class.required_arguments +
+               tuple(constants.OPTIONAL_FIELDS))
+    args = dict((k, v) for k, v in args.items() if k in allowed)
+    args['session'] = get_session(pool_size, policy)
+    if client_class is CachedAuthTokenClient:
+        args['token_cache'] = token_cache
+
+    try:
+        return client_class(url, **args)
+    except HttpClientError as err:
+        msg = str(err)
+        if 'Connection refused' in msg:
+            msg = 'Could not connect to server: %s' % url
+        raise click.UsageError(msg)
@@ -0,0 +1,51 @@
+from __future__ import print_function
+import click
+from nsot_sync import serializers
+from nsot_sync.drivers import csvimport
+
+
+@click.command()
+@click.argument('files', nargs=-1, required=True, type=click.File('rb'))
+@click.option('-m', '--mapping', type=click.File('rb'),
+              help='JSON file mapping columns to resources')
+@click.option('-p', '--preset', type=click.Choice(sorted(csvimport.PRESETS)),
+              help='Use a built in mapping for this export format')
+@click.option('-b', '--batch-size', type=int,
+              default=csvimport.CSVImportDriver.BATCH_SIZE,
+              help='Resources to sync at a time')
+@click.pass_context
+def cli(ctx, files, mapping=None, preset=None, batch_size=None):
+    '''Import networks and devices from CSV exports of another IPAM
+
+    Rows are streamed and synced in batches, so exports with millions of
+    rows are fine. Natural keys and the site's existing objects are still
+    held in memory, unless --staging is given before the command.
+
+    Columns are mapped to resources by --mapping, or one of the --preset
+    mappings for Infoblox and Orion exports.
+    '''
+    if mapping is not None:
+        try:
+            mapping = serializers.loads(mapping.read())
+        except ValueError as e:
+            ctx.fail('Bad mapping: %s' % e)
+    elif preset is not None:
+        mapping = csvimport.PRESETS[preset]
+    else:
+        ctx.fail('Give a --mapping or a --preset')
+
+    try:
+        driver = csvimport.CSVImportDriver(
+            click_ctx=ctx,
+            files=files,
+            mapping=mapping,
+            batch_size=batch_size,
+        )
+    except ValueError as e:
+        ctx.fail('Bad mapping: %s' % e)
+
+    if ctx.obj['NOOP']:
+        driver.noop()
+        return
+
+    driver.handle_resources()
@@ -1,5 +1,5 @@
-import json
 import click
+from nsot_sync import serializers
 from nsot_sync.drivers import facter
 
 
@@ -9,7 +9,9 @@ def cli(ctx):
     '''The facter driver can add attributes to created resources from facter'''
     driver = facter.FacterDriver(click_ctx=ctx)
     if ctx.obj['NOOP']:
-        click.echo(json.dumps(driver.get_resources()))
+        fmt = ctx.obj.get('OUTPUT_FORMAT', 'json')
+        stdout = click.get_text_stream('stdout')
+        serializers.stream(driver.get_resources(), stdout, fmt)
         return
 
     driver.handle_resources()
@@ -0,0 +1,21 @@
+from __future__ import print_function
+import click
+from nsot_sync.drivers import replay
+
+
+@click.command()
+@click.pass_context
+def cli(ctx):
+    '''Replay writes spooled while NSoT was unreachable
+
+    Requires --spool-dir. Later writes to the same resource replace earlier
+    ones, so each resource is only sent once.
+    '''
+    if ctx.obj.get('PUSH'):
+        ctx.fail('replay writes to NSoT itself, it cannot be used with --push')
+    driver = replay.ReplayDriver(click_ctx=ctx)
+    if ctx.obj['NOOP']:
+        driver.noop()
+        return
+
+    driver.handle_resources()
@@ -0,0 +1,37 @@
+from __future__ import print_function
+import click
+from nsot_sync.drivers import pipeline
+
+
+@click.command()
+@click.argument('drivers', nargs=-1, required=True)
+@click.pass_context
+def cli(ctx, drivers):
+    '''Run several drivers as one sync, eg: nsot_sync run simple facter
+
+    Each driver collects at the same time, with its default options. Their
+    resources are merged by natural key, drivers named later taking
+    precedence, then synced together in one pass.
+
+    Only drivers collecting without options can be run this way, which
+    leaves out csvimport, replay, and aggregate.
+    '''
+    classes = []
+    for name in drivers:
+        try:
+            driver_cls = pipeline.find_driver(name)
+        except ValueError as e:
+            ctx.fail(str(e))
+        if not driver_cls.PIPELINE:
+            ctx.fail('%s needs options of its own, so it can only be run '
+                     'by itself' % name)
+        classes.append(driver_cls)
+
+    instances = [cls(click_ctx=ctx, collect_only=True) for cls in classes]
+
+    driver = pipeline.PipelineDriver(click_ctx=ctx, drivers=instances)
+    if ctx.obj['NOOP']:
+        driver.noop()
+        return
+
+    driver.handle_resources()
@@ -0,0 +1,46 @@
+from __future__ import print_function
+import click
+from nsot_sync import aggregator
+from nsot_sync.common import info
+from nsot_sync.drivers import aggregate
+
+
+@click.command()
+@click.option('--bind', default='127.0.0.1', help='Address to listen on')
+@click.option('--port', '-p', default=8700, type=int, help='Port to listen on')
+@click.option('--window', default=5.0, type=float,
+              help='Seconds to buffer submissions before syncing them')
+@click.option('--max-buffered', default=10000, type=int,
+              help='Sync early once this many resources are buffered')
+@click.option('--secret', envvar='NSOT_SYNC_PUSH_SECRET', default=None,
+              help='Only accept submissions carrying this shared secret')
+@click.pass_context
+def cli(ctx, bind, port, window, max_buffered, secret):
+    '''Aggregate pushes from agents run with --push, syncing them in bulk
+
+    Agents submit to http://BIND:PORT/submit. Submissions are buffered for
+    --window seconds and coalesced by natural key, then synced through one
+    connection to NSoT per site. Stop with Ctrl-C, which syncs whatever is
+    still buffered first.
+    '''
+    drivers = {}
+
+    def apply(site_id, resources, required_attrs):
+        if site_id not in drivers:
+            drivers[site_id] = aggregate.AggregateDriver(click_ctx=ctx,
+                                                         site_id=site_id)
+        drivers[site_id].apply(resources, required_attrs)
+
+    agg = aggregator.Aggregator(apply, window=window,
+                                max_buffered=max_buffered)
+    server = aggregator.AggregatorServer((bind, port), agg, secret=secret)
+    agg.start()
+    info('Listening on http://%s:%d%s' % (bind, server.server_port,
+                                          aggregator.PATH))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        agg.stop()
@@ -9,8 +9,10 @@ from nsot_sync.common import validate_csv
               help='Limit which interfaces, sep by comma, are synced')
 @click.option('-I', '--ignore-intfs', callback=validate_csv, default=[],
               help='Ignore interfaces prefixed with these strings')
+@click.option('--netns', is_flag=True,
+              help='Also sync interfaces in every network namespace')
 @click.pass_context
-def cli(ctx, interfaces=[], ignore_intfs=[]):
+def cli(ctx, interfaces=[], ignore_intfs=[], netns=False):
     '''Simple driver uses system interfaces to generate NSoT resources
 
     No extra attributes are added to the resources other than linking them
@@ -21,6 +23,7 @@ def cli(ctx, interfaces=[], ignore_intfs=[]):
         click_ctx=ctx,
         limit_intfs=interfaces,
         ignore_intfs=ignore_intfs,
+        scan_netns=netns,
     )
     if ctx.obj['NOOP']:
         driver.noop()
@@ -1,5 +1,6 @@
 from __future__ import print_function
 import click
+import netaddr
 
 
 def error(msg):
@@ -32,3 +33,81 @@ def validate_csv(ctx, param, value):
         return ifnames
     except:
         raise click.BadParameter(validate_csv.__doc__)
+
+
+# Order resources are created in, so that devices and networks exist before
+# the interfaces that reference them
+RESOURCE_TYPES = ('devices', 'networks', 'interfaces')
+
+
+def natural_key(rtype, resource):  # -> str
+    '''Returns the natural key NSoT would identify a resource by
+
+    Interfaces are keyed by whatever 'device' holds at the time, which per the
+    driver contract is usually the hostname.
+
+        >>> natural_key('networks', {'network_address': '10.0.0.1',
+        ...                          'prefix_length': 32})
+        '10.0.0.1/32'
+    '''
+    if rtype == 'devices':
+        return resource['hostname']
+    if rtype == 'networks':
+        return '%s/%s' % (resource['network_address'],
+                          resource['prefix_length'])
+    if rtype == 'interfaces':
+        return '%s:%s' % (resource['device'], resource['name'])
+    raise ValueError('Unknown resource type: %s' % rtype)
+
+
+class NetworkIndex(object):
+    '''Networks indexed for finding which of them contain an address
+
+    Networks are kept by (version, prefix length, value), so finding the
+    most specific one containing a CIDR takes one lookup per distinct prefix
+    length indexed, however many networks there are.
+
+        >>> index = NetworkIndex()
+        >>> index.add('10.0.0.0/8')
+        >>> index.parent('10.1.2.3/32')
+        '10.0.0.0/8'
+    '''
+
+    def __init__(self):
+        self.nets = {}
+        self.plens = {}
+
+    def __len__(self):
+        return len(self.nets)
+
+    @staticmethod
+    def ident(cidr):  # -> tuple
+        '''(version, prefix length, value) of a CIDR
+
+        Raises:
+            netaddr.AddrFormatError: If cidr isn't one
+        '''
+        net = netaddr.IPNetwork(cidr)
+        return (net.version, net.prefixlen, int(net.ip))
+
+    def add(self, cidr, key=None):
+        '''Index a network, under key if given, otherwise the CIDR itself'''
+        version, plen, value = ident = self.ident(cidr)
+        self.nets[ident] = key or cidr
+        if plen not in self.plens.setdefault(version, []):
+            self.plens[version] = sorted(self.plens[version] + [plen],
+                                         reverse=True)
+
+    def parent(self, cidr):
+        '''Key of the most specific network strictly containing cidr, or None
+        '''
+        version, plen, value = self.ident(cidr)
+        width = version == 4 and 32 or 128
+        for parent_plen in self.plens.get(version, []):
+            if parent_plen >= plen:
+                continue
+            mask = ((1 << parent_plen) - 1) << (width - parent_plen)
+            parent = self.nets.get((version, parent_plen, value & mask))
+            if parent:
+                return parent
+        return None
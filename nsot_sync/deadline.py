@@ -0,0 +1,118 @@
+'''
+Deadline
+--------
+
+Time budgets for runs, so one that would overrun its cron slot stops first.
+
+With a deadline, work is ordered so what gets cut is what matters least:
+devices first, then resources that differ from what NSoT has (or that it
+doesn't have at all), then reconciles of resources that already match. Writes
+stop being started shortly before the deadline, and the natural keys of what
+never ran are saved. The next run does those first within their priority,
+so a long tail gets worked through across runs rather than always being cut.
+'''
+
+from __future__ import print_function
+import os
+import json
+import time
+import logging
+from nsot_sync.staging import same
+
+RESUME_DIR = os.path.join('~', '.cache', 'nsot_sync', 'resume')
+
+# Most seconds held back from the deadline to let running writes finish
+MAX_MARGIN = 30
+
+DEVICES = 0
+CHANGED = 1
+UNCHANGED = 2
+
+logger = logging.getLogger(__name__)
+
+
+def priority(rtype, resource, existing, resumed=False):  # -> tuple
+    '''Priority of one staged resource, lower first
+
+    Args:
+        rtype (str): Resource type, eg 'networks'
+        resource (dict): Staged resource
+        existing (dict): The NSoT object for it if known, otherwise None
+        resumed (bool): Whether the last run left it unfinished
+    '''
+    if rtype == 'devices':
+        level = DEVICES
+    elif existing is None:
+        level = CHANGED
+    else:
+        # Staged interfaces may still name their device by hostname
+        staged = dict((k, v) for k, v in resource.items() if k != 'device')
+        level = same(staged, existing) and UNCHANGED or CHANGED
+    return (level, not resumed)
+
+
+class Deadline(object):
+    '''Seconds a run has, counted from when this is created
+
+    Args:
+        seconds (float): Time the run has in total
+        margin (float): Stop starting new work this long before the deadline.
+            Defaults to a tenth of seconds, at most MAX_MARGIN
+    '''
+
+    def __init__(self, seconds, margin=None):
+        self.seconds = seconds
+        if margin is None:
+            margin = min(MAX_MARGIN, seconds / 10.0)
+        self.margin = margin
+        self.started = time.time()
+        self.passed = False
+
+    def remaining(self):  # -> float
+        return self.seconds - (time.time() - self.started)
+
+    def expired(self):  # -> bool
+        '''Whether it's too late to start anything else. Once True, stays so'''
+        if not self.passed and self.remaining() <= self.margin:
+            logger.warning('Deadline of %ss nearly up, leaving the rest for '
+                           'the next run', self.seconds)
+            self.passed = True
+        return self.passed
+
+
+class ResumeFile(object):
+    '''(resource type, natural key) pairs a run left for the next one
+
+    Args:
+        path (str): File to keep them in
+    '''
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+
+    @classmethod
+    def for_driver(cls, driver):
+        '''Resume file of a driver class and site, under RESUME_DIR'''
+        name = '%s-%d.json' % (type(driver).__name__.lower(), driver.site_id)
+        return cls(os.path.join(RESUME_DIR, name))
+
+    def load(self):  # -> set
+        try:
+            with open(self.path) as f:
+                return set(tuple(k) for k in json.load(f))
+        except (IOError, OSError, ValueError):
+            return set()
+
+    def save(self, keys):
+        '''Replaces what's saved with keys, removing the file if empty'''
+        if not keys:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        dirname = os.path.dirname(self.path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        tmp = '%s.%d' % (self.path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(sorted(keys), f)
+        os.rename(tmp, self.path)
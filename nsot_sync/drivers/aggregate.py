@@ -0,0 +1,85 @@
+from __future__ import print_function
+from collections import OrderedDict
+from nsot_sync import retry, serializers
+from nsot_sync.client import get_client
+from nsot_sync.common import RESOURCE_TYPES
+from nsot_sync.drivers.base_driver import BaseDriver
+from nsot_sync.report import Reporter
+
+
+class AggregateDriver(BaseDriver):
+    '''Aggregate driver
+
+    Syncs what agents pushed to ``nsot_sync serve``, rather than collecting
+    anything itself. Each time window's coalesced submissions are given to
+    .apply(), which writes them in bulk like any other driver would, skipping
+    devices that haven't changed.
+
+    Attributes agents need are ensured the first time they're seen, not once
+    per window.
+
+    Options:
+        site_id (int): Site to sync to, if not the one given to nsot_sync
+    '''
+
+    REQUIRED_ATTRS = []
+
+    def __init__(self, site_id=None, *args, **kwargs):
+        super(AggregateDriver, self).__init__(*args, **kwargs)
+        if site_id is not None and site_id != self.site_id:
+            self.site_id = site_id
+            self.client = get_client().sites(site_id)
+            serializers.install(self.client)
+        self.resources = dict((rtype, []) for rtype in RESOURCE_TYPES)
+        self.ensured = set()
+
+        # Windows run for as long as the service does
+        self.deadline = None
+        self.resume = None
+
+    def get_resources(self):
+        '''Returns the window being applied
+
+        Returns:
+            dict: strings mapped to lists
+        '''
+        return self.resources
+
+    def apply(self, resources, required_attrs=()):
+        '''Syncs one window's submissions, then prints its summary
+
+        Whatever was fetched or validated against for the last window is
+        forgotten, since agents and other clients may have changed NSoT
+        since.
+
+        Args:
+            resources (dict): Same format as returned by .get_resources
+            required_attrs (list): Attributes the submitting agents require
+        '''
+        self.resources = resources
+        self.prefetched = dict((rtype, {}) for rtype in RESOURCE_TYPES)
+        self.site_fetched = False
+        self.validator = None
+        self.fingerprints = {}
+        self.offline = False
+        self.report = Reporter(
+            interval=self.click_ctx.obj.get('PROGRESS_INTERVAL', 5),
+            log_objects=self.click_ctx.obj.get('LOG_OBJECTS', False),
+            retry_stats=retry.STATS,
+        )
+
+        required = OrderedDict()
+        for attr in list(self.REQUIRED_ATTRS) + list(required_attrs):
+            key = (attr['resource_name'], attr['name'])
+            if key not in self.ensured:
+                required.setdefault(key, attr)
+        self.REQUIRED_ATTRS = list(required.values())
+
+        if self.click_ctx.obj['NOOP']:
+            self.noop()
+            return
+        self.handle_resources_bulk(self.merge_all())
+        if not self.offline:
+            self.ensured.update(required)
+            self.REQUIRED_ATTRS = []
+        self.report.summary()
@@ -1,13 +1,24 @@
 from __future__ import print_function
-import re
 import json
+import time
 import click
 import logging
 from abc import abstractmethod
-from requests.exceptions import ConnectionError
-from pynsot.client import get_api_client
-from pynsot.vendor.slumber.exceptions import HttpClientError
-from nsot_sync.common import success
+from collections import OrderedDict
+from requests.exceptions import ConnectionError, RequestException
+from pynsot.util import get_result
+from pynsot.vendor.slumber.exceptions import HttpClientError, HttpServerError
+from nsot_sync.common import natural_key, RESOURCE_TYPES
+from nsot_sync.spool import Spool
+from nsot_sync.cache import LookupCache
+from nsot_sync.client import POOL_SIZE, TokenCache, get_client
+from nsot_sync.report import Reporter, Sample
+from nsot_sync.scheduler import resource_graph
+from nsot_sync import (aggregator, attr_rules, deadline, fingerprint, retry,
+                       selection, serializers, staging, validate)
+
+# Errors NSoT answered with, once retries are exhausted for 5xx
+HTTP_ERRORS = (HttpClientError, HttpServerError)
 
 
 class BaseDriver(object):
@@ -65,8 +76,56 @@ class BaseDriver(object):
     Attributes:
         click_ctx (click.Context): Click context
         site_id (int): NSoT site id to perfom operations on
-        client (pynsot.EmailHeaderClient): via pynsot.client.get_api_client()
+        client (pynsot.EmailHeaderClient): Site resource of the client shared
+            by the whole process, via nsot_sync.client.get_client(). None when
+            pushing to an aggregator
+        push_url (str): nsot_sync serve to submit resources to instead of
+            syncing them, or None. See nsot_sync.aggregator
         logger (Logger): logging.getLogger(__name__)
+        spool (nsot_sync.spool.Spool): Journal for writes made while NSoT is
+            unreachable, or None to fail the run instead
+        offline (bool): Set once NSoT is found unreachable during the run
+        cache (nsot_sync.cache.LookupCache): Shared on-host cache of lookups,
+            or None to always ask the server
+        attr_rules (nsot_sync.attr_rules.RuleSet): Attributes added to every
+            resource before it's written, from --attr-rules and the
+            --[resource]-attrs options
+        selection (nsot_sync.selection.Selection): Which resources are
+            synced, from --only and friends. Anything else is dropped by
+            .merge_all(). Partial syncs don't fingerprint devices
+        report (nsot_sync.report.Reporter): Counts what the run did, printing
+            progress and a summary when the command finishes
+        workers (int): How many resources .handle_resources writes at once
+        prefetched (dict): Existing NSoT objects fetched ahead of the writes,
+            keyed by resource type then natural key. A key mapped to None is
+            known not to exist. See .prefetch()
+        site_fetched (bool): Set once the whole site has been listed into
+            .prefetched, after which prefetching needs no more requests
+        fingerprints (dict): Hostname to (hash, owned resources) for each
+            staged device. See nsot_sync.fingerprint
+        PIPELINE (bool): Whether `nsot_sync run` can collect with this
+            driver alongside others. It does so with default options and
+            collect_only, so drivers needing options to collect anything
+            leave this off
+        FINGERPRINT (bool): Whether devices whose synced resources are
+            unchanged since the last run are skipped. Only drivers staging
+            every resource of each device they stage should leave this on
+        SCOPED_FETCH_MAX (int): Runs staging at most this many resources fetch
+            only what their devices need, larger ones fetch the whole site
+        deadline (nsot_sync.deadline.Deadline): Time the run has, or None
+            to take as long as it takes
+        resumed (set): (type, natural key) of resources the last run with a
+            deadline didn't get to, which go first within their priority
+        deferred (set): (type, natural key) of resources this run didn't get
+            to before its deadline
+        validator (nsot_sync.validate.Validator): Checks resources before
+            they're written, made on first use by .make_validator()
+        quarantine_path (str): File resources failing validation are
+            appended to, as JSON lines, or None to only report them
+        staging_path (str): SQLite file to stage resources in rather than
+            memory, or None. See .handle_resources_staged()
+        STAGING_BATCH (int): Resources read back from staging, and existing
+            objects listed from NSoT, per request
         REQUIRED_ATTRS (list): If you're driver sets attributes, you can't
             guarantee the remote end will have these set up. To get around
             this, override the REQUIRED_ATTRS property. This should be a list
@@ -92,25 +151,108 @@ class BaseDriver(object):
             best
 
             Also helps with doing CLI exits like click_ctx.fail(msg)
+        collect_only (bool): Only .get_resources() is going to be called,
+            for another driver to sync. Skips setting up the client, the
+            report, and everything else only syncing needs
     '''
 
     REQUIRED_ATTRS = []
+    FINGERPRINT = True
+    PIPELINE = False
+    SCOPED_FETCH_MAX = 250
+    STAGING_BATCH = 1000
+    DEADLINE_CHUNK = 100
 
-    def __init__(self, click_ctx=None):
+    def __init__(self, click_ctx=None, collect_only=False):
         '''
         '''
 
         if click_ctx is None:
             raise Exception('Please pass click context to driver init')
 
-        c = get_api_client()
-
         self.click_ctx = click_ctx
         self.site_id = click_ctx.obj['SITE_ID']
-        self.client = c.sites(self.site_id)
-        logger = logging.getLogger(__name__)
-        self.logger = logger
+        self.workers = click_ctx.obj.get('WORKERS', 1)
+        self.push_url = click_ctx.obj.get('PUSH')
+        self.client = None
+        self.logger = logging.getLogger(__name__)
+
+        # A device's fingerprint covers everything it owns, so one taken of
+        # part of that would skip the rest next time. See
+        # nsot_sync.selection
+        self.selection = selection.Selection(
+            click_ctx.obj.get('ONLY'),
+            interface_globs=click_ctx.obj.get('ONLY_INTERFACES'),
+            cidrs=click_ctx.obj.get('ONLY_NETWORKS'),
+        )
+        if self.selection:
+            self.FINGERPRINT = False
+
+        # Collecting for another driver, which syncs and reports on what's
+        # collected itself. See nsot_sync.drivers.pipeline
+        self.collect_only = collect_only
+        if collect_only:
+            return
+
+        # One client, over one connection pool, for every driver in the
+        # process. Agents pushing to an aggregator never talk to NSoT
+        if not self.push_url:
+            token_path = click_ctx.obj.get('TOKEN_CACHE')
+            token_cache = token_path and TokenCache(token_path) or None
+            policy = retry.RetryPolicy(
+                retries=click_ctx.obj.get('RETRIES', 3),
+                timeout=click_ctx.obj.get('TIMEOUT', 30),
+            )
+            c = get_client(token_cache=token_cache,
+                           pool_size=max(POOL_SIZE, self.workers),
+                           policy=policy)
+            self.client = c.sites(self.site_id)
+            serializers.install(self.client)
+
+        # Writes that can't reach NSoT are journaled here when configured,
+        # rather than failing the run. See nsot_sync.spool
+        spool_dir = click_ctx.obj.get('SPOOL_DIR')
+        self.spool = spool_dir and Spool(spool_dir) or None
+        self.offline = False
+        self.prefetched = dict((rtype, {}) for rtype in RESOURCE_TYPES)
+        self.site_fetched = False
+        self.fingerprints = {}
+        self.staging_path = click_ctx.obj.get('STAGING')
+        self.validator = None
+        self.quarantine_path = click_ctx.obj.get('QUARANTINE')
 
+        # With a deadline, whatever it cuts off is saved for the next run.
+        # See nsot_sync.deadline
+        seconds = click_ctx.obj.get('DEADLINE')
+        self.deadline = seconds and deadline.Deadline(seconds) or None
+        self.resume = None
+        self.resumed = set()
+        self.deferred = set()
+        if self.deadline:
+            self.resume = deadline.ResumeFile.for_driver(self)
+            self.resumed = self.resume.load()
+
+        # Lookups are read through this when configured, so sibling runs on
+        # the same host share results. See nsot_sync.cache
+        cache_path = click_ctx.obj.get('CACHE')
+        self.cache = None
+        if cache_path:
+            ttl = click_ctx.obj.get('CACHE_TTL', 300)
+            self.cache = LookupCache(cache_path, ttl=ttl)
+
+        # Outcomes are counted rather than printed one by one. See
+        # nsot_sync.report
+        self.report = Reporter(
+            interval=click_ctx.obj.get('PROGRESS_INTERVAL', 5),
+            log_objects=click_ctx.obj.get('LOG_OBJECTS', False),
+            retry_stats=retry.STATS,
+        )
+        click_ctx.call_on_close(self.report.summary)
+
+        # Compiled once, then applied in a single pass. See
+        # nsot_sync.attr_rules
+        self.attr_rules = attr_rules.RuleSet(click_ctx.obj.get('ATTR_RULES'),
+                                             click_ctx.obj['EXTRA_ATTRS'])
         self.require_extra_attrs()
 
     @abstractmethod
@@ -118,24 +260,21 @@ class BaseDriver(object):
         pass
 
     def require_extra_attrs(self):
-        '''Appends EXTRA_ATTRS to REQUIRED_ATTRS so they're ensured
+        '''Adds every attribute .attr_rules can set to REQUIRED_ATTRS
+
+        Sets REQUIRED_ATTRS on the instance, leaving the class's alone.
 
         Note:
-            These come from the CLI args --[resource]-attrs
-        '''
-        extra = self.click_ctx.obj['EXTRA_ATTRS']
-        for rtype, resources in extra.iteritems():
-            rname = re.match('(?P<resource>\S+)_attrs', rtype).groups()[0]
-            for name in resources.keys():
-                resource = {
-                    'name': name,
-                    'resource_name': rname.title(),
-                    'required': False,
-                }
-                self.REQUIRED_ATTRS.append(resource)
+            These come from --attr-rules and the CLI args --[resource]-attrs
+        '''
+        required = OrderedDict(((a['resource_name'], a['name']), a)
+                               for a in self.REQUIRED_ATTRS)
+        for attr in self.attr_rules.required_attrs():
+            required.setdefault((attr['resource_name'], attr['name']), attr)
+        self.REQUIRED_ATTRS = list(required.values())
 
     def add_extra_attrs(self, resources):
-        '''Updates resources with relevant extra attrs given at the CLI
+        '''Updates resources with attributes from .attr_rules, in place
 
         Note:
             This happens right before resources are either created or No-Op'd
@@ -143,96 +282,618 @@ class BaseDriver(object):
         Args:
             resources (dict): Resources as returned by self.get_resources
         '''
-        extra = self.click_ctx.obj['EXTRA_ATTRS']
-        r = resources
-        self.logger.debug('Extra: %s', extra)
-
-        for rtype, attrs in extra.iteritems():
-            rname_pl = '%ss' % re.match('(\S+)_attrs', rtype).groups()[0]
-            [x['attributes'].update(attrs) for x in r[rname_pl]]
-
-        return r
+        return self.attr_rules.apply(resources)
 
     def noop(self):
-        '''Outputs JSON to STDOUT of the resources that would be created'''
-        click.echo(json.dumps(self.merge_all()))
+        '''Outputs JSON to STDOUT of the resources that would be created
+
+        Streamed as it's encoded, in the format given by --output-format
+        '''
+        fmt = self.click_ctx.obj.get('OUTPUT_FORMAT', 'json')
+        stdout = click.get_text_stream('stdout')
+        serializers.stream(self.merge_all(), stdout, fmt)
 
     def merge_all(self):
         '''Merge all resources, adding extra attrs, for what will be created
 
+        Resources left out by .selection are dropped first.
+
         This is useful for representing what exactly will be created and lets
         .noop() be less redundant
 
         Returns:
             dict: Same format as would be expected from .get_resources
         '''
-        from_driver = self.get_resources()
+        from_driver = self.selection.apply(self.get_resources())
         extra_attrs_added = self.add_extra_attrs(from_driver)
         return extra_attrs_added
 
     def handle_resources(self):
-        '''Takes output of .get_resources to create/update as needed'''
+        '''Takes output of .get_resources to create/update as needed
+
+        Resources NSoT would reject are dropped by .validate() first. Each
+        other is written once what it references has been: its device and
+        address networks for an interface, its parent for a network. Up to
+        .workers are written at a time. See nsot_sync.scheduler
+
+        With a deadline, ready resources are written most important first
+        and none are started once it's nearly up. See nsot_sync.deadline
+
+        With --push, hands off to .push_resources() instead, and with
+        --staging, to .handle_resources_staged().
+        '''
+        if self.push_url:
+            return self.push_resources()
+        if self.staging_path:
+            return self.handle_resources_staged()
         resources = self.merge_all()
-        self.logger.debug('All staged resources: %s', resources)
+        self.report.expect(resources)
         self.ensure_attrs()
+        resources = self.skip_unchanged(resources)
+        self.prefetch(resources)
+        resources = self.validate(resources)
 
-        # Create resources, interfaces last so networks and device exist to
-        # attach to
-        [self.handle_device(device) for device in resources['devices']]
-        [self.handle_network(network) for network in resources['networks']]
-        [self.handle_interface(interface)
-         for interface in resources['interfaces']]
+        handlers = {
+            'devices': self.handle_device,
+            'networks': self.handle_network,
+            'interfaces': self.handle_interface,
+        }
+        staged = {}
+        for rtype in RESOURCE_TYPES:
+            for resource in resources.get(rtype, []):
+                staged[(rtype, natural_key(rtype, resource))] = resource
 
-    def handle_network(self, network):
-        '''Take a single network and create/update in NSoT'''
+        priorities = self.deadline and self.prioritize(resources) or None
+        graph = resource_graph(resources, priorities)
+        unrun = graph.run(lambda node: handlers[node[0]](staged[node]),
+                          workers=self.workers,
+                          stop=self.deadline and self.deadline.expired)
+        for rtype in RESOURCE_TYPES:
+            self.defer(rtype, [key for t, key in unrun if t == rtype])
+        self.save_fingerprints()
+        self.save_resume()
 
-        c = self.client
-        cidr = '%s/%d' % (network['network_address'], network['prefix_length'])
-        network.update({'site_id': self.site_id})
-        self.logger.debug('Network: %s', network)
-        already_exists = False
+    def handle_resources_bulk(self, resources):
+        '''Like .handle_resources, but writes each resource type in bulk
+
+        Existing resources are still looked up one at a time, but creates and
+        updates go out as a single POST and PATCH per resource type.
+
+        With a deadline, each type is written most important first, in
+        chunks of DEADLINE_CHUNK so it can stop between them.
+
+        Args:
+            resources (dict): Same format as returned by .get_resources
+        '''
+        self.report.expect(resources)
+        self.ensure_attrs()
+        resources = self.skip_unchanged(resources)
+        self.prefetch(resources)
+        resources = self.validate(resources)
+        if self.deadline is None:
+            for rtype in RESOURCE_TYPES:
+                self.bulk_upsert(rtype, resources.get(rtype, []))
+            self.save_fingerprints()
+            return
+
+        priorities = self.prioritize(resources)
+        for rtype in RESOURCE_TYPES:
+            staged = [(natural_key(rtype, r), r)
+                      for r in resources.get(rtype, [])]
+            staged.sort(key=lambda item: priorities[(rtype, item[0])])
+            for i in range(0, len(staged), self.DEADLINE_CHUNK):
+                if self.deadline.expired():
+                    self.defer(rtype, [key for key, _ in staged[i:]])
+                    break
+                chunk = staged[i:i + self.DEADLINE_CHUNK]
+                self.bulk_upsert(rtype, [r for _, r in chunk])
+        self.save_fingerprints()
+        self.save_resume()
+
+    def push_resources(self):
+        '''Submits merged resources to nsot_sync serve rather than NSoT
+
+        The aggregator ensures REQUIRED_ATTRS, so they're sent along.
+        '''
+        resources = self.merge_all()
         try:
-            # Test if existing network to determine whether to PATCH or POST
-            # Remove attributes since these may not match exactly and the point
-            # is to be updating them
-            lookup = network.copy()
-            lookup.pop('attributes', None)
-            self.logger.debug('Lookup kwargs: %s', lookup)
-            existing = c.networks.get(**lookup)
-            self.logger.debug('Existing networks: %s', existing)
-            if existing:
-                already_exists = True
+            result = aggregator.push(
+                self.push_url, resources, self.site_id,
+                required_attrs=self.REQUIRED_ATTRS,
+                secret=self.click_ctx.obj.get('PUSH_SECRET'),
+            )
+        except RequestException as e:
+            self.click_ctx.fail('Cannot push to %s: %s' % (self.push_url, e))
+        self.logger.info('Pushed %d resources to %s', result['queued'],
+                         self.push_url)
+
+    def stage(self, store):
+        '''Writes this driver's resources into a staging.StagingStore
+
+        Stages the output of .get_resources, as narrowed by .selection.
+        Drivers that can produce resources one at a time should override
+        this to stream them in instead, so they're never all in memory.
+        '''
+        store.add_resources(self.selection.apply(self.get_resources()))
+
+    def handle_resources_staged(self):
+        '''Syncs through an on-disk staging.StagingStore, for huge runs
+
+        Resources are staged by .stage(), deduplicated by natural key and
+        given .attr_rules attributes as they go in. The whole site is listed
+        into the store a page at a time, so creates, updates, and unchanged
+        resources are told apart by joining on natural key. Each type is then
+        read back and written STAGING_BATCH at a time, in bulk.
+
+        Memory holds a batch, plus the site's devices for resolving
+        interfaces, however many resources there are.
+
+        A deadline is checked between batches. What it cuts off isn't saved,
+        but is found still to do by the next run's diff.
+        '''
+        store = staging.StagingStore(self.staging_path)
+        store.enrich = self.attr_rules.apply_one
+        try:
+            self.stage(store)
+            self.report.expect_counts(store.counts())
+
+            self.ensure_attrs()
+            self.validator = self.make_validator(networks=[])
+            self.fetch_existing(store)
+            for rtype in RESOURCE_TYPES:
+                for batch in store.batches(rtype, self.STAGING_BATCH):
+                    if self.deadline and self.deadline.expired():
+                        return
+                    self.write_staged(rtype, batch)
+                    if rtype != 'devices':
+                        # The store knows these, no need to hold them too
+                        self.prefetched[rtype].clear()
+        finally:
+            store.close()
+
+    def fetch_existing(self, store):
+        '''Lists the site's devices, networks, and interfaces into store
+
+        Pages through each type STAGING_BATCH at a time. Devices are also
+        kept in .prefetched to resolve staged interfaces' hostnames, and
+        networks indexed by .validator to check addresses against.
+        '''
+        if self.offline:
+            return
+        hostnames = {}
+        try:
+            for rtype in self.fetched_types():
+                for page in self.list_pages(rtype):
+                    if rtype == 'devices':
+                        self.remember('devices', page)
+                        hostnames.update((d['id'], d['hostname'])
+                                         for d in page)
+                    if rtype == 'networks' and self.validator:
+                        self.validator.add_networks(
+                            natural_key(rtype, n) for n in page)
+                    items = []
+                    for obj in page:
+                        if rtype == 'interfaces':
+                            device = hostnames.get(obj['device'],
+                                                   obj['device'])
+                            key = natural_key(rtype, dict(obj, device=device))
+                        else:
+                            key = natural_key(rtype, obj)
+                        items.append((key, obj))
+                    store.add_existing(rtype, items)
         except ConnectionError:
-            self.click_ctx.fail('Cannot connect to NSoT server')
-        except HttpClientError as e:
-            self.handle_pynsot_err(e)
-        except Exception as e:
-            self.logger.exception('handle_network, checking for existing net')
+            self.go_offline()
+        except HTTP_ERRORS as e:
+            self.handle_pynsot_err(e, 'listing existing resources')
 
-        if already_exists:
-            # Set the proper ID to PATCH
-            network['id'] = existing[0]['id']
+    def fetched_types(self):  # -> list
+        '''Resource types listed when the whole site is fetched
+
+        Those being synced, plus devices to key interfaces by hostname and
+        networks to validate interface addresses against.
+        '''
+        wanted = set(self.selection.types)
+        if 'interfaces' in wanted:
+            wanted.update(['devices', 'networks'])
+        return [rtype for rtype in RESOURCE_TYPES if rtype in wanted]
+
+    def list_pages(self, rtype):
+        '''Yields every object of a type in the site, a page at a time'''
+        c = getattr(self.client, rtype)
+        offset = 0
+        while True:
+            page = get_result(c.get(limit=self.STAGING_BATCH, offset=offset))
+            if page:
+                yield page
+            if len(page) < self.STAGING_BATCH:
+                return
+            offset += len(page)
+
+    def write_staged(self, rtype, batch):
+        '''Writes a batch from staging.StagingStore.batches in bulk
+
+        Resources NSoT already has identically are counted as unchanged and
+        not sent, and those it would reject are dropped like .validate()
+        does.
+        '''
+        creates = []
+        updates = []
+        unchanged = []
+        invalid = []
+        for key, resource, existing in batch:
+            reason = self.validator and self.validator.check(rtype, resource,
+                                                             key)
+            if reason:
+                invalid.append((rtype, key, reason, resource))
+                continue
+            resource['site_id'] = self.site_id
+            if rtype == 'interfaces' and not self.offline:
+                try:
+                    self.resolve_device(resource)
+                except ConnectionError:
+                    self.connection_lost('create', rtype, resource, key)
+                    continue
+            if existing is None:
+                creates.append((key, resource))
+            elif staging.same(resource, existing):
+                unchanged.append(key)
+            else:
+                resource['id'] = existing['id']
+                updates.append((key, resource))
+
+        if self.validator:
+            # Staging already dropped duplicates, no need to remember keys
+            self.validator.interfaces.clear()
+        self.quarantine(invalid)
+        if unchanged:
+            self.report.record(rtype, 'unchanged', unchanged)
+        self.write(rtype, 'create', creates)
+        self.write(rtype, 'update', updates)
+
+    def validate(self, resources):  # -> dict
+        '''Drops resources NSoT would reject, before any are written
+
+        Checked by .validator, which is remade once the whole site has been
+        listed to check against. Those dropped are passed to .quarantine().
+
+        Args:
+            resources (dict): Same format as returned by .get_resources
+
+        Returns:
+            dict: resources, minus the invalid ones
+        '''
+        if self.validator is None or (self.site_fetched and
+                                      self.validator.index is None):
+            self.validator = self.make_validator()
+        resources, invalid = self.validator.validate(resources)
+        self.quarantine(invalid)
+        return resources
+
+    def make_validator(self, networks=None):  # -> validate.Validator
+        '''Validator for this run's resources
+
+        Runs that list the whole site, with --staging or more than
+        SCOPED_FETCH_MAX resources, also list the site's attributes, so
+        those unknown to it are caught, and check addresses against its
+        networks. Smaller runs only check what they can without asking.
+
+        Args:
+            networks (list): CIDRs of the site's networks, if not prefetched
+        '''
+        attributes = list(self.REQUIRED_ATTRS)
+        known = False
+        if (self.site_fetched or self.staging_path) and not self.offline:
             try:
-                self.logger.info('Patching: %s', network)
-                c.networks.patch([network])
-                success('%s updated!' % cidr)
+                attributes.extend(get_result(self.client.attributes.get()))
+                known = True
             except ConnectionError:
-                self.click_ctx.fail('Cannot connect to NSoT server')
-            except HttpClientError as e:
-                self.handle_pynsot_err(e, cidr)
-            except Exception as e:
-                self.logger.exception('handle_network, patching network')
+                self.go_offline()
+            except HTTP_ERRORS as e:
+                self.handle_pynsot_err(e, 'listing attributes')
+        if networks is None and self.site_fetched:
+            networks = [key for key, obj in self.prefetched['networks'].items()
+                        if obj is not None]
+        return validate.Validator(attributes, known_attrs=known,
+                                  networks=networks)
+
+    def quarantine(self, invalid):
+        '''Reports resources that failed validation, and sets them aside
+
+        One warning per resource type and reason, however many failed it.
+        With --quarantine, they're also appended there as JSON lines to be
+        fixed and resynced.
+
+        Args:
+            invalid (list): (type, natural key, reason, resource) tuples
+        '''
+        if not invalid:
+            return
+        failed = OrderedDict()
+        for rtype, key, reason, _ in invalid:
+            failed.setdefault((rtype, reason), []).append(key)
+        for (rtype, reason), keys in failed.items():
+            self.logger.warning('Skipping %d invalid %s, %s: %s', len(keys),
+                                rtype, reason, Sample(keys))
+            self.report.record(rtype, 'invalid', keys)
+        if not self.quarantine_path:
+            return
+        now = time.time()
+        lines = ''.join('%s\n' % serializers.dumps({
+            'ts': now,
+            'site_id': self.site_id,
+            'resource_type': rtype,
+            'key': key,
+            'reason': reason,
+            'resource': resource,
+        }) for rtype, key, reason, resource in invalid)
+        with open(self.quarantine_path, 'a') as f:
+            f.write(lines)
+
+    def prioritize(self, resources):  # -> dict
+        '''Priority of each staged resource, keyed by (type, natural key)
+
+        Compared against whatever .prefetch() found. See
+        nsot_sync.deadline.priority
+        '''
+        priorities = {}
+        for rtype in RESOURCE_TYPES:
+            for resource in resources.get(rtype, []):
+                node = (rtype, natural_key(rtype, resource))
+                existing = self.prefetched[rtype].get(node[1])
+                priorities[node] = deadline.priority(
+                    rtype, resource, existing, node in self.resumed)
+        return priorities
+
+    def defer(self, rtype, keys):
+        '''Leave resources the deadline cut off for the next run'''
+        self.deferred.update((rtype, key) for key in keys)
+        self.report.record(rtype, 'deferred', keys)
+
+    def save_resume(self):
+        '''Saves what was deferred, clearing what the last run left'''
+        if self.resume is not None:
+            self.resume.save(self.deferred)
+
+    def skip_unchanged(self, resources):
+        '''Drop devices, and what they own, that haven't changed since last run
+
+        Each staged device is fetched and its stored fingerprint compared to
+        one of what's staged now. Matching devices have their interfaces and
+        address networks dropped along with them, so they cost no further
+        requests. Networks also owned by a changed device are kept.
+
+        Args:
+            resources (dict): Same format as returned by .get_resources
+
+        Returns:
+            dict: resources, minus those of unchanged devices
+        '''
+        if not self.FINGERPRINT or self.offline:
+            return resources
+        self.fingerprints = fingerprint.fingerprints(resources)
+        if not self.fingerprints:
+            return resources
+        try:
+            self.prefetch_devices(sorted(self.fingerprints))
+        except ConnectionError:
+            self.go_offline()
+            return resources
+        except HTTP_ERRORS as e:
+            self.handle_pynsot_err(e, 'fetching devices')
+            return resources
+
+        skipped = set()
+        kept = set()
+        for hostname, (digest, owned) in self.fingerprints.items():
+            device = self.prefetched['devices'].get(hostname) or {}
+            stored = device.get('attributes', {}).get(fingerprint.ATTR_NAME)
+            if stored == digest:
+                skipped.update(owned)
+            else:
+                kept.update(owned)
+        skipped -= kept
+        if not skipped:
+            return resources
+
+        result = {}
+        for rtype in RESOURCE_TYPES:
+            result[rtype] = []
+            unchanged = []
+            for resource in resources.get(rtype, []):
+                key = natural_key(rtype, resource)
+                if (rtype, key) in skipped:
+                    unchanged.append(key)
+                else:
+                    result[rtype].append(resource)
+            self.report.record(rtype, 'unchanged', unchanged)
+        return result
+
+    def prefetch_devices(self, hostnames):
+        '''Fetch staged devices into .prefetched, marking missing ones'''
+        c = self.client
+        if len(hostnames) <= self.SCOPED_FETCH_MAX:
+            for hostname in hostnames:
+                self.remember('devices',
+                              get_result(c.devices.get(hostname=hostname)))
         else:
-            try:
-                self.logger.info('Posting: %s', network)
-                c.networks.post(network)
-                success('%s created!' % cidr)
-            except ConnectionError:
-                self.click_ctx.fail('Cannot connect to NSoT server')
-            except HttpClientError as e:
-                self.handle_pynsot_err(e, cidr)
-            except Exception as e:
-                self.logger.exception('handle_network, posting network')
+            self.remember('devices', get_result(c.devices.get()))
+        for hostname in hostnames:
+            self.prefetched['devices'].setdefault(hostname, None)
+
+    def save_fingerprints(self):
+        '''Store each written device's fingerprint on it, in one PATCH
+
+        Devices with anything that failed or was spooled are left without
+        one, so the next run compares all of their resources again.
+        '''
+        if self.offline:
+            return
+        items = []
+        for hostname, (digest, owned) in sorted(self.fingerprints.items()):
+            device = self.known('devices', hostname)
+            if not device or owned & self.report.unfinished:
+                continue
+            attrs = device.get('attributes') or {}
+            if attrs.get(fingerprint.ATTR_NAME) == digest:
+                continue
+            attrs = dict(attrs)
+            attrs[fingerprint.ATTR_NAME] = digest
+            items.append((hostname, {'id': device['id'],
+                                     'hostname': hostname,
+                                     'attributes': attrs}))
+        if not items:
+            return
+        try:
+            result = self.client.devices.patch([d for _, d in items])
+        except ConnectionError:
+            # Nothing lost, the next run just compares everything again
+            self.logger.warning('Cannot connect to NSoT server, fingerprints '
+                                'not saved')
+        except HTTP_ERRORS as e:
+            self.handle_pynsot_err(e, 'saving fingerprints')
+        else:
+            result = get_result(result)
+            if isinstance(result, list) and len(result) == len(items):
+                self.cache_objs('devices', zip([h for h, _ in items], result))
+
+    def prefetch(self, resources):
+        '''Fetch existing NSoT objects for the staged resources up front
+
+        Small runs, like a single host syncing itself, use .prefetch_scoped()
+        which asks only about the staged devices. Runs staging more than
+        SCOPED_FETCH_MAX resources list the whole site with
+        .prefetch_site() instead, which costs three requests total however
+        large the run is. Either way, lookups during the writes are answered
+        from .prefetched rather than one GET per resource.
+
+        Args:
+            resources (dict): Same format as returned by .get_resources
+        '''
+        if self.offline:
+            return
+        if self.site_fetched:
+            # Everything is already known, eg from an earlier batch
+            self.mark_missing(resources)
+            return
+        staged = sum(len(resources.get(rtype, [])) for rtype in RESOURCE_TYPES)
+        if not staged:
+            return
+        try:
+            if staged <= self.SCOPED_FETCH_MAX:
+                self.logger.debug('Scoped fetch for %d resources', staged)
+                self.prefetch_scoped(resources)
+            else:
+                self.logger.debug('Site fetch for %d resources', staged)
+                self.prefetch_site(resources)
+        except ConnectionError:
+            self.go_offline()
+        except HTTP_ERRORS as e:
+            self.handle_pynsot_err(e, 'prefetch')
+        except Exception as e:
+            self.logger.exception('prefetch, fetching existing resources')
+
+    def prefetch_scoped(self, resources):
+        '''Fetch only what the staged devices need
+
+        Per staged device, that is the device by hostname and all of its
+        interfaces in one list. The interfaces name the networks their
+        addresses live in, so when there are fewer of those than staged
+        addresses, each one's children are listed to find the addresses.
+        Addresses not found that way are left for a normal lookup.
+        '''
+        c = self.client
+        hostnames = set(d['hostname'] for d in resources.get('devices', []))
+        hostnames.update(i['device'] for i in resources.get('interfaces', [])
+                         if not isinstance(i['device'], int))
+        hostnames = sorted(hostnames)
+
+        parents = set()
+        for hostname in hostnames:
+            if hostname in self.prefetched['devices']:
+                # Already fetched to compare fingerprints
+                device = self.prefetched['devices'][hostname]
+                found = device and [device] or []
+            else:
+                found = get_result(c.devices.get(hostname=hostname))
+                self.remember('devices', found)
+                self.prefetched['devices'].setdefault(hostname, None)
+            if not found:
+                continue
+            intfs = get_result(c.interfaces.get(device__hostname=hostname))
+            self.remember('interfaces', intfs, hostnames={found[0]['id']:
+                                                          hostname})
+            for intf in intfs:
+                parents.update(intf.get('networks', []))
+
+        for intf in resources.get('interfaces', []):
+            if intf['device'] in self.prefetched['devices']:
+                # The device's interfaces were listed, so this one is missing
+                key = natural_key('interfaces', intf)
+                self.prefetched['interfaces'].setdefault(key, None)
+
+        # Two requests per parent network only pays off when there are fewer
+        # parents than addresses, otherwise looking each address up is cheaper
+        if 2 * len(parents) >= len(resources.get('networks', [])):
+            return
+        for cidr in sorted(parents):
+            parent = get_result(c.networks.get(cidr=cidr))
+            if parent:
+                children = c.networks(parent[0]['id']).children.get()
+                self.remember('networks', get_result(children))
+
+    def prefetch_site(self, resources):
+        '''List every device, network, and interface in the site
+
+        Only of the types in .fetched_types(), one request each.
+        '''
+        c = self.client
+        types = self.fetched_types()
+        hostnames = {}
+        if 'devices' in types:
+            devices = get_result(c.devices.get())
+            self.remember('devices', devices)
+            hostnames = dict((d['id'], d['hostname']) for d in devices)
+        if 'networks' in types:
+            self.remember('networks', get_result(c.networks.get()))
+        if 'interfaces' in types:
+            self.remember('interfaces', get_result(c.interfaces.get()),
+                          hostnames=hostnames)
+        self.site_fetched = True
+        self.mark_missing(resources)
+
+    def mark_missing(self, resources):
+        '''After a site fetch, record staged resources it didn't find'''
+        for rtype in RESOURCE_TYPES:
+            for resource in resources.get(rtype, []):
+                key = natural_key(rtype, resource)
+                self.prefetched[rtype].setdefault(key, None)
+
+    def remember(self, rtype, objs, hostnames=None):
+        '''Index fetched NSoT objects into .prefetched and the cache
+
+        Args:
+            rtype (str): Resource type, eg 'networks'
+            objs (list): Objects as returned by NSoT
+            hostnames (dict): Device ID to hostname, so interfaces are keyed
+                by hostname like staged interfaces are
+        '''
+        items = []
+        for obj in objs:
+            if rtype == 'interfaces':
+                device = (hostnames or {}).get(obj['device'], obj['device'])
+                key = natural_key(rtype, dict(obj, device=device))
+            else:
+                key = natural_key(rtype, obj)
+            self.prefetched[rtype][key] = obj
+            items.append((key, obj))
+        if self.cache and items:
+            self.cache.set_many(self.site_id, rtype, items)
+
+    def handle_network(self, network):
+        '''Take a single network and create/update in NSoT'''
+        cidr = natural_key('networks', network)
+        network.update({'site_id': self.site_id})
+        self.upsert('networks', network, cidr)
 
     def handle_interface(self, interface):
         '''Take a single interface and create/update in NSoT
@@ -243,127 +904,326 @@ class BaseDriver(object):
             natural key references within a resource, we should detect and
             fetch this
         '''
-        c = self.client
-        name = interface['name']
-        device = interface['device']
+        key = natural_key('interfaces', interface)
         interface.update({'site_id': self.site_id})
-        self.logger.debug('Interface: %s', interface)
+        if self.offline:
+            return self.connection_lost('create', 'interfaces', interface, key)
+        try:
+            self.resolve_device(interface)
+        except ConnectionError:
+            return self.connection_lost('create', 'interfaces', interface, key)
+        self.upsert('interfaces', interface, key)
+
+    def handle_device(self, device):
+        '''Take a single device and create/update in NSoT'''
+        device.update({'site_id': self.site_id})
+        self.upsert('devices', device, device['hostname'])
+
+    def handle_delete(self, rtype, resource):
+        '''Delete a single resource, found by its natural key, from NSoT'''
+        key = natural_key(rtype, resource)
+        resource.update({'site_id': self.site_id})
+        if self.offline:
+            return self.connection_lost('delete', rtype, resource, key)
         try:
-            result = c.devices.get(hostname=interface['device'])
+            if rtype == 'interfaces':
+                self.resolve_device(resource)
+            existing = self.lookup_existing(rtype, resource, key)
+            if not existing:
+                self.logger.debug('%s already gone, not deleting', key)
+                return
+            getattr(self.client, rtype)(existing['id']).delete()
+            self.uncache(rtype, key)
+            self.report.record(rtype, 'deleted', [key])
+        except ConnectionError:
+            self.connection_lost('delete', rtype, resource, key)
+        except HTTP_ERRORS as e:
+            self.report.record(rtype, 'failed', [key])
+            self.handle_pynsot_err(e, key)
+        except Exception as e:
+            self.report.record(rtype, 'failed', [key])
+            self.logger.exception('handle_delete, deleting %s', key)
+
+    def resolve_device(self, interface):
+        '''Swap a hostname in interface['device'] for the device ID
+
+        Raises:
+            ConnectionError: Left for the caller to spool or fail on
+        '''
+        hostname = interface['device']
+        known = self.known('devices', str(hostname))
+        if known:
+            interface['device'] = known['id']
+            return
+        try:
+            result = self.client.devices.get(hostname=hostname)
             if not result or 'count' in result and result['count'] == 0:
                 raise ValueError
             else:
                 interface['device'] = result[0]['id']
+                self.remember('devices', result[:1])
         except ValueError:
             interface['device'] = int(interface['device'])
-        except Exception as e:
-            self.logger.exception('handle_interface, setting device ID')
+        except ConnectionError:
+            raise
+        except Exception:
+            self.logger.exception('resolve_device, setting device ID')
+
+    def known(self, rtype, key):
+        '''Returns an already fetched or cached object, without a request'''
+        obj = self.prefetched.get(rtype, {}).get(key)
+        if obj is None and self.cache:
+            obj = self.cache.get(self.site_id, rtype, key)
+        return obj
+
+    def lookup_existing(self, rtype, resource, key=None):
+        '''Returns the NSoT object matching resource, or None
+
+        Attributes are removed from the lookup since they may not match
+        exactly and the point is to be updating them. Prefetched objects and
+        the lookup cache are checked before asking the server.
+
+        Args:
+            rtype (str): Resource type, eg 'networks'
+            resource (dict): Staged resource to look for
+            key (str): Natural key of resource, if it differs from what
+                common.natural_key would give now (eg interfaces whose device
+                has been resolved to an ID)
 
-        already_exists = False
+        Raises:
+            ConnectionError: Left for the caller to spool or fail on
+            HttpServerError: If NSoT failed to answer, left for the caller
+                to count as failed rather than create a duplicate
+        '''
+        if key is None:
+            key = natural_key(rtype, resource)
+        if key in self.prefetched.get(rtype, {}):
+            # Fetched up front, including knowing it doesn't exist
+            return self.known(rtype, key)
+        known = self.known(rtype, key)
+        if known:
+            return known
+
+        lookup = resource.copy()
+        lookup.pop('attributes', None)
+        lookup.pop('id', None)
+        self.report.trace('Lookup kwargs: %s', lookup)
         try:
-            # Test if existing interface to determine whether to PATCH or POST
-            # Remove attributes since these may not match exactly and the point
-            # is to be updating them
-            lookup = interface.copy()
-            lookup.pop('attributes', None)
-            self.logger.debug('Lookup kwargs: %s', lookup)
-            existing = c.interfaces.get(**lookup)
-            self.logger.debug('Existing interface: %s', existing)
-            if existing:
-                already_exists = True
+            existing = getattr(self.client, rtype).get(**lookup)
         except ConnectionError:
-            self.click_ctx.fail('Cannot connect to NSoT server')
+            raise
         except HttpClientError as e:
             self.handle_pynsot_err(e)
+            return None
+        except HttpServerError:
+            # Not knowing isn't the same as it not existing
+            raise
         except Exception as e:
-            self.logger.exception('handle_interface, checking for existing')
+            self.logger.exception('lookup_existing, checking for %s', rtype)
+            return None
 
-        if already_exists:
+        existing = get_result(existing)
+        self.report.trace('Existing %s: %s', rtype, existing)
+        if existing:
+            self.cache_objs(rtype, [(key, existing[0])])
+            return existing[0]
+        return None
+
+    def cache_objs(self, rtype, items):
+        '''Write NSoT objects through to .prefetched and the lookup cache
+
+        Args:
+            rtype (str): Resource type, eg 'networks'
+            items (list): (natural_key, obj) tuples, obj as returned by NSoT
+        '''
+        items = [(key, obj) for key, obj in items
+                 if isinstance(obj, dict) and 'id' in obj]
+        for key, obj in items:
+            self.prefetched[rtype][key] = obj
+        if self.cache and items:
+            self.cache.set_many(self.site_id, rtype, items)
+
+    def uncache(self, rtype, key):
+        '''Forget a resource, eg after the server disagreed about it'''
+        self.prefetched.get(rtype, {}).pop(key, None)
+        if self.cache:
+            self.cache.invalidate(self.site_id, rtype, key)
+
+    def upsert(self, rtype, resource, key):
+        '''PATCH resource if it already exists in NSoT, otherwise POST it
+
+        Args:
+            rtype (str): Resource type, eg 'networks'
+            resource (dict): Resource to send, with site_id set
+            key (str): Natural key, used for messages and spooling
+        '''
+        if self.offline:
+            return self.connection_lost('create', rtype, resource, key)
+        try:
+            existing = self.lookup_existing(rtype, resource, key)
+        except ConnectionError:
+            return self.connection_lost('create', rtype, resource, key)
+        except HttpServerError as e:
+            self.report.record(rtype, 'failed', [key])
+            return self.handle_pynsot_err(e, key)
+
+        if existing:
             # Set the proper ID to PATCH
-            interface['id'] = existing[0]['id']
-            try:
-                self.logger.info('Patching: %s', interface)
-                c.interfaces.patch([interface])
-                success('%s:%s updated!' % (device, name))
-            except ConnectionError:
-                self.click_ctx.fail('Cannot connect to NSoT server')
-            except HttpClientError as e:
-                self.handle_pynsot_err(e, name)
-            except Exception as e:
-                self.logger.exception('handle_interface, patching interface')
+            resource['id'] = existing['id']
+            self.write(rtype, 'update', [(key, resource)])
         else:
+            self.write(rtype, 'create', [(key, resource)])
+
+    def bulk_upsert(self, rtype, resources):
+        '''Sort resources into creates and updates, writing each in bulk'''
+        creates = []
+        updates = []
+        for resource in resources:
+            key = natural_key(rtype, resource)
+            resource.update({'site_id': self.site_id})
+            if self.offline:
+                self.connection_lost('create', rtype, resource, key)
+                continue
             try:
-                self.logger.info('Posting: %s', interface)
-                c.interfaces.post(interface)
-                success('%s:%s created!' % (device, name))
+                if rtype == 'interfaces':
+                    self.resolve_device(resource)
+                existing = self.lookup_existing(rtype, resource, key)
             except ConnectionError:
-                self.click_ctx.fail('Cannot connect to NSoT server')
-            except HttpClientError as e:
-                self.handle_pynsot_err(e, name)
-            except Exception as e:
-                self.logger.exception('handle_interface, posting interface')
+                self.connection_lost('create', rtype, resource, key)
+                continue
+            except HttpServerError as e:
+                self.report.record(rtype, 'failed', [key])
+                self.handle_pynsot_err(e, key)
+                continue
 
-    def handle_device(self, device):
-        '''Take a single device and create/update in NSoT'''
+            if existing:
+                resource['id'] = existing['id']
+                updates.append((key, resource))
+            else:
+                creates.append((key, resource))
 
-        c = self.client
-        device.update({'site_id': self.site_id})
-        self.logger.debug('Device', device)
-        already_exists = False
+        self.write(rtype, 'create', creates)
+        self.write(rtype, 'update', updates)
+
+    def write(self, rtype, op, items):
+        '''POST or PATCH resources of a single type in one request
+
+        If a multi-resource request is rejected, each resource is retried on
+        its own so one bad resource doesn't sink the rest.
+
+        Args:
+            rtype (str): Resource type, eg 'networks'
+            op (str): 'create' to POST, 'update' to PATCH
+            items (list): (natural_key, resource) tuples
+        '''
+        if not items:
+            return
+        if self.offline:
+            for key, resource in items:
+                self.connection_lost(op, rtype, resource, key)
+            return
+
+        c = getattr(self.client, rtype)
+        keys = [key for key, _ in items]
+        resources = [resource for _, resource in items]
+        outcome = op == 'create' and 'created' or 'updated'
+        if len(items) == 1:
+            desc = items[0][0]
+        else:
+            desc = '%d %s' % (len(items), rtype)
         try:
-            lookup = device.copy()
-            lookup.pop('attributes', None)
-            self.logger.debug('Lookup kwargs: %s', lookup)
-            existing = c.devices.get(**lookup)
-            self.logger.debug('Existing devices: %s', existing)
-            if existing:
-                already_exists = True
+            if op == 'create':
+                self.report.trace('Posting: %s', resources)
+                result = c.post(len(items) == 1 and resources[0] or resources)
+            else:
+                self.report.trace('Patching: %s', resources)
+                result = c.patch(resources)
+            self.report.record(rtype, outcome, keys)
         except ConnectionError:
-            self.click_ctx.fail('Cannot connect to NSoT server')
+            for key, resource in items:
+                self.connection_lost(op, rtype, resource, key)
         except HttpClientError as e:
-            self.handle_pynsot_err(e)
+            if len(items) == 1:
+                # A stale cache entry may be why we POSTed or PATCHed wrongly
+                self.uncache(rtype, items[0][0])
+                self.report.record(rtype, 'failed', keys)
+                self.handle_pynsot_err(e, desc)
+                return
+            self.logger.warning('Bulk %s of %s rejected, retrying singly',
+                                op, desc)
+            for item in items:
+                self.write(rtype, op, [item])
+        except HttpServerError as e:
+            # Retrying singly would only pile onto a struggling server
+            self.report.record(rtype, 'failed', keys)
+            self.handle_pynsot_err(e, desc)
         except Exception as e:
-            self.logger.exception('handle_device, checking for existing dev')
-
-        if already_exists:
-            device['id'] = existing[0]['id']
-            try:
-                self.logger.info('Patching: %s', device)
-                c.devices.patch([device])
-                success('%s updated!' % device['hostname'])
-            except ConnectionError:
-                self.click_ctx.fail('Cannot connect to NSoT server')
-            except HttpClientError as e:
-                self.handle_pynsot_err(e, device['hostname'])
-            except Exception as e:
-                self.logger.exception('handle_device, patching device')
+            self.report.record(rtype, 'failed', keys)
+            self.logger.exception('write, %s %s', op, desc)
         else:
-            try:
-                self.logger.info('Posting: %s', device)
-                c.devices.post(device)
-                success('%s created!' % device['hostname'])
-            except ConnectionError:
-                self.click_ctx.fail('Cannot connect to NSoT server')
-            except HttpClientError as e:
-                self.handle_pynsot_err(e, device['hostname'])
-            except Exception as e:
-                self.logger.exception('handle_device, posting device')
+            result = get_result(result)
+            if isinstance(result, dict):
+                result = [result]
+            if isinstance(result, list) and len(result) == len(items):
+                self.cache_objs(rtype, zip(keys, result))
+
+    def connection_lost(self, op, rtype, resource, key):
+        '''Spool a write that couldn't reach NSoT, or fail without a spool
+
+        Once the connection is lost, the rest of the run is spooled without
+        trying the server again so an outage costs one timeout, not one per
+        resource.
+        '''
+        self.go_offline()
+        self.spool.append(op, rtype, key, resource, self.site_id)
+        self.report.record(rtype, 'spooled', [key])
+
+    def go_offline(self):
+        '''Treat NSoT as unreachable for the rest of the run
+
+        Without a spool to fall back on, this fails the CLI like it always has.
+        '''
+        if self.spool is None:
+            self.click_ctx.fail('Cannot connect to NSoT server')
+
+        if not self.offline:
+            self.logger.warning('Cannot connect to NSoT server, spooling '
+                                'writes to %s', self.spool.path)
+            self.offline = True
 
     def ensure_attrs(self):
-        '''Ensure that attributes from REQUIRED_ATTRS exist, don't overwrite'''
+        '''Ensure that attributes from REQUIRED_ATTRS exist, don't overwrite
+
+        Only those for resource types .selection syncs.
+        '''
         c = self.client
-        for attr in self.REQUIRED_ATTRS:
+        required = [a for a in self.REQUIRED_ATTRS
+                    if self.selection.wants_attr(a)]
+        if self.FINGERPRINT and not self.staging_path:
+            # Staged runs diff against NSoT instead of fingerprinting
+            required.append(dict(fingerprint.ATTR))
+        for attr in required:
+            if self.offline:
+                # Replaying the spool ensures the attributes it needs
+                return
             # Loop through each attribute to create. Once #142 is fixed, this
             # might be able to be done in bulk
             attr.update({'site_id': self.site_id})
+            key = '%s:%s' % (attr['resource_name'], attr['name'])
+            if self.cache and self.cache.get(self.site_id, 'attributes', key):
+                continue
             try:
                 existing = c.attributes.get(**attr)
             except ConnectionError:
-                self.click_ctx.fail('Cannot connect to NSoT server')
-            except HttpClientError as e:
-                self.handle_pynsot_err(e)
+                self.go_offline()
+                continue
+            except HTTP_ERRORS as e:
+                # Unknown whether it exists, so leave it for the next run
+                self.handle_pynsot_err(e, 'finding attribute %s' % key)
+                continue
             except Exception as e:
                 self.logger.exception('ensure_attrs, finding exist %s' % attr)
+                continue
 
             try:
                 if existing:  # Like in the docstring, don't overwrite
@@ -373,9 +1233,11 @@ class BaseDriver(object):
                     self.logger.info('Creating attribute %s', attr['name'])
                     c.attributes.post(attr)
                     self.logger.info('%s created!' % attr['name'])
+                if self.cache:
+                    self.cache.set(self.site_id, 'attributes', key, attr)
             except ConnectionError:
-                self.click_ctx.fail('Cannot connect to NSoT server')
-            except HttpClientError as e:
+                self.go_offline()
+            except HTTP_ERRORS as e:
                 self.handle_pynsot_err(e)
             except Exception as e:
                 self.logger.exception('ensure_attrs, posting attr %s' % attr)
@@ -0,0 +1,385 @@
+from __future__ import print_function
+import csv
+import string
+import netaddr
+import click
+from nsot_sync import serializers
+from nsot_sync.common import natural_key, RESOURCE_TYPES
+from nsot_sync.drivers.base_driver import BaseDriver
+
+BOM = '\xef\xbb\xbf'
+
+# Fields that must render non-empty for a rule to produce a resource
+KEY_FIELDS = {
+    'devices': ('hostname',),
+    'networks': ('network_address',),
+    'interfaces': ('device', 'name'),
+}
+
+# Starting points for common exports. Copy one into a --mapping file to
+# adjust it for your columns and extensible attributes
+PRESETS = {
+    # Infoblox CSV export, where each record type has its own header row
+    'infoblox': {
+        'networks': [
+            {
+                'when': {'header-network': 'network'},
+                'fields': {
+                    'network_address': '{address*}',
+                    'prefix_length': '{netmask*}',
+                },
+                'attributes': {'desc': '{comment}'},
+            },
+            {
+                'when': {'header-hostrecord': 'hostrecord'},
+                'each': '{addresses}',
+                'fields': {'network_address': '{each}'},
+                'attributes': {'desc': '{fqdn*}'},
+            },
+        ],
+        'devices': [
+            {
+                'when': {'header-hostrecord': 'hostrecord'},
+                'fields': {'hostname': '{fqdn*}'},
+                'attributes': {'desc': '{comment}'},
+            },
+        ],
+    },
+    # SolarWinds Orion IPAM subnet and IP address exports
+    'orion': {
+        'networks': [
+            {
+                'fields': {
+                    'network_address': '{Address}',
+                    'prefix_length': '{CIDR}',
+                },
+                'attributes': {'desc': '{DisplayName}'},
+            },
+            {
+                'when': {'Status': 'Used'},
+                'fields': {'network_address': '{IPAddress}'},
+                'attributes': {'desc': '{DnsBackward}'},
+            },
+        ],
+        'devices': [
+            {
+                'when': {'Status': 'Used'},
+                'fields': {'hostname': '{DnsBackward}'},
+                'attributes': {},
+            },
+        ],
+    },
+}
+
+
+class Row(dict):
+    '''CSV row that renders missing columns as empty'''
+
+    def __missing__(self, key):
+        return ''
+
+
+class Rule(object):
+    '''One compiled mapping rule, turning a row into resources of one type
+
+    Args:
+        rtype (str): Resource type the rule produces
+        spec (dict): With 'fields' and 'attributes', each mapping a name to a
+            template like '{column}' or a literal. Optionally 'when', mapping
+            columns to the value they must have, and 'each', a template
+            rendering to comma separated values that each produce a
+            resource with the value as '{each}'
+    '''
+
+    formatter = string.Formatter()
+
+    def __init__(self, rtype, spec):
+        if rtype not in KEY_FIELDS:
+            raise ValueError('Unknown resource type in mapping: %s' % rtype)
+        self.rtype = rtype
+        self.when = sorted((spec.get('when') or {}).items())
+        self.each = spec.get('each')
+        self.fields = sorted((spec.get('fields') or {}).items())
+        self.attributes = sorted((spec.get('attributes') or {}).items())
+
+        fields = dict(self.fields)
+        for field in KEY_FIELDS[rtype]:
+            if field not in fields:
+                raise ValueError('%s mapping needs %s' % (rtype, field))
+
+    def render(self, template, row):
+        return self.formatter.vformat(template, (), row).strip()
+
+    def apply(self, row):
+        '''Yields a resource per value of 'each', or one, if the row matches'''
+        for column, value in self.when:
+            if row[column] != value:
+                return
+        if self.each:
+            values = self.render(self.each, row).split(',')
+            values = [v.strip() for v in values]
+        else:
+            values = [None]
+
+        for value in values:
+            if value is not None:
+                if not value:
+                    continue
+                row['each'] = value
+            resource = dict((f, self.render(t, row)) for f, t in self.fields)
+            if not all(resource[f] for f in KEY_FIELDS[self.rtype]):
+                continue
+            attrs = ((a, self.render(t, row)) for a, t in self.attributes)
+            resource['attributes'] = dict((a, v) for a, v in attrs if v)
+            yield resource
+
+
+def compile_mapping(mapping):  # -> List[Rule]
+    '''Compiles a mapping of resource type to rule, or list of rules'''
+    rules = []
+    for rtype in RESOURCE_TYPES:
+        specs = mapping.get(rtype) or []
+        if isinstance(specs, dict):
+            specs = [specs]
+        rules.extend(Rule(rtype, spec) for spec in specs)
+    return rules
+
+
+def normalize_network(network):  # -> dict
+    '''Turns a rendered network into what NSoT expects
+
+    network_address may be a bare address or a CIDR, and prefix_length a
+    length or a netmask. Without a prefix length, it's a host address.
+
+    Raises:
+        netaddr.AddrFormatError: If it isn't an address at all
+    '''
+    address = network['network_address']
+    plen = network.get('prefix_length')
+    if '/' in address and not plen:
+        address, plen = address.split('/', 1)
+    addr = netaddr.IPAddress(address)
+    if not plen:
+        plen = addr.version == 4 and 32 or 128
+    elif '.' in str(plen):
+        plen = netaddr.IPAddress(plen).netmask_bits()
+    net = netaddr.IPNetwork('%s/%s' % (addr, plen))
+
+    network['network_address'] = str(net.network)
+    network['prefix_length'] = net.prefixlen
+    full = net.version == 4 and 32 or 128
+    network.setdefault('is_ip', net.prefixlen == full)
+    return network
+
+
+def read_rows(f):
+    '''Yields (line number, Row) from an open CSV file
+
+    A row whose first cell is 'header-<type>' starts a header that
+    applies to later rows whose first cell is '<type>', the way Infoblox
+    exports mix record types. Otherwise, the first row is the header.
+    '''
+    default = None
+    headers = {}
+    for lineno, cells in enumerate(csv.reader(f), 1):
+        if not cells or not any(cells):
+            continue
+        if default is None:
+            cells[0] = cells[0].replace(BOM, '', 1)
+        first = cells[0].strip()
+        if default is None or first.startswith('header-'):
+            header = [c.strip() for c in cells]
+            if first.startswith('header-'):
+                headers[first[len('header-'):]] = header
+            default = default or header
+            continue
+        header = headers.get(first, default)
+        yield lineno, Row(zip(header, [c.strip() for c in cells]))
+
+
+class CSVImportDriver(BaseDriver):
+    '''CSV import driver
+
+    Imports networks, devices, and interfaces from CSV exports of other
+    IPAMs, like Infoblox or SolarWinds Orion, however large they are.
+
+    Rows are read one at a time and turned into resources by a declarative
+    mapping. Each resource type maps to one or more rules, which render NSoT
+    fields and attributes from '{column}' templates:
+
+    >>> {
+          "networks": [
+            {
+              "when": {"Type": "subnet"},
+              "fields": {
+                "network_address": "{Address}",
+                "prefix_length": "{Mask}"
+              },
+              "attributes": {"desc": "{Comment}"}
+            }
+          ]
+        }
+
+    Resources seen before in the file are dropped as they're read, the first
+    one winning. Whatever's left is synced in batches of batch_size, so rows
+    are never all held at once. Memory still grows with the file, though:
+    the natural key of every resource is kept to spot duplicates, and once a
+    batch lists the whole site, that's kept to compare later batches
+    against. For memory that stays flat however big the file is, use
+    --staging, which keeps both on disk.
+
+    Devices are written before interfaces, and networks before the networks
+    inside them, only within a batch. Exports should list each device before
+    its interfaces, and are best sorted by network.
+
+    Attributes:
+        REQUIRED_ATTRS (list): Every attribute named in the mapping
+        BATCH_SIZE (int): Default resources per batch
+
+    Options:
+        files (list): Open CSV files, read in order
+        mapping (dict): Declarative mapping, as above
+        batch_size (int): Resources to sync at a time
+    '''
+
+    REQUIRED_ATTRS = []
+    BATCH_SIZE = 1000
+
+    # Batches hold whatever rows came next, not a device's every resource
+    FINGERPRINT = False
+
+    def __init__(self, files=[], mapping=None, batch_size=None,
+                 *args, **kwargs):
+        super(CSVImportDriver, self).__init__(*args, **kwargs)
+        self.files = files
+        self.rules = compile_mapping(mapping or {})
+        self.batch_size = batch_size or self.BATCH_SIZE
+        self.STAGING_BATCH = self.batch_size
+
+        required = dict(((a['resource_name'], a['name']), a)
+                        for a in self.REQUIRED_ATTRS)
+        for rule in self.rules:
+            rname = rule.rtype[:-1].title()
+            for name, _ in rule.attributes:
+                required.setdefault((rname, name), {
+                    'name': name,
+                    'resource_name': rname,
+                    'required': False,
+                })
+        self.REQUIRED_ATTRS = list(required.values())
+
+    def iter_resources(self, dedup=True):
+        '''Yields (type, resource) for every new resource in the files
+
+        Resources .selection leaves out aren't yielded, and mappings for
+        types it leaves out aren't applied at all.
+
+        Args:
+            dedup (bool): Whether to drop resources seen earlier in the
+                files. Without it nothing is remembered between rows
+        '''
+        rules = [rule for rule in self.rules
+                 if self.selection.wants(rule.rtype)]
+        seen = dict((rtype, set()) for rtype in RESOURCE_TYPES)
+        dupes = 0
+        for f in self.files:
+            name = getattr(f, 'name', 'CSV')
+            for lineno, row in read_rows(f):
+                for rule in rules:
+                    for resource in rule.apply(row):
+                        if rule.rtype == 'networks':
+                            try:
+                                normalize_network(resource)
+                            except (netaddr.AddrFormatError, ValueError):
+                                self.logger.warning(
+                                    '%s:%d: bad network %s, skipping', name,
+                                    lineno, resource['network_address'])
+                                continue
+                        if not self.selection.keep(rule.rtype, resource):
+                            continue
+                        if dedup:
+                            key = natural_key(rule.rtype, resource)
+                            if key in seen[rule.rtype]:
+                                dupes += 1
+                                continue
+                            seen[rule.rtype].add(key)
+                        yield rule.rtype, resource
+        if dupes:
+            self.logger.info('Dropped %d duplicate resources', dupes)
+
+    def batches(self):
+        '''Yields resources in .get_resources format, batch_size at a time'''
+        batch = dict((rtype, []) for rtype in RESOURCE_TYPES)
+        size = 0
+        for rtype, resource in self.iter_resources():
+            batch[rtype].append(resource)
+            size += 1
+            if size >= self.batch_size:
+                yield self.sort_batch(batch)
+                batch = dict((rtype, []) for rtype in RESOURCE_TYPES)
+                size = 0
+        if size:
+            yield self.sort_batch(batch)
+
+    def sort_batch(self, batch):
+        # Parents are written before the networks inside them
+        batch['networks'].sort(key=lambda n: n['prefix_length'])
+        return batch
+
+    def get_resources(self):
+        '''Returns every resource in the files at once
+
+        Holds them all in memory. .handle_resources() syncs batch by batch
+        instead.
+
+        Returns:
+            dict: strings mapped to lists
+        '''
+        resources = dict((rtype, []) for rtype in RESOURCE_TYPES)
+        for batch in self.batches():
+            for rtype in RESOURCE_TYPES:
+                resources[rtype].extend(batch[rtype])
+        return resources
+
+    def noop(self):
+        '''Outputs resources that would be created, batch by batch
+
+        With --output-format ndjson, memory use stays flat. JSON output has
+        to group every resource by type, so it holds them all.
+        '''
+        fmt = self.click_ctx.obj.get('OUTPUT_FORMAT', 'json')
+        stdout = click.get_text_stream('stdout')
+        if fmt != 'ndjson':
+            return super(CSVImportDriver, self).noop()
+        for batch in self.batches():
+            serializers.stream(self.add_extra_attrs(batch), stdout, fmt)
+
+    def stage(self, store):
+        '''Streams rows into the staging store, which drops duplicates'''
+        store.add(self.iter_resources(dedup=False))
+
+    def handle_resources(self):
+        '''Syncs the files to NSoT one batch at a time
+
+        The first batch bigger than SCOPED_FETCH_MAX lists the whole site,
+        after which no batch needs to look anything up.
+
+        A deadline is checked between batches, and the next run starts from
+        the top of the files again.
+
+        With --staging, nothing is kept in memory to spot duplicates, and
+        every network is written after those it's inside of, across the
+        whole file. See BaseDriver.handle_resources_staged()
+        '''
+        if self.push_url or self.staging_path:
+            return super(CSVImportDriver, self).handle_resources()
+        self.ensure_attrs()
+        for batch in self.batches():
+            if self.deadline and self.deadline.expired():
+                return
+            batch = self.add_extra_attrs(batch)
+            self.report.expect(batch)
+            self.prefetch(batch)
+            batch = self.validate(batch)
+            for rtype in RESOURCE_TYPES:
+                self.bulk_upsert(rtype, batch[rtype])
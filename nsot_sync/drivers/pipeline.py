@@ -0,0 +1,109 @@
+from __future__ import print_function
+import importlib
+import inspect
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+from nsot_sync.common import natural_key, RESOURCE_TYPES
+from nsot_sync.drivers.base_driver import BaseDriver
+
+
+def find_driver(name):
+    '''Returns the driver class defined in nsot_sync.drivers.<name>
+
+    Raises:
+        ValueError: If there's no such module, or it defines no driver
+    '''
+    try:
+        module = importlib.import_module('nsot_sync.drivers.%s' % name)
+    except ImportError:
+        raise ValueError('No such driver: %s' % name)
+    for _, cls in inspect.getmembers(module, inspect.isclass):
+        if (issubclass(cls, BaseDriver) and cls.__module__ == module.__name__
+                and cls not in (BaseDriver, PipelineDriver)):
+            return cls
+    raise ValueError('No driver class in nsot_sync.drivers.%s' % name)
+
+
+def merge_resource(base, overlay):  # -> dict
+    '''Layers overlay on top of base
+
+    Fields overlay has replace those in base, except attributes which are
+    merged one by one. Fields overlay doesn't have are kept from base.
+    '''
+    merged = dict(base)
+    for field, value in overlay.items():
+        if field == 'attributes':
+            attrs = dict(base.get('attributes') or {})
+            attrs.update(value or {})
+            value = attrs
+        merged[field] = value
+    return merged
+
+
+def merge_resources(results):  # -> Dict[str, list]
+    '''Merges .get_resources output from several drivers by natural key
+
+    Later results take precedence over earlier ones, field by field, so a
+    driver contributing only attributes can be layered over one that
+    collects everything else. Resources keep the order they were first seen.
+
+    Args:
+        results (list): Dicts as returned by .get_resources, lowest
+            precedence first
+    '''
+    merged = dict((rtype, OrderedDict()) for rtype in RESOURCE_TYPES)
+    for resources in results:
+        for rtype in RESOURCE_TYPES:
+            for resource in resources.get(rtype, []):
+                key = natural_key(rtype, resource)
+                if key in merged[rtype]:
+                    resource = merge_resource(merged[rtype][key], resource)
+                merged[rtype][key] = resource
+    return dict((rtype, list(merged[rtype].values()))
+                for rtype in RESOURCE_TYPES)
+
+
+class PipelineDriver(BaseDriver):
+    '''Pipeline driver
+
+    Combines several drivers into one sync. Every driver collects its
+    resources at the same time, the results are merged by natural key, and
+    the merged set is synced to NSoT in a single pass.
+
+    Drivers given later take precedence: for a resource more than one driver
+    returns, their fields are layered in order and attributes are merged.
+    Every driver's REQUIRED_ATTRS are ensured.
+
+    Options:
+        drivers (list): Driver instances, lowest precedence first. Made
+            with collect_only, as only this driver syncs and reports
+    '''
+
+    REQUIRED_ATTRS = []
+
+    def __init__(self, drivers=[], *args, **kwargs):
+        super(PipelineDriver, self).__init__(*args, **kwargs)
+        self.drivers = list(drivers)
+
+        required = OrderedDict()
+        for driver in [self] + self.drivers:
+            for attr in driver.REQUIRED_ATTRS:
+                required.setdefault((attr['resource_name'], attr['name']),
+                                    attr)
+        self.REQUIRED_ATTRS = list(required.values())
+
+    def get_resources(self):
+        '''Returns every driver's resources, merged
+
+        Returns:
+            dict: strings mapped to lists
+        '''
+        if not self.drivers:
+            return dict((rtype, []) for rtype in RESOURCE_TYPES)
+        pool = ThreadPool(len(self.drivers))
+        try:
+            results = pool.map(lambda d: d.get_resources(), self.drivers)
+        finally:
+            pool.close()
+            pool.join()
+        return merge_resources(results)
@@ -0,0 +1,87 @@
+from __future__ import print_function
+import click
+from nsot_sync import serializers
+from nsot_sync.common import RESOURCE_TYPES
+from nsot_sync.drivers.base_driver import BaseDriver
+
+
+class ReplayDriver(BaseDriver):
+    '''Replay driver
+
+    Drains writes that other runs spooled while NSoT was unreachable and sends
+    them on in bulk. The spool is coalesced first, so a resource that was
+    spooled by many runs is only written once, with its latest contents.
+
+    Entries spooled for other sites are put back for a replay of that site.
+    If NSoT drops out again mid-replay, whatever is left is spooled again.
+
+    Attributes:
+        REQUIRED_ATTRS (list): Filled in from the attributes of the spooled
+            resources, since the runs that spooled them may never have been
+            able to ensure them
+    '''
+
+    REQUIRED_ATTRS = []
+
+    # Spooled resources are whatever happened to be pending, not everything
+    # about a device, so there's nothing to fingerprint
+    FINGERPRINT = False
+
+    def __init__(self, *args, **kwargs):
+        super(ReplayDriver, self).__init__(*args, **kwargs)
+        if self.spool is None:
+            self.click_ctx.fail('--spool-dir is required to replay')
+
+    def get_resources(self):
+        '''Returns spooled creates and updates for this site, not draining'''
+        mine = [e for e in self.spool.pending()
+                if e['site_id'] == self.site_id]
+        return self.group(mine)[0]
+
+    def noop(self):
+        '''Outputs JSON to STDOUT of the coalesced entries to be replayed'''
+        click.echo(serializers.dumps(self.spool.pending()))
+
+    def group(self, entries):
+        '''Split entries into upserts and deletes, keyed by resource type
+
+        Returns:
+            tuple: (upserts, deletes), both dicts of lists of resources
+        '''
+        upserts = dict((rtype, []) for rtype in RESOURCE_TYPES)
+        deletes = dict((rtype, []) for rtype in RESOURCE_TYPES)
+        for entry in entries:
+            target = entry['op'] == 'delete' and deletes or upserts
+            target[entry['resource_type']].append(entry['resource'])
+        return upserts, deletes
+
+    def require_spooled_attrs(self, resources):
+        '''Appends attributes used by spooled resources to REQUIRED_ATTRS'''
+        for rtype, items in resources.items():
+            names = set()
+            for resource in items:
+                names.update(resource.get('attributes', {}).keys())
+            for name in sorted(names):
+                self.REQUIRED_ATTRS.append({
+                    'name': name,
+                    'resource_name': rtype[:-1].title(),
+                    'required': False,
+                })
+
+    def handle_resources(self):
+        '''Drain the spool, replaying this site's entries in bulk'''
+        with self.spool.drain() as entries:
+            mine = [e for e in entries if e['site_id'] == self.site_id]
+            others = [e for e in entries if e['site_id'] != self.site_id]
+            self.logger.info('Replaying %d spooled writes', len(mine))
+
+            upserts, deletes = self.group(mine)
+            self.require_spooled_attrs(upserts)
+            self.handle_resources_bulk(self.add_extra_attrs(upserts))
+
+            # Delete in reverse so interfaces go before their device
+            for rtype in reversed(RESOURCE_TYPES):
+                for resource in deletes[rtype]:
+                    self.handle_delete(rtype, resource)
+
+            self.spool.write_entries(others)
@@ -1,6 +1,11 @@
 from __future__ import print_function
 from nsot_sync.drivers.base_driver import BaseDriver
+from nsot_sync import netlink
+from nsot_sync.common import natural_key
+import os
+import re
 import socket
+import multiprocessing
 import platform
 import netifaces
 
@@ -12,6 +17,11 @@ class SimpleDriver(BaseDriver):
     then generate NSoT resources for them and the host. The only attribute
     created and applied is 'desc'.
 
+    Optionally, interfaces in every network namespace under NETNS_DIR are
+    collected too, each namespace scanned by its own worker process. Their
+    interfaces are named '<netns>/<ifname>' so they don't collide with the
+    same name in other namespaces, and get a 'netns' attribute.
+
     Note:
         If you're writing a driver to supplement just attributes, consider
         subclassing this class to get the localhost network data.
@@ -20,10 +30,20 @@ class SimpleDriver(BaseDriver):
         REQUIRED_ATTRS (list): To ensure 'desc' is created for each resource
         INTF_IGNORE_PREFIXES (list): Ignore interfaces.startswith(i)
         INTF_OK_FAMILIES (list): Only add addresses from these address families
+        USE_NETLINK (bool): On Linux, read every interface and address in one
+            netlink dump rather than asking netifaces per interface. Falls
+            back to netifaces when netlink isn't available
+        NETNS_DIR (str): Where named network namespaces are mounted
+        NETNS_ATTR (dict): Interface attribute tagging each namespace, added
+            to REQUIRED_ATTRS when scanning namespaces
+        hostname (str): Short hostname, used as the device's natural key
+        node (str): platform.node(), used in descriptions
 
     Options:
         limit_intfs (list): Limit interfaces to these if specified.
         ignore_intfs (list): Ignore interfaces starting with these strings
+        scan_netns (bool): Also collect from every network namespace. Needs
+            root
     '''
 
     REQUIRED_ATTRS = [
@@ -59,25 +79,50 @@ class SimpleDriver(BaseDriver):
         netifaces.AF_INET6,
         netifaces.AF_LINK,
     ]
+    PIPELINE = True
+    USE_NETLINK = True
+    NETNS_DIR = '/var/run/netns'
+    NETNS_ATTR = {
+        'name': 'netns',
+        'resource_name': 'Interface',
+        'description': 'Network namespace',
+        'display': True,
+        'required': False,
+    }
 
-    def __init__(self, limit_intfs=[], ignore_intfs=[], *args, **kwargs):
+    def __init__(self, limit_intfs=[], ignore_intfs=[], scan_netns=False,
+                 *args, **kwargs):
         super(SimpleDriver, self).__init__(*args, **kwargs)
-        self.limit_intfs = limit_intfs
+        self.limit_intfs = frozenset(limit_intfs)
+        self.scan_netns = scan_netns
+        if scan_netns:
+            self.REQUIRED_ATTRS = self.REQUIRED_ATTRS + [self.NETNS_ATTR]
 
         # Just override the existing if these are provided
         if ignore_intfs:
             self.INTF_IGNORE_PREFIXES = ignore_intfs
+        # Compiled once rather than building a tuple of prefixes per interface
+        prefixes = '|'.join(re.escape(p) for p in self.INTF_IGNORE_PREFIXES)
+        self.ignore_re = prefixes and re.compile('(?:%s)' % prefixes) or None
+
+        # Host identity doesn't change during a run, so only ask once
+        self.hostname = socket.gethostname().split('.')[0]
+        self.node = platform.node()
 
     def get_resources(self):
         '''Returns resources to create
 
-        Will create interfaces, networks, and device for current host
+        Will create interfaces, networks, and device for current host.
+        Addresses aren't collected at all if neither networks nor interfaces
+        are being synced
 
         Returns:
             dict: strings mapped to lists
         '''
         resources_to_create = {}
-        resources_to_create.update(self.get_networks_and_interfaces())
+        if self.selection.wants('networks') or \
+                self.selection.wants('interfaces'):
+            resources_to_create.update(self.get_networks_and_interfaces())
         resources_to_create.update({'devices': [self.get_device()]})
         return resources_to_create
 
@@ -89,15 +134,45 @@ class SimpleDriver(BaseDriver):
         Returns:
             dict: {'interfaces': interfaces, 'networks': networks}
         '''
-        self.logger.debug('Grabbing interfaces from netifaces')
+        networks, interfaces = self.collect(self.get_ifaddresses())
+        if not self.scan_netns:
+            return {'interfaces': interfaces, 'networks': networks}
+
+        for netns, addresses in sorted(self.get_netns_ifaddresses().items()):
+            ns_networks, ns_interfaces = self.collect(addresses, netns)
+            networks.extend(ns_networks)
+            interfaces.extend(ns_interfaces)
+
+        # The same address can be up in more than one namespace, but it's
+        # still only one network
+        seen = set()
+        unique = []
+        for network in networks:
+            key = natural_key('networks', network)
+            if key not in seen:
+                seen.add(key)
+                unique.append(network)
+
+        return {'interfaces': interfaces, 'networks': unique}
+
+    def collect(self, addresses, netns=None):
+        '''Generate networks and interfaces from one namespace's addresses
+
+        Args:
+            addresses (dict): As returned by .get_ifaddresses
+            netns (str): Namespace name, or None for the host's own
+
+        Returns:
+            tuple: (networks, interfaces)
+        '''
         networks = []
         interfaces = []
-        ignore = self.INTF_IGNORE_PREFIXES
-        for intf in netifaces.interfaces():
+        for intf in sorted(addresses):
             if self.limit_intfs and intf not in self.limit_intfs:
                 # Move along if not in limit list, should it be provided
                 continue
-            if not self.limit_intfs and intf.startswith(tuple(ignore)):
+            ignored = self.ignore_re and self.ignore_re.match(intf)
+            if not self.limit_intfs and ignored:
                 # If not limiting, ignore the ignore prefixes
                 continue
             # This loop is a bit weird, but an interface can have many
@@ -107,11 +182,70 @@ class SimpleDriver(BaseDriver):
             # possible network resources you can create from it and the
             # interface resource itself.
             self.logger.debug('Iteration %s of prospecting interfaces', intf)
-            for net_resources, intf_resource in self.intf_fetch(intf):
+            for net_resources, intf_resource in self.intf_fetch(
+                    intf, addresses[intf], netns):
                 networks.extend(net_resources)
                 interfaces.append(intf_resource)
 
-        return {'interfaces': interfaces, 'networks': networks}
+        return networks, interfaces
+
+    def get_ifaddresses(self):
+        '''Addresses of every interface, keyed by name then address family
+
+        Uses a single netlink dump where possible, otherwise netifaces
+
+        Returns:
+            dict: Same shape as {name: netifaces.ifaddresses(name)}
+        '''
+        if self.USE_NETLINK and netlink.available():
+            self.logger.debug('Grabbing interfaces from netlink')
+            try:
+                return netlink.ifaddresses()
+            except (netlink.NetlinkError, socket.error) as e:
+                self.logger.warning('Netlink dump failed, using netifaces: %s',
+                                    e)
+
+        self.logger.debug('Grabbing interfaces from netifaces')
+        return dict((intf, netifaces.ifaddresses(intf))
+                    for intf in netifaces.interfaces())
+
+    def get_netns_ifaddresses(self):
+        '''Addresses from every network namespace, scanned in parallel
+
+        Each namespace is entered by a worker process, since a process can't
+        leave a namespace once it's in one. Namespaces that can't be read are
+        logged and skipped.
+
+        Returns:
+            dict: {netns: addresses}, addresses as from .get_ifaddresses
+        '''
+        if not os.path.isdir(self.NETNS_DIR):
+            return {}
+        if not netlink.available():
+            self.logger.warning('Netlink is needed to scan network '
+                                'namespaces, skipping them')
+            return {}
+        paths = [os.path.join(self.NETNS_DIR, n)
+                 for n in sorted(os.listdir(self.NETNS_DIR))]
+        if not paths:
+            return {}
+
+        self.logger.debug('Scanning %d network namespaces', len(paths))
+        workers = min(len(paths), multiprocessing.cpu_count())
+        pool = multiprocessing.Pool(workers)
+        try:
+            results = pool.map(netlink.netns_ifaddresses, paths)
+        finally:
+            pool.close()
+            pool.join()
+
+        found = {}
+        for path, addresses, err in results:
+            if err:
+                self.logger.warning('Skipping network namespace: %s', err)
+                continue
+            found[os.path.basename(path)] = addresses
+        return found
 
     def get_device(self):
         '''Generates single device resource for self
@@ -121,20 +255,33 @@ class SimpleDriver(BaseDriver):
         '''
         self.logger.debug('Creating resource for device')
         return {
-            'hostname': socket.gethostname().split('.')[0],
+            'hostname': self.hostname,
             'attributes': {},
         }
 
-    def intf_fetch(self, ifname):
+    def intf_fetch(self, ifname, families=None, netns=None):
         '''Gathers qualifying address families for a single interface
 
         Provides the resources to create both all networks on interface and the
         interface itself.
 
+        Args:
+            ifname (str): Interface name
+            families (dict): Its addresses, as from netifaces.ifaddresses.
+                Fetched if not given
+            netns (str): Network namespace the interface is in, if not the
+                host's own
+
         Returns:
             tuple: (network_resources_list, single_interface_dict)
         '''
-        families = netifaces.ifaddresses(ifname)
+        if families is None:
+            families = netifaces.ifaddresses(ifname)
+        attributes = {}
+        if netns:
+            ifname = '%s/%s' % (netns, ifname)
+            attributes['netns'] = netns
+        desc = '%s on %s' % (ifname, self.node)
         try:
             # Not all interfaces have AF_LINK
             mac_addr = families[netifaces.AF_LINK][0]['addr']
@@ -142,7 +289,7 @@ class SimpleDriver(BaseDriver):
             mac_addr = '00:00:00:00:00:00'
         networks = []
 
-        for family, addrs in families.iteritems():
+        for family, addrs in families.items():
             # Loop through all address families, creating network resources
             # from the ones we care about
             if family not in self.INTF_OK_FAMILIES:
@@ -162,7 +309,7 @@ class SimpleDriver(BaseDriver):
                         'state': 'assigned',
                         'prefix_length': length,
                         'attributes': {
-                            'desc': '%s on %s' % (ifname, platform.node()),
+                            'desc': desc,
                         }
                     }
                     networks.append(network_resource)
@@ -170,10 +317,10 @@ class SimpleDriver(BaseDriver):
         interface = {
             'addresses': ['%s/%s' % (r['network_address'], r['prefix_length'])
                           for r in networks],
-            'description': '%s on %s' % (ifname, platform.node()),
+            'description': desc,
             'mac_address': mac_addr,
-            'device': socket.gethostname().split('.')[0],
-            'attributes': {},
+            'device': self.hostname,
+            'attributes': attributes,
             'type': 6,
             'name': ifname
         }
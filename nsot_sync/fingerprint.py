@@ -0,0 +1,84 @@
+'''
+Fingerprint
+-----------
+
+Content hashes of everything a run syncs for each device.
+
+The hash covers the device, its interfaces, and the networks of their
+addresses, as staged by the driver. It's stored on the device in NSoT once
+they've all been written, so the next run can tell from the device alone that
+nothing about it changed and skip its interfaces and networks entirely, even
+on a fresh host with no local cache.
+'''
+
+from __future__ import print_function
+import json
+import hashlib
+from collections import defaultdict
+from nsot_sync.common import natural_key
+
+ATTR_NAME = 'nsot_sync_fingerprint'
+ATTR = {
+    'name': ATTR_NAME,
+    'resource_name': 'Device',
+    'description': 'Hash of what nsot_sync last synced for this device',
+    'display': False,
+    'required': False,
+    'multi': False,
+}
+
+# Set by NSoT or by the driver when writing, so not part of what was staged
+IGNORED_KEYS = ('id', 'site_id')
+
+
+def canonical(resource):  # -> dict
+    resource = dict((k, v) for k, v in resource.items()
+                    if k not in IGNORED_KEYS)
+    attrs = dict(resource.get('attributes') or {})
+    attrs.pop(ATTR_NAME, None)
+    resource['attributes'] = attrs
+    return resource
+
+
+def fingerprints(resources):  # -> Dict[str, Tuple[str, set]]
+    '''Hashes each staged device along with the resources it owns
+
+    Interfaces belong to their device, and networks to every device with an
+    interface addressed in them. Staged networks no interface is addressed
+    in belong to no device, and are always synced.
+
+    The standard library encoder is used on purpose: the hash has to come
+    out the same on every host, whichever JSON backend it has installed.
+
+    Args:
+        resources (dict): Same format as returned by .get_resources, before
+            any have been written
+
+    Returns:
+        dict: Hostname to (hex digest, set of (resource type, natural key))
+    '''
+    networks = dict((natural_key('networks', n), n)
+                    for n in resources.get('networks', []))
+    interfaces = defaultdict(list)
+    for intf in resources.get('interfaces', []):
+        interfaces[str(intf['device'])].append(intf)
+
+    result = {}
+    for device in resources.get('devices', []):
+        hostname = natural_key('devices', device)
+        owned = set([('devices', hostname)])
+        content = {'device': canonical(device), 'interfaces': [],
+                   'networks': []}
+        for intf in interfaces.get(hostname, []):
+            owned.add(('interfaces', natural_key('interfaces', intf)))
+            content['interfaces'].append(canonical(intf))
+            for cidr in intf.get('addresses', []):
+                if cidr in networks and ('networks', cidr) not in owned:
+                    owned.add(('networks', cidr))
+                    content['networks'].append(canonical(networks[cidr]))
+
+        content['interfaces'].sort(key=lambda i: i['name'])
+        content['networks'].sort(key=lambda n: natural_key('networks', n))
+        encoded = json.dumps(content, sort_keys=True).encode('utf-8')
+        result[hostname] = (hashlib.sha1(encoded).hexdigest(), owned)
+    return result
@@ -0,0 +1,189 @@
+'''
+Netlink
+-------
+
+Bulk interface enumeration over rtnetlink, for Linux hosts with too many
+interfaces to walk one at a time through netifaces.
+
+Two dump requests (links, then addresses) return everything the kernel knows
+about every interface, however many there are. Results are shaped like
+``netifaces.ifaddresses()`` so callers can treat both the same.
+'''
+
+from __future__ import print_function
+import os
+import ctypes
+import ctypes.util
+import socket
+import struct
+import binascii
+import netifaces
+
+NETLINK_ROUTE = 0
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 0x2
+NLMSG_DONE = 0x3
+RTM_NEWLINK = 16
+RTM_GETLINK = 18
+RTM_NEWADDR = 20
+RTM_GETADDR = 22
+IFLA_ADDRESS = 1
+IFLA_IFNAME = 3
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+IFA_LABEL = 3
+CLONE_NEWNET = 0x40000000
+
+NLMSGHDR = struct.Struct('=LHHLL')
+IFINFOMSG = struct.Struct('=BxHiII')
+IFADDRMSG = struct.Struct('=BBBBI')
+RTATTR = struct.Struct('=HH')
+RECV_SIZE = 1 << 16
+
+
+class NetlinkError(Exception):
+    pass
+
+
+def available():  # -> bool
+    '''Whether rtnetlink can be used on this host'''
+    return hasattr(socket, 'AF_NETLINK')
+
+
+def align(length):
+    return (length + 3) & ~3
+
+
+def parse_attrs(data, offset):  # -> Dict[int, bytes]
+    attrs = {}
+    while offset + RTATTR.size <= len(data):
+        length, kind = RTATTR.unpack_from(data, offset)
+        if length < RTATTR.size:
+            break
+        attrs[kind] = data[offset + RTATTR.size:offset + length]
+        offset += align(length)
+    return attrs
+
+
+def dump(sock, msg_type, body, seq):
+    '''Sends a dump request, yielding (type, payload) for each reply'''
+    header = NLMSGHDR.pack(NLMSGHDR.size + len(body), msg_type,
+                           NLM_F_REQUEST | NLM_F_DUMP, seq, 0)
+    sock.send(header + body)
+    while True:
+        data = sock.recv(RECV_SIZE)
+        offset = 0
+        while offset + NLMSGHDR.size <= len(data):
+            length, kind, _, _, _ = NLMSGHDR.unpack_from(data, offset)
+            if length < NLMSGHDR.size or offset + length > len(data):
+                raise NetlinkError('Truncated netlink message')
+            payload = data[offset + NLMSGHDR.size:offset + length]
+            offset += align(length)
+            if kind == NLMSG_DONE:
+                return
+            if kind == NLMSG_ERROR:
+                errno = struct.unpack_from('=i', payload)[0]
+                if errno:
+                    raise NetlinkError('Netlink dump failed: %d' % -errno)
+                continue
+            yield kind, payload
+
+
+def format_mac(raw):
+    hexed = binascii.hexlify(raw).decode('ascii')
+    return ':'.join(hexed[i:i + 2] for i in range(0, len(hexed), 2))
+
+
+def ifaddresses():  # -> Dict[str, Dict[int, list]]
+    '''Every interface's addresses, keyed by name then address family
+
+    Same shape as calling ``netifaces.ifaddresses(name)`` for every name in
+    ``netifaces.interfaces()``, minus netmasks and broadcasts. IPv4 aliases
+    are their own interfaces, named by label (eg 'eth0:1') with just their
+    addresses, as netifaces has them.
+
+    Raises:
+        NetlinkError: If the kernel rejects a dump
+    '''
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+    try:
+        sock.bind((0, 0))
+        return read_ifaddresses(sock)
+    finally:
+        sock.close()
+
+
+def read_ifaddresses(sock):  # -> Dict[str, Dict[int, list]]
+    '''ifaddresses(), over an open and bound rtnetlink socket'''
+    names = {}
+    result = {}
+    link_req = IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+    for kind, payload in dump(sock, RTM_GETLINK, link_req, 1):
+        if kind != RTM_NEWLINK:
+            continue
+        index = IFINFOMSG.unpack_from(payload)[2]
+        attrs = parse_attrs(payload, IFINFOMSG.size)
+        if IFLA_IFNAME not in attrs:
+            continue
+        name = attrs[IFLA_IFNAME].rstrip(b'\0').decode('utf-8')
+        names[index] = name
+        families = result.setdefault(name, {})
+        mac = attrs.get(IFLA_ADDRESS)
+        if mac and len(mac) == 6:
+            families[netifaces.AF_LINK] = [{'addr': format_mac(mac)}]
+
+    addr_req = IFADDRMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+    for kind, payload in dump(sock, RTM_GETADDR, addr_req, 2):
+        if kind != RTM_NEWADDR:
+            continue
+        family, _, _, _, index = IFADDRMSG.unpack_from(payload)
+        if family not in (socket.AF_INET, socket.AF_INET6):
+            continue
+        attrs = parse_attrs(payload, IFADDRMSG.size)
+        # IFA_LOCAL is ours on point-to-point links, IFA_ADDRESS the peer
+        raw = attrs.get(IFA_LOCAL) or attrs.get(IFA_ADDRESS)
+        if raw is None or index not in names:
+            continue
+        af = family == socket.AF_INET and netifaces.AF_INET or \
+            netifaces.AF_INET6
+        addr = {'addr': socket.inet_ntop(family, raw)}
+        name = names[index]
+        if family == socket.AF_INET and attrs.get(IFA_LABEL):
+            # Set to the interface's own name unless it's an alias
+            name = attrs[IFA_LABEL].rstrip(b'\0').decode('utf-8')
+        result.setdefault(name, {}).setdefault(af, []).append(addr)
+    return result
+
+
+def setns(path):
+    '''Moves the calling process into the network namespace at path
+
+    Raises:
+        NetlinkError: If the namespace can't be entered (usually not root)
+    '''
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if libc.setns(fd, CLONE_NEWNET) != 0:
+            errno = ctypes.get_errno()
+            raise NetlinkError('setns %s: %s' % (path, os.strerror(errno)))
+    finally:
+        os.close(fd)
+
+
+def netns_ifaddresses(path):  # -> Tuple[str, dict, str]
+    '''Like ifaddresses(), from inside the network namespace at path
+
+    Meant to run in a worker process, since it never leaves the namespace.
+    Errors are returned rather than raised so one bad namespace doesn't fail
+    a whole pool.map(). That includes a libc without setns().
+
+    Returns:
+        tuple: (path, addresses or None, error message or None)
+    '''
+    try:
+        setns(path)
+        return path, ifaddresses(), None
+    except (NetlinkError, OSError, socket.error, AttributeError) as e:
+        return path, None, str(e)
@@ -0,0 +1,157 @@
+'''
+Report
+------
+
+Aggregated reporting of what a run did to NSoT.
+
+Instead of a message per resource, drivers record outcomes here. Progress is
+printed at most once every few seconds while the run goes, and a summary of
+counts per resource type and outcome is printed when it ends. Full resources
+are only logged when asked for with ``--log-objects``.
+'''
+
+from __future__ import print_function
+import time
+import logging
+import threading
+from collections import Counter
+from nsot_sync.common import error, info, success, RESOURCE_TYPES
+from nsot_sync.retry import describe
+
+OUTCOMES = ('created', 'updated', 'unchanged', 'deleted', 'spooled',
+            'deferred', 'invalid', 'failed')
+
+# Outcomes leaving resources for a later run to try again
+UNFINISHED = ('spooled', 'deferred', 'invalid', 'failed')
+
+
+class Sample(object):
+    '''Lazily formats a few keys out of many, for log messages
+
+    Nothing is joined unless the message is actually emitted.
+
+        >>> str(Sample(['a', 'b', 'c', 'd', 'e'], 3))
+        'a, b, c and 2 more'
+    '''
+
+    def __init__(self, keys, size=3):
+        self.keys = keys
+        self.size = size
+
+    def __str__(self):
+        shown = ', '.join(str(k) for k in self.keys[:self.size])
+        rest = len(self.keys) - self.size
+        if rest > 0:
+            return '%s and %d more' % (shown, rest)
+        return shown
+
+
+class Reporter(object):
+    '''Counts outcomes of a run, printing progress and a summary to STDERR
+
+    Args:
+        interval (int): Minimum seconds between progress lines. 0 disables
+            progress lines
+        log_objects (bool): Log every resource in full as it's written
+        sample (int): How many natural keys to name when logging a batch
+        retry_stats (nsot_sync.retry.RetryStats): Counts of retried requests,
+            of which those made after this is created are summarized
+    '''
+
+    def __init__(self, interval=5, log_objects=False, sample=3,
+                 retry_stats=None):
+        self.interval = interval
+        self.log_objects = log_objects
+        self.sample = sample
+        self.logger = logging.getLogger(__name__)
+        self.counts = Counter()
+        self.unfinished = set()
+        self.lock = threading.Lock()
+        self.expected = 0
+        self.started = time.time()
+        self.last_progress = self.started
+        self.retry_stats = retry_stats
+        self.retries_before = retry_stats and retry_stats.snapshot()
+
+    def expect(self, resources):
+        '''Adds the staged resources to the total progress is measured by
+
+        Args:
+            resources (dict): Same format as returned by .get_resources
+        '''
+        staged = dict((rtype, len(resources.get(rtype, [])))
+                      for rtype in RESOURCE_TYPES)
+        self.expect_counts(staged)
+        self.trace('All staged resources: %s', resources)
+
+    def expect_counts(self, staged):
+        '''Like .expect, given only how many of each type are staged'''
+        self.expected += sum(staged.values())
+        self.logger.debug('Staged resources: %s', staged)
+
+    def record(self, rtype, outcome, keys):
+        '''Counts resources of one type that all had the same outcome
+
+        Args:
+            rtype (str): Resource type, eg 'networks'
+            outcome (str): One of OUTCOMES
+            keys (list): Natural keys of the resources
+        '''
+        if not keys:
+            return
+        with self.lock:
+            self.counts[(rtype, outcome)] += len(keys)
+            if outcome in UNFINISHED:
+                self.unfinished.update((rtype, key) for key in keys)
+            self.progress()
+        self.logger.debug('%s %d %s: %s', outcome.title(), len(keys), rtype,
+                          Sample(keys, self.sample))
+
+    def trace(self, msg, *args):
+        '''Log full resources, only if --log-objects was given'''
+        if self.log_objects:
+            self.logger.info(msg, *args)
+
+    def done(self):  # -> int
+        return sum(self.counts.values())
+
+    def progress(self):
+        '''Print a progress line, if the last one was long enough ago'''
+        now = time.time()
+        if not self.interval or now - self.last_progress < self.interval:
+            return
+        self.last_progress = now
+        done = self.done()
+        rate = done / max(now - self.started, 0.001)
+        if self.expected:
+            info('%d/%d resources done (%d%%), %.0f/s' % (
+                done, self.expected, 100 * done / self.expected, rate))
+        else:
+            info('%d resources done, %.0f/s' % (done, rate))
+
+    def summary(self):
+        '''Print counts per resource type and outcome, then any failures'''
+        if not self.counts:
+            return
+        elapsed = time.time() - self.started
+        for rtype in RESOURCE_TYPES:
+            counts = ['%d %s' % (self.counts[(rtype, outcome)], outcome)
+                      for outcome in OUTCOMES
+                      if outcome not in ('invalid', 'failed') and
+                      self.counts[(rtype, outcome)]]
+            if counts:
+                success('%s: %s' % (rtype, ', '.join(counts)))
+        invalid = sum(self.counts[(rtype, 'invalid')]
+                      for rtype in RESOURCE_TYPES)
+        if invalid:
+            error('%d resources invalid and not sent, see the log for why' %
+                  invalid)
+        failed = sum(self.counts[(rtype, 'failed')]
+                     for rtype in RESOURCE_TYPES)
+        if failed:
+            error('%d resources failed, see the log for why' % failed)
+        if self.retry_stats is not None:
+            retried = describe(self.retry_stats.since(self.retries_before))
+            if retried:
+                info('Requests: %s' % retried)
+        info('%d resources in %.1fs' % (self.done(), elapsed))
@@ -0,0 +1,266 @@
+'''
+Retry
+-----
+
+Retries, backoff, and a circuit breaker for every request made to NSoT.
+
+Requests go through a RetryAdapter mounted on the shared session from
+nsot_sync.client, so every driver and handler gets the same policy without
+handling it themselves:
+
+- Connection errors, timeouts, and 5xx responses are retried, waiting a
+  random time up to an exponentially growing cap between attempts, so many
+  hosts retrying at once don't all hit NSoT together.
+- Only requests that are safe to send twice are retried after they may have
+  reached NSoT. That's GETs, PUTs, DELETEs, and PATCHes, which NSoT applies
+  as absolute values. POSTs are only retried if they never left, or NSoT
+  answered 503.
+- Timeouts still failing once retries run out raise TimedOutError, a
+  ConnectionError, as not hearing back from NSoT is handled the same as not
+  reaching it.
+- After enough failures in a row, NSoT is taken to be down and requests fail
+  straight away, without being sent, until it's given another try. They fail
+  with CircuitOpenError, a ConnectionError, so drivers spool or stop exactly
+  as they would when NSoT is unreachable.
+
+What was retried is counted in STATS, for the summary at the end of a run.
+'''
+
+from __future__ import print_function
+import time
+import random
+import logging
+import threading
+from collections import Counter
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectTimeout, ConnectionError, Timeout
+from requests.packages.urllib3.exceptions import (ConnectTimeoutError,
+                                                  NewConnectionError)
+
+# Methods that do the same thing however many times they're sent
+IDEMPOTENT = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'PATCH', 'DELETE')
+
+RETRY_STATUSES = (500, 502, 503, 504)
+
+# Counters, and how the summary names them, in the order it lists them
+STAT_NAMES = (
+    ('retried', 'retries'),
+    ('recovered', 'recovered'),
+    ('exhausted', 'gave up'),
+    ('rejected', 'failed fast while NSoT was down'),
+)
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(ConnectionError):
+    '''Raised instead of sending a request while NSoT looks down'''
+
+
+class TimedOutError(ConnectionError, Timeout):
+    '''Raised once NSoT hasn't answered a request in time, for good
+
+    A ConnectionError, so drivers spool or stop just as when NSoT is
+    unreachable, rather than taking a lookup that timed out for a miss.
+    '''
+
+
+class RetryStats(object):
+    '''Thread safe counters of what was retried, across the process'''
+
+    def __init__(self):
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    def add(self, name, n=1):
+        with self.lock:
+            self.counts[name] += n
+
+    def snapshot(self):  # -> Counter
+        with self.lock:
+            return Counter(self.counts)
+
+    def since(self, snapshot):  # -> Counter
+        '''Counts added after snapshot was taken'''
+        now = self.snapshot()
+        now.subtract(snapshot)
+        return Counter(dict((k, v) for k, v in now.items() if v > 0))
+
+
+STATS = RetryStats()
+
+
+def describe(counts):  # -> str
+    '''Counts from RetryStats as a summary line, or '' if there are none'''
+    return ', '.join('%d %s' % (counts[name], label)
+                     for name, label in STAT_NAMES if counts[name])
+
+
+class RetryPolicy(object):
+    '''How often and how patiently requests are retried
+
+    Args:
+        retries (int): Most times a request is retried. 0 disables retries
+        backoff (float): Seconds the first retry waits at most. Each after
+            that waits at most twice as long as the last
+        max_backoff (float): Cap on any single wait
+        timeout (float): Seconds to wait on NSoT per attempt, when the caller
+            doesn't say. None to wait forever
+    '''
+
+    def __init__(self, retries=3, backoff=0.5, max_backoff=10, timeout=30):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+
+    def wait(self, attempt, retry_after=None):  # -> float
+        '''Seconds to wait before retry number attempt, counting from 0
+
+        Uses "full jitter", anywhere from nothing up to the backoff, unless
+        NSoT asked for longer with Retry-After.
+        '''
+        cap = min(self.max_backoff, self.backoff * 2 ** attempt)
+        wait = random.uniform(0, cap)
+        try:
+            wait = max(wait, min(self.max_backoff, float(retry_after)))
+        except (TypeError, ValueError):
+            pass
+        return wait
+
+
+class CircuitBreaker(object):
+    '''Fails requests fast once NSoT looks down
+
+    After threshold failures in a row it opens, and requests raise
+    CircuitOpenError without being sent. Once reset seconds pass a single
+    request is let through to try NSoT again: if it works the breaker
+    closes, otherwise it stays open for another reset seconds.
+
+    Args:
+        threshold (int): Failures in a row that open it
+        reset (float): Seconds it stays open before trying again
+        stats (RetryStats): Where to count requests refused while open
+    '''
+
+    def __init__(self, threshold=5, reset=30, stats=STATS):
+        self.threshold = threshold
+        self.reset = reset
+        self.stats = stats
+        self.failures = 0
+        self.opened = None
+        self.trying = False
+        self.lock = threading.Lock()
+
+    def before(self):
+        '''Called before sending a request
+
+        Raises:
+            CircuitOpenError: If the request shouldn't be sent
+        '''
+        with self.lock:
+            if self.opened is None:
+                return
+            if self.trying or time.time() - self.opened < self.reset:
+                self.stats.add('rejected')
+                raise CircuitOpenError('NSoT looks down after %d failed '
+                                       'requests' % self.failures)
+            self.trying = True
+
+    def release(self):
+        '''Called after every request let through, however it went'''
+        with self.lock:
+            self.trying = False
+
+    def success(self):
+        with self.lock:
+            if self.opened is not None:
+                logger.warning('NSoT is answering again')
+            self.failures = 0
+            self.opened = None
+            self.trying = False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trying = False
+            if self.failures < self.threshold:
+                return
+            if self.opened is None:
+                logger.warning('NSoT looks down after %d failed requests, '
+                               'failing fast for %ds', self.failures,
+                               self.reset)
+            self.opened = time.time()
+
+
+def never_sent(exc):  # -> bool
+    '''Whether a request failed before any of it could reach the server'''
+    if isinstance(exc, ConnectTimeout):
+        return True
+    reason = exc.args and getattr(exc.args[0], 'reason', None)
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+
+class RetryAdapter(HTTPAdapter):
+    '''HTTPAdapter retrying per a RetryPolicy, behind a CircuitBreaker
+
+    Args:
+        policy (RetryPolicy): Defaults to RetryPolicy()
+        breaker (CircuitBreaker): Defaults to a CircuitBreaker() of its own
+        stats (RetryStats): Defaults to STATS
+    '''
+
+    def __init__(self, policy=None, breaker=None, stats=STATS, **kwargs):
+        self.policy = policy or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker(stats=stats)
+        self.stats = stats
+        super(RetryAdapter, self).__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.policy.timeout
+        idempotent = request.method.upper() in IDEMPOTENT
+        attempt = 0
+        while True:
+            self.breaker.before()
+            retry_after = None
+            try:
+                try:
+                    resp = super(RetryAdapter, self).send(request, **kwargs)
+                finally:
+                    # Even if it raised something unexpected, this request
+                    # is no longer NSoT's trial, or none would follow it
+                    self.breaker.release()
+            except (ConnectionError, Timeout) as e:
+                self.breaker.failure()
+                safe = idempotent or never_sent(e)
+                if not safe or attempt >= self.policy.retries:
+                    self.stats.add('exhausted')
+                    if isinstance(e, ConnectionError):
+                        raise
+                    raise TimedOutError(e, request=request)
+                why = e.__class__.__name__
+            else:
+                if resp.status_code not in RETRY_STATUSES:
+                    self.breaker.success()
+                    if attempt:
+                        self.stats.add('recovered')
+                    return resp
+                self.breaker.failure()
+                safe = idempotent or resp.status_code == 503
+                if not safe or attempt >= self.policy.retries:
+                    self.stats.add('exhausted')
+                    return resp
+                why = resp.status_code
+                retry_after = resp.headers.get('Retry-After')
+
+                # Release the connection back to the pool before retrying
+                resp.content
+                resp.close()
+
+            wait = self.policy.wait(attempt, retry_after)
+            logger.debug('%s %s failed (%s), retrying in %.1fs',
+                         request.method, request.url, why, wait)
+            self.stats.add('retried')
+            time.sleep(wait)
+            attempt += 1
@@ -0,0 +1,227 @@
+'''
+Scheduler
+---------
+
+Runs resource writes in dependency order, in parallel where that's safe.
+
+Rather than writing every device, then every network, then every interface,
+each resource waits only on what it references: an interface on its device
+and the networks of its addresses, a network on its closest staged parent.
+Everything else runs as soon as a worker is free, so one slow device holds up
+its own interfaces and nothing more. Of the nodes ready at once, those with
+the lowest priority go first.
+'''
+
+from __future__ import print_function
+import heapq
+from collections import OrderedDict, defaultdict, deque
+from multiprocessing.pool import ThreadPool
+from nsot_sync.common import NetworkIndex, natural_key
+
+try:
+    from Queue import Queue
+except ImportError:  # pragma: no cover
+    from queue import Queue
+
+
+class CycleError(Exception):
+    pass
+
+
+class DependencyGraph(object):
+    '''Nodes with edges to the nodes they depend on
+
+    Nodes can be anything hashable. Edges to nodes never added are ignored,
+    since those dependencies are expected to exist already. Priorities can be
+    anything comparable, and are 0 unless given.
+
+        >>> g = DependencyGraph()
+        >>> g.add('child', ['parent'])
+        >>> g.add('parent')
+        >>> g.run(do_something, workers=4)
+    '''
+
+    def __init__(self):
+        self.deps = OrderedDict()
+        self.priority = {}
+
+    def __len__(self):
+        return len(self.deps)
+
+    def add(self, node, deps=(), priority=None):
+        self.deps.setdefault(node, set()).update(d for d in deps if d != node)
+        if priority is not None:
+            self.priority[node] = priority
+
+    def dependents(self):  # -> Tuple[dict, dict]
+        '''Returns (unmet dependency count, dependents) for every node'''
+        waiting = {}
+        dependents = defaultdict(list)
+        for node, deps in self.deps.items():
+            deps = [d for d in deps if d in self.deps]
+            waiting[node] = len(deps)
+            for dep in deps:
+                dependents[dep].append(node)
+        return waiting, dependents
+
+    def topological(self):  # -> list
+        '''Nodes ordered so each comes after its dependencies
+
+        Nodes in a cycle, or depending on one, are left out.
+        '''
+        waiting, dependents = self.dependents()
+        ready = deque(node for node in self.deps if waiting[node] == 0)
+        order = []
+        while ready:
+            node = ready.popleft()
+            order.append(node)
+            for dependent in dependents[node]:
+                waiting[dependent] -= 1
+                if waiting[dependent] == 0:
+                    ready.append(dependent)
+        return order
+
+    def effective_priorities(self):  # -> dict
+        '''Each node's priority, raised to its most urgent dependent's
+
+        Otherwise a low priority parent network would hold up the high
+        priority networks inside it until everything else had run.
+        '''
+        effective = dict((node, self.priority.get(node, 0))
+                         for node in self.deps)
+        for node in reversed(self.topological()):
+            for dep in self.deps[node]:
+                if dep in effective and effective[node] < effective[dep]:
+                    effective[dep] = effective[node]
+        return effective
+
+    def run(self, fn, workers=1, stop=None):  # -> list
+        '''Calls fn(node) for every node, each after all of its dependencies
+
+        Nodes are dispatched as soon as they're ready, up to ``workers`` at
+        a time, most urgent first. If fn raises, nothing further is
+        dispatched and the first exception is raised once running calls
+        finish.
+
+        Args:
+            stop (callable): Checked before dispatching each node. Once it
+                returns True, nothing further is dispatched
+
+        Returns:
+            list: Nodes that never ran because of stop, in the order added
+
+        Raises:
+            CycleError: If some nodes can never become ready
+        '''
+        waiting, dependents = self.dependents()
+
+        # Ties go to whichever node was added first
+        priority = self.effective_priorities()
+        order = dict((node, i) for i, node in enumerate(self.deps))
+        ready = []
+
+        def make_ready(node):
+            heapq.heappush(ready, (priority[node], order[node], node))
+
+        for node in self.deps:
+            if waiting[node] == 0:
+                make_ready(node)
+
+        if workers <= 1:
+            pool = None
+        else:
+            pool = ThreadPool(workers)
+        finished = Queue()
+
+        def call(node):
+            try:
+                fn(node)
+                finished.put((node, None))
+            except Exception as e:
+                finished.put((node, e))
+
+        # Only as many are handed out as can run, so the rest stay in order
+        # of priority rather than queueing inside the pool
+        slots = max(workers, 1)
+        running = 0
+        started = set()
+        failure = None
+        stopped = False
+        try:
+            while ready or running:
+                while (ready and running < slots and failure is None and
+                       not stopped):
+                    if stop is not None and stop():
+                        stopped = True
+                        break
+                    node = heapq.heappop(ready)[2]
+                    started.add(node)
+                    running += 1
+                    if pool is None:
+                        call(node)
+                    else:
+                        pool.apply_async(call, (node,))
+                if not running:
+                    break
+                node, exc = finished.get()
+                running -= 1
+                if exc is not None:
+                    failure = failure or exc
+                    continue
+                for dependent in dependents[node]:
+                    waiting[dependent] -= 1
+                    if waiting[dependent] == 0:
+                        make_ready(dependent)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        if failure is not None:
+            raise failure
+        unrun = [node for node in self.deps if node not in started]
+        if stopped:
+            return unrun
+        if unrun:
+            raise CycleError('%d nodes depend on each other and never ran' %
+                             len(unrun))
+        return []
+
+
+def resource_graph(resources, priorities=None):
+    '''Builds the graph of staged resources, keyed by (type, natural key)
+
+    Edges go from each interface to its device and to the host networks of
+    its addresses, and from each network to the most specific staged network
+    containing it. Only staged resources are linked; anything else is
+    expected to already exist in NSoT.
+
+    Args:
+        resources (dict): Same format as returned by .get_resources
+        priorities (dict): Priority of each (type, natural key), if any
+
+    Returns:
+        DependencyGraph
+    '''
+    graph = DependencyGraph()
+    graph.priority.update(priorities or {})
+    for device in resources.get('devices', []):
+        graph.add(('devices', natural_key('devices', device)))
+
+    staged = []
+    index = NetworkIndex()
+    for network in resources.get('networks', []):
+        key = natural_key('networks', network)
+        staged.append(key)
+        index.add(key)
+    for key in staged:
+        parent = index.parent(key)
+        graph.add(('networks', key), parent and [('networks', parent)] or [])
+
+    for interface in resources.get('interfaces', []):
+        deps = [('devices', str(interface['device']))]
+        deps.extend(('networks', cidr)
+                    for cidr in interface.get('addresses', []))
+        graph.add(('interfaces', natural_key('interfaces', interface)), deps)
+
+    return graph
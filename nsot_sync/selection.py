@@ -0,0 +1,92 @@
+'''
+Selection
+---------
+
+Partial syncs, of some resource types or some resources of a type.
+
+``--only`` names the resource types to sync, ``--only-interfaces`` globs of
+interface names, and ``--only-networks`` CIDRs that synced networks must be
+inside of. Everything else is dropped as soon as a driver returns it, before
+any lookups, and whatever only the dropped resources needed is skipped: their
+attributes aren't ensured and their types aren't listed from NSoT.
+
+Interfaces keep all of their addresses whatever ``--only-networks`` says,
+since NSoT replaces an interface's addresses wholesale.
+'''
+
+from __future__ import print_function
+import re
+import fnmatch
+import netaddr
+from nsot_sync.common import natural_key, RESOURCE_TYPES
+
+
+def resource_type(attr):  # -> str
+    '''Resource type an NSoT attribute dict is for, eg 'devices' '''
+    return '%ss' % attr['resource_name'].lower()
+
+
+class Selection(object):
+    '''Which resources a run syncs
+
+    Args:
+        types (list): Resource types to sync, or empty for all of them
+        interface_globs (list): Only sync interfaces named like one of these
+        cidrs (list): Only sync networks inside one of these
+
+    Raises:
+        ValueError: If a type or CIDR is invalid
+    '''
+
+    def __init__(self, types=None, interface_globs=None, cidrs=None):
+        unknown = set(types or []) - set(RESOURCE_TYPES)
+        if unknown:
+            raise ValueError('Unknown resource types: %s' %
+                             ', '.join(sorted(unknown)))
+        self.types = tuple(rtype for rtype in RESOURCE_TYPES
+                           if not types or rtype in types)
+        self.interface_re = None
+        if interface_globs:
+            self.interface_re = re.compile('|'.join(
+                fnmatch.translate(g) for g in interface_globs))
+        try:
+            self.cidrs = [netaddr.IPNetwork(c) for c in cidrs or []]
+        except netaddr.AddrFormatError as e:
+            raise ValueError(str(e))
+
+    def __bool__(self):
+        '''Whether this leaves anything out'''
+        return (len(self.types) < len(RESOURCE_TYPES) or
+                self.interface_re is not None or bool(self.cidrs))
+    __nonzero__ = __bool__
+
+    def wants(self, rtype):  # -> bool
+        return rtype in self.types
+
+    def wants_attr(self, attr):  # -> bool
+        '''Whether an NSoT attribute dict is for a type being synced'''
+        return self.wants(resource_type(attr))
+
+    def keep(self, rtype, resource):  # -> bool
+        '''Whether one resource is synced'''
+        if rtype not in self.types:
+            return False
+        if rtype == 'interfaces' and self.interface_re is not None:
+            return bool(self.interface_re.match(resource.get('name') or ''))
+        if rtype == 'networks' and self.cidrs:
+            try:
+                net = netaddr.IPNetwork(natural_key(rtype, resource))
+            except (KeyError, netaddr.AddrFormatError, ValueError):
+                # Left for validation to report
+                return True
+            return any(net.version == cidr.version and net in cidr
+                       for cidr in self.cidrs)
+        return True
+
+    def apply(self, resources):  # -> dict
+        '''Resources in .get_resources format, minus what isn't synced'''
+        if not self:
+            return resources
+        return dict((rtype, [r for r in resources.get(rtype, [])
+                             if self.keep(rtype, r)])
+                    for rtype in RESOURCE_TYPES)
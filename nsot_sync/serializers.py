@@ -0,0 +1,100 @@
+'''
+Serializers
+-----------
+
+JSON encoding shared by No-Op output, the spool, the lookup cache, and request
+bodies sent to NSoT.
+
+``ujson`` is used when it's installed and the standard library otherwise.
+No-Op output is streamed, so a million resources never have to sit in memory
+as one giant string before the first byte is written.
+'''
+
+from __future__ import print_function
+import json
+from pynsot.vendor.slumber.serialize import JsonSerializer
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+FORMATS = ('json', 'ndjson')
+
+# Resources are buffered and written this many at a time
+CHUNK_SIZE = 500
+
+
+def dumps(obj):  # -> str
+    if ujson is not None:
+        return ujson.dumps(obj, escape_forward_slashes=False)
+    return json.dumps(obj)
+
+
+def loads(data):  # -> Any
+    if ujson is not None:
+        return ujson.loads(data)
+    return json.loads(data)
+
+
+class FastJsonSerializer(JsonSerializer):
+    '''slumber serializer using the fastest available JSON backend'''
+
+    def loads(self, data):
+        return loads(data)
+
+    def dumps(self, data):
+        return dumps(data)
+
+
+def install(client):
+    '''Makes a pynsot client encode and decode with FastJsonSerializer
+
+    Args:
+        client: pynsot client, or any slumber resource of one
+    '''
+    serializer = client._store['serializer']
+    serializer.serializers[FastJsonSerializer.key] = FastJsonSerializer()
+
+
+def stream(resources, fp, fmt='json'):
+    '''Writes resources to fp incrementally
+
+    The resource lists may be any iterable, including generators, and are
+    only walked once.
+
+    Args:
+        resources (dict): Resource lists keyed by type, as from
+            BaseDriver.get_resources
+        fp (file): Where to write
+        fmt (str): 'json' for one object just like json.dumps(resources)
+            would give, or 'ndjson' for one resource per line, as
+            {"resource_type": ..., "resource": ...}
+    '''
+    if fmt not in FORMATS:
+        raise ValueError('Unknown output format: %s' % fmt)
+
+    chunk = []
+
+    def emit(text):
+        chunk.append(text)
+        if len(chunk) >= CHUNK_SIZE:
+            fp.write(''.join(chunk))
+            del chunk[:]
+
+    if fmt == 'ndjson':
+        for rtype, items in resources.items():
+            for item in items:
+                emit('%s\n' % dumps({'resource_type': rtype,
+                                     'resource': item}))
+    else:
+        emit('{')
+        for i, (rtype, items) in enumerate(resources.items()):
+            emit('%s%s: [' % (i and ', ' or '', dumps(rtype)))
+            for j, item in enumerate(items):
+                emit('%s%s' % (j and ', ' or '', dumps(item)))
+            emit(']')
+        emit('}\n')
+
+    fp.write(''.join(chunk))
+    fp.flush()
@@ -0,0 +1,168 @@
+'''
+Spool
+-----
+
+Append-only journal of writes that couldn't reach NSoT.
+
+When a driver is given a spool directory, losing the connection to NSoT no
+longer fails the run. Every pending create, update, or delete is appended to
+the journal instead and ``nsot_sync replay`` drains it later. Replaying
+coalesces the journal so only the latest write for each natural key is sent.
+'''
+
+from __future__ import print_function
+import os
+import time
+import fcntl
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from nsot_sync import serializers
+
+JOURNAL = 'journal'
+DRAINING_PREFIX = 'journal.draining.'
+LOCKFILE = '.lock'
+
+
+class Spool(object):
+    '''Durable, append-only journal of pending NSoT writes
+
+    Each line in the journal is one JSON entry:
+
+    >>> {
+          "ts": 1456710000.0,
+          "op": "create",
+          "site_id": 1,
+          "resource_type": "networks",
+          "key": "10.97.3.113/32",
+          "resource": {...}
+        }
+
+    Writers only ever append to ``journal``. Draining atomically renames it
+    out of the way, so runs that spool while a replay is in progress start a
+    fresh journal rather than racing it.
+
+    Args:
+        path (str): Directory to keep the journal in. Created if missing
+    '''
+
+    OPS = ('create', 'update', 'delete')
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        self.journal = os.path.join(self.path, JOURNAL)
+        self.logger = logging.getLogger(__name__)
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+    @contextmanager
+    def lock(self):
+        '''Exclusive lock shared by every process using this spool dir'''
+        with open(os.path.join(self.path, LOCKFILE), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def append(self, op, rtype, key, resource, site_id):
+        '''Durably record a single pending write
+
+        Args:
+            op (str): One of Spool.OPS
+            rtype (str): Resource type, eg 'networks'
+            key (str): Natural key, as from common.natural_key
+            resource (dict): Resource as it would have been sent to NSoT
+            site_id (int): Site the write was meant for
+        '''
+        if op not in self.OPS:
+            raise ValueError('Unknown spool op: %s' % op)
+
+        resource = dict(resource)
+        resource.pop('id', None)  # IDs are re-resolved at replay time
+        entry = {
+            'ts': time.time(),
+            'op': op,
+            'site_id': site_id,
+            'resource_type': rtype,
+            'key': key,
+            'resource': resource,
+        }
+        self.write_entries([entry])
+
+    def write_entries(self, entries):
+        '''Append already formed entries to the journal, fsync'ing once'''
+        lines = ''.join('%s\n' % serializers.dumps(e) for e in entries)
+        if not lines:
+            return
+        with self.lock():
+            with open(self.journal, 'a') as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def draining_files(self):
+        '''Journals taken by a replay that didn't finish, oldest first'''
+        names = [n for n in os.listdir(self.path)
+                 if n.startswith(DRAINING_PREFIX)]
+        return [os.path.join(self.path, n) for n in sorted(names)]
+
+    def read(self, filenames):
+        '''Yields entries from journal files, skipping torn or bad lines'''
+        for fn in filenames:
+            if not os.path.exists(fn):
+                continue
+            with open(fn) as f:
+                for lineno, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        yield serializers.loads(line)
+                    except ValueError:
+                        self.logger.warning('%s:%d: skipping bad entry',
+                                            fn, lineno)
+
+    def pending(self):
+        '''Coalesced entries waiting to be replayed, without draining them'''
+        with self.lock():
+            files = self.draining_files() + [self.journal]
+            return self.coalesce(self.read(files))
+
+    @contextmanager
+    def drain(self):
+        '''Takes every pending entry out of the journal for replaying
+
+        Yields the coalesced entries. The drained journal files are only
+        removed once the block exits cleanly, so a replay that dies part way
+        is picked back up by the next one. Anything that fails to replay
+        because NSoT is unreachable again is expected to be re-appended.
+        '''
+        with self.lock():
+            if os.path.exists(self.journal):
+                draining = os.path.join(
+                    self.path, '%s%f' % (DRAINING_PREFIX, time.time())
+                )
+                os.rename(self.journal, draining)
+            files = self.draining_files()
+
+        yield self.coalesce(self.read(files))
+
+        for fn in files:
+            os.remove(fn)
+
+    @staticmethod
+    def coalesce(entries):
+        '''Keep only the latest entry for each (site, type, natural key)
+
+        Later writes replace earlier ones entirely, since drivers always
+        stage full resources. Order follows each key's latest write.
+
+        Returns:
+            list: entries
+        '''
+        latest = OrderedDict()
+        for entry in entries:
+            ident = (entry['site_id'], entry['resource_type'], entry['key'])
+            latest.pop(ident, None)
+            latest[ident] = entry
+        return list(latest.values())
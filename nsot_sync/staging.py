@@ -0,0 +1,244 @@
+'''
+Staging
+-------
+
+Out-of-core staging of resources, for runs too big to hold in memory.
+
+Drivers write what they collect into an SQLite database instead of Python
+lists. Duplicates are dropped by the natural key index as they're inserted,
+and what NSoT already has is joined against by natural key to tell creates
+from updates. Writers then read everything back a batch at a time.
+'''
+
+from __future__ import print_function
+import os
+import sqlite3
+import tempfile
+from nsot_sync import serializers
+from nsot_sync.common import natural_key, RESOURCE_TYPES
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS staged (
+    resource_type TEXT NOT NULL,
+    key TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (resource_type, key)
+);
+CREATE INDEX IF NOT EXISTS staged_order ON staged (resource_type, rank, seq);
+CREATE TABLE IF NOT EXISTS attributes (
+    resource_type TEXT NOT NULL,
+    key TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (resource_type, key, name)
+);
+CREATE TABLE IF NOT EXISTS existing (
+    resource_type TEXT NOT NULL,
+    key TEXT NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (resource_type, key)
+);
+'''
+
+# Rows inserted per executemany() call
+CHUNK_SIZE = 5000
+
+
+def rank(rtype, resource):  # -> int
+    '''Sort order within a type, so networks come before those inside them'''
+    if rtype == 'networks':
+        return int(resource['prefix_length'])
+    return 0
+
+
+def same(staged, existing):  # -> bool
+    '''Whether writing staged over the existing NSoT object would change it
+
+    Only fields that were staged are compared. Lists are compared as sets,
+    and values as strings when their types differ (eg a prefix length read
+    from a CSV file).
+    '''
+    for field, value in staged.items():
+        if field in ('id', 'site_id'):
+            continue
+        have = existing.get(field)
+        if isinstance(value, list):
+            value, have = sorted(value), sorted(have or [])
+        if value != have and str(value) != str(have):
+            return False
+    return True
+
+
+class StagingStore(object):
+    '''SQLite-backed staging area for resources, keyed by natural key
+
+    Everything in the database is scratch, and is cleared when opened.
+
+    Attributes:
+        enrich (callable): Called with (type, resource) for each resource as
+            it's staged, eg to add attributes, or None
+
+    Args:
+        path (str): Database file, or None for a temporary one that's
+            removed on .close()
+    '''
+
+    def __init__(self, path=None):
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix='nsot_sync-', suffix='.db')
+            os.close(fd)
+            self.temporary = True
+        else:
+            path = os.path.expanduser(path)
+            self.temporary = False
+        self.path = path
+        self.seq = 0
+        self.enrich = None
+
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=OFF')
+        self.conn.execute('PRAGMA synchronous=OFF')
+        for table in ('staged', 'attributes', 'existing'):
+            self.conn.execute('DROP TABLE IF EXISTS %s' % table)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+        if self.temporary and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def executemany(self, sql, rows):
+        conn = self.conn
+        conn.execute('BEGIN')
+        try:
+            conn.executemany(sql, rows)
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def add(self, items, replace=False):
+        '''Stage (type, resource) tuples from any iterable, in chunks
+
+        Args:
+            items (iterable): (resource type, resource) tuples
+            replace (bool): Whether a resource replaces one staged earlier
+                with the same natural key. By default the first one wins
+        '''
+        verb = replace and 'REPLACE' or 'IGNORE'
+        staged = []
+        attrs = []
+        for rtype, resource in items:
+            resource = dict(resource)
+            if self.enrich is not None:
+                resource['attributes'] = dict(resource.get('attributes') or {})
+                self.enrich(rtype, resource)
+            key = natural_key(rtype, resource)
+            self.seq += 1
+            for name, value in (resource.pop('attributes', None) or
+                                {}).items():
+                attrs.append((rtype, key, name, value, self.seq))
+            staged.append((rtype, key, rank(rtype, resource), self.seq,
+                           serializers.dumps(resource)))
+            if len(staged) >= CHUNK_SIZE:
+                self.flush(verb, staged, attrs)
+                staged, attrs = [], []
+        self.flush(verb, staged, attrs)
+
+    def flush(self, verb, staged, attrs):
+        if verb == 'REPLACE':
+            # Attributes of a replaced resource go with it
+            self.executemany(
+                'DELETE FROM attributes WHERE resource_type = ? AND key = ?',
+                [row[:2] for row in staged]
+            )
+        self.executemany(
+            'INSERT OR %s INTO staged (resource_type, key, rank, seq, body) '
+            'VALUES (?, ?, ?, ?, ?)' % verb, staged
+        )
+        # Only the winning resource's attributes are kept, which is whichever
+        # one's seq made it into staged
+        self.executemany(
+            'INSERT OR REPLACE INTO attributes (resource_type, key, name, '
+            'value) SELECT ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM staged '
+            'WHERE resource_type = ? AND key = ? AND seq = ?)',
+            [(r, k, n, v, r, k, seq) for r, k, n, v, seq in attrs]
+        )
+
+    def add_resources(self, resources, replace=False):
+        '''Stage a dict in .get_resources format'''
+        self.add(((rtype, resource)
+                  for rtype, items in resources.items()
+                  for resource in items), replace=replace)
+
+    def add_existing(self, rtype, items):
+        '''Record NSoT objects, as (natural key, object) tuples'''
+        self.executemany(
+            'INSERT OR REPLACE INTO existing (resource_type, key, body) '
+            'VALUES (?, ?, ?)',
+            ((rtype, key, serializers.dumps(obj)) for key, obj in items)
+        )
+
+    def counts(self):  # -> Dict[str, int]
+        '''Number of staged resources of each type'''
+        counts = dict((rtype, 0) for rtype in RESOURCE_TYPES)
+        counts.update(self.conn.execute(
+            'SELECT resource_type, COUNT(*) FROM staged GROUP BY resource_type'
+        ).fetchall())
+        return counts
+
+    def count(self, rtype, new=None):  # -> int
+        '''Number of staged resources of a type
+
+        Args:
+            new (bool): Only count those NSoT doesn't have (True), or does
+                (False), as recorded by .add_existing()
+        '''
+        sql = ('SELECT COUNT(*) FROM staged s LEFT JOIN existing e ON '
+               'e.resource_type = s.resource_type AND e.key = s.key '
+               'WHERE s.resource_type = ?')
+        if new is True:
+            sql += ' AND e.key IS NULL'
+        elif new is False:
+            sql += ' AND e.key IS NOT NULL'
+        return self.conn.execute(sql, (rtype,)).fetchone()[0]
+
+    def batches(self, rtype, size):
+        '''Yields lists of (key, resource, existing object or None)
+
+        Resources come out in the order staged, except that networks come
+        out shortest prefix first. Only one batch is in memory at a time.
+        '''
+        last = (-1, 0)
+        while True:
+            rows = self.conn.execute(
+                'SELECT s.key, s.body, e.body, s.rank, s.seq FROM staged s '
+                'LEFT JOIN existing e ON e.resource_type = s.resource_type '
+                'AND e.key = s.key WHERE s.resource_type = ? AND '
+                '(s.rank > ? OR (s.rank = ? AND s.seq > ?)) '
+                'ORDER BY s.rank, s.seq LIMIT ?',
+                (rtype, last[0], last[0], last[1], size)
+            ).fetchall()
+            if not rows:
+                return
+            last = rows[-1][3:]
+
+            attrs = {}
+            keys = [row[0] for row in rows]
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                for key, name, value in self.conn.execute(
+                        'SELECT key, name, value FROM attributes WHERE '
+                        'resource_type = ? AND key IN (%s)' %
+                        ','.join('?' * len(chunk)), [rtype] + chunk):
+                    attrs.setdefault(key, {})[name] = value
+
+            batch = []
+            for key, body, existing, _, _ in rows:
+                resource = serializers.loads(body)
+                resource['attributes'] = attrs.get(key, {})
+                existing = existing and serializers.loads(existing) or None
+                batch.append((key, resource, existing))
+            yield batch
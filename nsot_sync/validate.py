@@ -0,0 +1,208 @@
+'''
+Validate
+--------
+
+Local checks for resources NSoT would reject, run before anything is written.
+
+A malformed resource otherwise costs a round trip to find out, and holds up
+whatever depends on it until then. Caught here, it's dropped from the run and
+reported along with every other one that failed the same check:
+
+- Networks that aren't valid CIDRs, or have host bits set
+- Host addresses, as networks or interface addresses, outside any known
+  network, which NSoT refuses as having no base network
+- Interfaces with a malformed MAC address, or the same name as another on
+  the same device, or on a device that was itself dropped
+- Attributes that are missing while required, unknown to the site, or
+  against its constraints
+
+The last two need the site's networks and attribute schema. Without them,
+as for small runs that never list the whole site, those checks are skipped.
+'''
+
+from __future__ import print_function
+import re
+import netaddr
+from nsot_sync.common import NetworkIndex, natural_key, RESOURCE_TYPES
+
+
+def is_host(cidr):  # -> bool
+    '''Whether cidr is a single address, eg 10.0.0.1/32'''
+    net = netaddr.IPNetwork(cidr)
+    return net.prefixlen == (net.version == 4 and 32 or 128)
+
+
+def prefix_length(network):  # -> int
+    try:
+        return int(network['prefix_length'])
+    except (KeyError, TypeError, ValueError):
+        return 0
+
+
+class Validator(object):
+    '''Checks staged resources against the site's schema and networks
+
+    Args:
+        attributes (list): NSoT attribute dicts the site has, or will once
+            REQUIRED_ATTRS are ensured. Later ones win
+        known_attrs (bool): Whether attributes is every attribute of the
+            site, so any other is unknown
+        networks (list): CIDRs of every network in the site, or None if they
+            aren't known, to skip checking addresses have a base network
+    '''
+
+    def __init__(self, attributes=(), known_attrs=False, networks=None):
+        # Later ones win, so the site's own take precedence
+        self.attributes = {}
+        for attr in attributes:
+            rtype = '%ss' % attr['resource_name'].lower()
+            self.attributes[(rtype, attr['name'])] = attr
+        self.required = dict((rtype, []) for rtype in RESOURCE_TYPES)
+        for (rtype, name), attr in sorted(self.attributes.items()):
+            if attr.get('required') and rtype in self.required:
+                self.required[rtype].append(name)
+        self.known_attrs = known_attrs
+        self.index = None
+        if networks is not None:
+            self.index = NetworkIndex()
+            self.add_networks(networks)
+        self.invalid_devices = set()
+        self.interfaces = set()
+
+    def add_networks(self, cidrs):
+        '''Index networks that exist, or will. Host addresses are skipped'''
+        for cidr in cidrs:
+            try:
+                if not is_host(cidr):
+                    self.index.add(cidr)
+            except (netaddr.AddrFormatError, ValueError, TypeError):
+                continue
+
+    def check(self, rtype, resource, key=None):
+        '''Why NSoT would reject resource, or None if it wouldn't
+
+        Valid networks are indexed as they're checked, so their addresses
+        pass after them.
+
+        Args:
+            rtype (str): Resource type, eg 'networks'
+            resource (dict): Staged resource
+            key (str): Its natural key, if already known
+
+        Returns:
+            str: Reason, the same for every resource failing the same check
+        '''
+        try:
+            if key is None:
+                key = natural_key(rtype, resource)
+        except KeyError as e:
+            return 'missing %s' % e.args[0]
+        reason = getattr(self, 'check_%s' % rtype)(resource, key)
+        if reason is None:
+            reason = self.check_attributes(rtype, resource)
+        if reason is None:
+            if rtype == 'networks' and self.index is not None:
+                self.add_networks([key])
+        elif rtype == 'devices':
+            self.invalid_devices.add(key)
+        return reason
+
+    def check_devices(self, device, key):
+        if not device['hostname']:
+            return 'empty hostname'
+
+    def check_networks(self, network, key):
+        try:
+            net = netaddr.IPNetwork(key)
+        except (netaddr.AddrFormatError, ValueError, TypeError):
+            return 'invalid network'
+        if net.ip != net.network:
+            return 'host bits set'
+        if self.index is not None and is_host(key) and \
+                self.index.parent(key) is None:
+            return 'no base network'
+
+    def check_interfaces(self, interface, key):
+        if interface['device'] in self.invalid_devices:
+            return 'device invalid'
+        if not interface['name']:
+            return 'empty name'
+        if key in self.interfaces:
+            return 'duplicate name on device'
+        self.interfaces.add(key)
+        mac = interface.get('mac_address')
+        if mac is not None:
+            try:
+                netaddr.EUI(mac)
+            except (netaddr.AddrFormatError, ValueError, TypeError):
+                return 'invalid MAC address'
+        for cidr in interface.get('addresses') or []:
+            try:
+                netaddr.IPNetwork(cidr)
+            except (netaddr.AddrFormatError, ValueError, TypeError):
+                return 'invalid address'
+            if self.index is not None and self.index.parent(cidr) is None:
+                return 'address outside any known network'
+
+    def check_attributes(self, rtype, resource):
+        attrs = resource.get('attributes') or {}
+        for name in self.required[rtype]:
+            if name not in attrs:
+                return 'missing required attribute %s' % name
+        for name, value in sorted(attrs.items()):
+            attr = self.attributes.get((rtype, name))
+            if attr is None:
+                if self.known_attrs:
+                    return 'unknown attribute %s' % name
+                continue
+            values = value
+            if not attr.get('multi'):
+                if isinstance(value, list):
+                    return 'list for attribute %s' % name
+                values = [value]
+            elif not isinstance(value, list):
+                return 'not a list for attribute %s' % name
+            constraints = attr.get('constraints') or {}
+            valid_values = constraints.get('valid_values')
+            pattern = constraints.get('pattern')
+            for v in values:
+                if not v and not constraints.get('allow_empty'):
+                    return 'empty attribute %s' % name
+                if v and valid_values and v not in valid_values:
+                    return 'invalid value for attribute %s' % name
+                if v and pattern and not re.match(pattern, '%s' % v):
+                    return 'invalid value for attribute %s' % name
+
+    def validate(self, resources):  # -> Tuple[dict, list]
+        '''Splits resources into those NSoT should accept and the rest
+
+        Args:
+            resources (dict): Same format as returned by .get_resources
+
+        Returns:
+            tuple: Valid resources in the same format, and a list of
+                (type, natural key, reason, resource) for the rest
+        '''
+        valid = dict(resources)
+        invalid = []
+        for rtype in RESOURCE_TYPES:
+            if rtype not in resources:
+                continue
+            staged = resources[rtype]
+            order = range(len(staged))
+            if rtype == 'networks':
+                # Parents first, so their children find them indexed
+                order = sorted(order, key=lambda i: prefix_length(staged[i]))
+            failed = set()
+            for i in order:
+                reason = self.check(rtype, staged[i])
+                if reason is None:
+                    continue
+                failed.add(i)
+                try:
+                    key = natural_key(rtype, staged[i])
+                except KeyError:
+                    key = None
+                invalid.append((rtype, key, reason, staged[i]))
+            valid[rtype] = [r for i, r in enumerate(staged) if i not in failed]
+        return valid, invalid
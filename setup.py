@@ -18,11 +18,13 @@ setup(
     include_package_data=True,
     install_requires=[
         'pynsot==1.0',
+        'netaddr==0.7.18',
         'netifaces==0.10.4',
         'coloredlogs==5.0',
     ],
     extras_require={
         'docs': ['sphinx', 'sphinx-autobuild', 'sphinx-rtd-theme'],
+        'fast': ['ujson'],
         'tests': ['pytest'],
     },
     tests_require=['pytest'],
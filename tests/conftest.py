@@ -0,0 +1,57 @@
+import pytest
+import fake_nsot
+from pynsot import dotfile
+from nsot_sync import client
+
+PYNSOTRC = '''[pynsot]
+url = http://%s:%d/api
+auth_method = auth_header
+auth_header = X-NSoT-Email
+default_site = 1
+email = nsot_sync@localhost
+default_domain = localhost
+'''
+
+
+@pytest.fixture
+def nsot(tmpdir, monkeypatch):
+    '''A fake NSoT on localhost, which nsot_sync's client is pointed at
+
+    Yields the fake_nsot.FakeNSoT behind it, to seed and inspect.
+    '''
+    server = fake_nsot.serve()
+    rc = tmpdir.join('pynsotrc')
+    rc.write(PYNSOTRC % server.server_address)
+    rc.chmod(0o600)
+    Dotfile = dotfile.Dotfile
+    monkeypatch.setattr(dotfile, 'Dotfile',
+                        lambda: Dotfile(filepath=str(rc)))
+    monkeypatch.setattr(client, '_client', None)
+    yield server.nsot
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def budget(nsot):
+    '''Asserts the requests made since the last check stay within bounds
+
+    Called with the most requests allowed in total and optionally per
+    method, eg budget(5, POST=0). Fails listing every (method, endpoint)
+    requested, so whatever went over is plain to see. Counts start again
+    after each check.
+    '''
+    def check(total, **methods):
+        calls = nsot.endpoints.copy()
+        nsot.reset_counts()
+        made = '\n'.join('%5d %-6s %s' % (n, method, endpoint)
+                         for (method, endpoint), n in sorted(calls.items()))
+        count = sum(calls.values())
+        assert count <= total, '%d requests, over the budget of %d:\n%s' % (
+            count, total, made)
+        for method, limit in sorted(methods.items()):
+            count = sum(n for (m, _), n in calls.items() if m == method)
+            assert count <= limit, '%d %s requests, over the budget of ' \
+                '%d:\n%s' % (count, method, limit, made)
+        return calls
+    return check
@@ -0,0 +1,233 @@
+'''
+Minimal in-memory NSoT API, for exercising drivers over real HTTP.
+
+Supports what nsot_sync uses: filtered and paginated listing, bulk POST and
+PATCH, DELETE, network children, and auth tokens. Requests are counted by
+(method, resource type) in FakeNSoT.requests, and by (method, endpoint) with
+IDs elided in FakeNSoT.endpoints. Statuses queued in FakeNSoT.errors are
+answered to the next requests instead, and every answer is held back
+FakeNSoT.stall seconds.
+'''
+from __future__ import print_function
+import re
+import json
+import time
+import threading
+import netaddr
+from collections import Counter
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+except ImportError:  # pragma: no cover
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+
+FILTERS = {
+    'devices': ('hostname',),
+    'networks': ('network_address', 'prefix_length', 'ip_version', 'state'),
+    'interfaces': ('device', 'name', 'device__hostname'),
+    'attributes': ('name', 'resource_name'),
+}
+
+
+class FakeNSoT(object):
+    def __init__(self):
+        self.objects = dict((r, {}) for r in FILTERS)
+        self.next_id = 1
+        self.requests = Counter()
+        self.endpoints = Counter()
+        self.lock = threading.Lock()
+        self.tokens = set()
+        self.errors = []
+        self.stall = 0
+
+    def reset_counts(self):
+        self.requests.clear()
+        self.endpoints.clear()
+
+    def count(self, method=None, rtype=None):
+        return sum(n for (m, r), n in self.requests.items()
+                   if (method is None or m == method) and
+                   (rtype is None or r == rtype))
+
+    def create(self, rtype, data):
+        obj = dict(data)
+        obj['id'] = self.next_id
+        obj.setdefault('attributes', {})
+        self.next_id += 1
+        if rtype == 'interfaces':
+            obj['device'] = int(obj['device'])
+            obj.setdefault('addresses', [])
+        if rtype == 'networks':
+            obj['prefix_length'] = int(obj['prefix_length'])
+            obj['parent_id'] = self.parent_of(obj)
+        self.objects[rtype][obj['id']] = obj
+        self.refresh()
+        return obj
+
+    def cidr(self, net):
+        return '%s/%s' % (net['network_address'], net['prefix_length'])
+
+    def parent_of(self, net):
+        me = netaddr.IPNetwork(self.cidr(net))
+        best = None
+        for other in self.objects['networks'].values():
+            o = netaddr.IPNetwork(self.cidr(other))
+            if o.prefixlen < me.prefixlen and me in o:
+                if best is None or o.prefixlen > best[0]:
+                    best = (o.prefixlen, other['id'])
+        return best and best[1]
+
+    def refresh(self):
+        nets = self.objects['networks']
+        by_cidr = dict((self.cidr(n), n) for n in nets.values())
+        for intf in self.objects['interfaces'].values():
+            parents = set()
+            for addr in intf.get('addresses', []):
+                net = by_cidr.get(addr)
+                if net and net.get('parent_id') in nets:
+                    parents.add(self.cidr(nets[net['parent_id']]))
+            intf['networks'] = sorted(parents)
+
+    def match(self, rtype, obj, params):
+        for name, values in params.items():
+            value = values[0]
+            if name == 'cidr':
+                addr, _, plen = value.partition('/')
+                if (obj.get('network_address') != addr or
+                        str(obj.get('prefix_length')) != plen):
+                    return False
+            elif name == 'device__hostname':
+                dev = [d for d in self.objects['devices'].values()
+                       if d['hostname'] == value]
+                if not dev or obj.get('device') != dev[0]['id']:
+                    return False
+            elif name == 'attributes':
+                for v in values:
+                    k, _, v = v.partition('=')
+                    if obj.get('attributes', {}).get(k) != v:
+                        return False
+            elif name in FILTERS.get(rtype, ()):
+                if str(obj.get(name)).lower() != value.lower():
+                    return False
+        return True
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def route(self):
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split('/') if p]
+        # /api/sites/<site>/<rtype>/[<id>/]
+        return parts, parse_qs(url.query)
+
+    def reply(self, status, data=None):
+        body = json.dumps(data).encode('utf-8') if data is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length).decode('utf-8'))
+
+    def handle_any(self, method):
+        nsot = self.server.nsot
+        parts, params = self.route()
+        endpoint = re.sub(r'/[0-9]+(?=/|$)', '/<id>',
+                          '/' + '/'.join(parts) + '/')
+        nsot.endpoints[(method, endpoint)] += 1
+        if parts[:2] == ['api', 'authenticate']:
+            nsot.requests[(method, 'authenticate')] += 1
+            token = 'token-%d' % (len(nsot.tokens) + 1)
+            nsot.tokens.add(token)
+            return self.reply(200, {'auth_token': token})
+        auth = self.headers.get('Authorization') or ''
+        token = auth.rpartition(':')[2]
+        if auth.startswith('AuthToken ') and token not in nsot.tokens:
+            nsot.requests[(method, 'unauthorized')] += 1
+            return self.reply(401, {'error': {'code': 401,
+                                              'message': 'bad token'}})
+        rtype = parts[3] if len(parts) > 3 else None
+        oid = int(parts[4]) if len(parts) > 4 else None
+        sub = parts[5] if len(parts) > 5 else None
+        nsot.requests[(method, rtype)] += 1
+        if nsot.stall:
+            time.sleep(nsot.stall)
+        if getattr(self.server, 'down', False):
+            return self.reply(503, {'error': 'down'})
+        with nsot.lock:
+            if nsot.errors:
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                return self.reply(nsot.errors.pop(0), {'error': 'injected'})
+            store = nsot.objects.get(rtype)
+            if store is None:
+                return self.reply(404, {'error': 'no such endpoint'})
+            if method == 'GET':
+                if sub == 'children':
+                    return self.reply(200, [n for n in store.values()
+                                            if n.get('parent_id') == oid])
+                if oid is not None:
+                    return self.reply(200, store[oid])
+                objs = [o for o in sorted(store.values(),
+                                          key=lambda o: o['id'])
+                        if nsot.match(rtype, o, params)]
+                if 'limit' in params:
+                    limit = int(params['limit'][0])
+                    offset = int(params.get('offset', ['0'])[0])
+                    return self.reply(200, {
+                        'count': len(objs), 'next': None, 'previous': None,
+                        'results': objs[offset:offset + limit]})
+                return self.reply(200, objs)
+            if method == 'POST':
+                data = self.body()
+                if isinstance(data, list):
+                    return self.reply(201, [nsot.create(rtype, d)
+                                            for d in data])
+                return self.reply(201, nsot.create(rtype, data))
+            if method == 'PATCH':
+                data = self.body()
+                updated = []
+                for d in data:
+                    obj = store[d['id']]
+                    obj.update(d)
+                    updated.append(obj)
+                nsot.refresh()
+                return self.reply(200, updated)
+            if method == 'DELETE':
+                store.pop(oid, None)
+                return self.reply(204)
+
+    def do_GET(self):
+        self.handle_any('GET')
+
+    def do_POST(self):
+        self.handle_any('POST')
+
+    def do_PATCH(self):
+        self.handle_any('PATCH')
+
+    def do_DELETE(self):
+        self.handle_any('DELETE')
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def serve(port=0, nsot=None):
+    '''Serves nsot, or a new FakeNSoT, which is handed its own server'''
+    server = Server(('127.0.0.1', port), Handler)
+    server.nsot = nsot or FakeNSoT()
+    server.nsot.server = server
+    server.nsot.url = 'http://%s:%d/api' % server.server_address
+    t = threading.Thread(target=server.serve_forever)
+    t.daemon = True
+    t.start()
+    return server
@@ -0,0 +1,73 @@
+import threading
+import click
+import pytest
+import requests
+from nsot_sync import aggregator
+from nsot_sync.cli import cli
+from nsot_sync.drivers.aggregate import AggregateDriver
+
+
+def host(hostname, address):
+    return {
+        'devices': [{'hostname': hostname, 'attributes': {}}],
+        'networks': [
+            {'network_address': '10.0.0.0', 'prefix_length': 24,
+             'attributes': {}},
+            {'network_address': address, 'prefix_length': 32,
+             'attributes': {}},
+        ],
+        'interfaces': [
+            {'device': hostname, 'name': 'eth0',
+             'addresses': ['%s/32' % address], 'attributes': {}},
+        ],
+    }
+
+
+def test_aggregator(nsot):
+    ctx = click.Context(cli, obj={
+        'SITE_ID': 1, 'NOOP': False, 'PROGRESS_INTERVAL': 0,
+        'EXTRA_ATTRS': {'device_attrs': {}, 'network_attrs': {},
+                        'interface_attrs': {}},
+    })
+    driver = AggregateDriver(click_ctx=ctx)
+    agg = aggregator.Aggregator(lambda site_id, *a: driver.apply(*a),
+                                window=60)
+    server = aggregator.AggregatorServer(('127.0.0.1', 0), agg,
+                                         secret='s3cret')
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = 'http://127.0.0.1:%d%s' % (server.server_port, aggregator.PATH)
+
+    attr = {'name': 'role', 'resource_name': 'Device', 'required': False}
+    try:
+        for hostname, address in [('a', '10.0.0.1'), ('b', '10.0.0.2'),
+                                  ('a', '10.0.0.1')]:
+            result = aggregator.push(url, host(hostname, address), 1,
+                                     required_attrs=[attr], secret='s3cret')
+            assert result == {'queued': 4}
+
+        # Three submissions, shared and resubmitted resources written once
+        agg.flush()
+        assert [len(nsot.objects[r]) for r in
+                ('devices', 'networks', 'interfaces')] == [2, 3, 2]
+        assert nsot.requests[('POST', 'networks')] == 1
+        assert nsot.requests[('POST', 'interfaces')] == 1
+        assert nsot.requests[('POST', 'attributes')] == 2
+
+        # Attributes are ensured once, and an unchanged host's device and
+        # what it owns aren't written again
+        nsot.requests.clear()
+        aggregator.push(url, host('a', '10.0.0.1'), 1,
+                        required_attrs=[attr], secret='s3cret')
+        agg.flush()
+        assert nsot.requests[('POST', 'attributes')] == 0
+        assert nsot.count('POST') == 0
+        assert nsot.requests[('PATCH', 'interfaces')] == 0
+        assert nsot.count() == 4
+
+        with pytest.raises(requests.HTTPError):
+            aggregator.push(url, host('c', '10.0.0.3'), 1, secret='wrong')
+    finally:
+        server.shutdown()
+        server.server_close()
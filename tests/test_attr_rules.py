@@ -0,0 +1,56 @@
+import pytest
+from nsot_sync.attr_rules import RuleSet
+
+RULES = {
+    'devices': [
+        {'match': {'hostname': r'^(?P<dc>[a-z]+)-r(?P<rack>\d+)-'},
+         'attributes': {'dc': '{dc}', 'rack': '{rack}'}},
+    ],
+    'interfaces': [
+        {'match': {'name': r'^vlan(?P<vlan>\d+)$'},
+         'attributes': {'vlan': '{vlan}'}},
+        {'attributes': {'desc': '{name} on {device}'}},
+    ],
+}
+
+
+def test_rule_set():
+    rules = RuleSet(RULES, {'device_attrs': {'owner': 'net{ops}'},
+                            'network_attrs': {}, 'interface_attrs': {}})
+    resources = {
+        'devices': [{'hostname': 'lax-r12-sw1', 'attributes': {'dc': 'x'}},
+                    {'hostname': 'other', 'attributes': {}}],
+        'interfaces': [{'device': 'lax-r12-sw1', 'name': 'vlan100',
+                        'attributes': {}},
+                       {'device': 'other', 'name': 'eth0'}],
+    }
+    rules.apply(resources)
+    assert [d['attributes'] for d in resources['devices']] == [
+        {'dc': 'lax', 'rack': '12', 'owner': 'net{ops}'},
+        {'owner': 'net{ops}'},
+    ]
+    assert [i['attributes'] for i in resources['interfaces']] == [
+        {'vlan': '100', 'desc': 'vlan100 on lax-r12-sw1'},
+        {'desc': 'eth0 on other'},
+    ]
+    assert sorted((a['resource_name'], a['name'])
+                  for a in rules.required_attrs()) == [
+        ('Device', 'dc'), ('Device', 'owner'), ('Device', 'rack'),
+        ('Interface', 'desc'), ('Interface', 'vlan')]
+
+
+def test_empty_values():
+    # Rules leave out what renders empty, --device-attrs foo= still sets it
+    rules = RuleSet({'devices': [{'attributes': {'blank': '',
+                                                 'dc': '{nope}'}}]},
+                    {'device_attrs': {'foo': ''}})
+    device = rules.apply_one('devices', {'hostname': 'a'})
+    assert device['attributes'] == {'foo': ''}
+
+
+def test_rule_set_invalid():
+    for rules in ({'routers': []},
+                  {'devices': [{'match': {'hostname': '('}}]},
+                  {'devices': [{'attributes': {'dc': '{0.real}'}}]}):
+        with pytest.raises(ValueError):
+            RuleSet(rules)
@@ -0,0 +1,133 @@
+'''
+Request budgets for common runs, so a change that adds requests per resource
+fails here rather than being noticed against a real NSoT.
+'''
+import click
+import netifaces
+from nsot_sync.cli import cli
+from nsot_sync.drivers.aggregate import AggregateDriver
+from nsot_sync.drivers.replay import ReplayDriver
+from nsot_sync.drivers.simple import SimpleDriver
+from nsot_sync.spool import Spool
+
+# Hosts and the interfaces each has: name to (MAC, IPv4 address)
+HOSTS = dict(('host%d' % h, dict(
+    ('eth%d' % i, ('00:00:5e:00:%02x:%02x' % (h, i), '10.%d.%d.1' % (h, i)))
+    for i in range(4))) for h in range(3))
+
+
+def context(**obj):
+    defaults = {
+        'SITE_ID': 1, 'NOOP': False, 'PROGRESS_INTERVAL': 0, 'WORKERS': 1,
+        'TOKEN_CACHE': '', 'EXTRA_ATTRS': {'device_attrs': {},
+                                           'network_attrs': {},
+                                           'interface_attrs': {}},
+    }
+    defaults.update(obj)
+    return click.Context(cli, obj=defaults)
+
+
+def seed(nsot):
+    nsot.create('networks', {'network_address': '10.0.0.0',
+                             'prefix_length': 8, 'site_id': 1})
+    nsot.reset_counts()
+
+
+class Host(SimpleDriver):
+    '''SimpleDriver reporting HOSTS['host0'] rather than this host'''
+
+    USE_NETLINK = False
+    interfaces = HOSTS['host0']
+
+    def __init__(self, *args, **kwargs):
+        super(Host, self).__init__(*args, **kwargs)
+        self.hostname = self.node = 'host0'
+
+    def get_ifaddresses(self):
+        return dict((name, {
+            netifaces.AF_LINK: [{'addr': mac}],
+            netifaces.AF_INET: [{'addr': addr, 'netmask': '255.255.255.0'}],
+        }) for name, (mac, addr) in self.interfaces.items())
+
+
+def sync_host(interfaces=None):
+    driver = Host(click_ctx=context())
+    if interfaces is not None:
+        driver.interfaces = interfaces
+    driver.handle_resources()
+    return driver
+
+
+def test_simple_driver_budget(nsot, budget):
+    seed(nsot)
+
+    # Attributes, a lookup per address since nothing of the host is known
+    # yet, one write per resource, and the fingerprint
+    sync_host()
+    budget(23, POST=13)
+
+    # Unchanged, so just the attributes and the device's fingerprint
+    sync_host()
+    budget(5, POST=0, PATCH=0)
+
+    # A changed host has what it owns fetched in a few requests, and
+    # written one request per resource
+    changed = dict(HOSTS['host0'], eth1=('00:00:5e:00:00:01', '10.0.9.1'))
+    sync_host(changed)
+    budget(20, POST=1, PATCH=9)
+
+    # Losing an interface is a change like any other, nothing is deleted
+    pruned = dict((k, v) for k, v in HOSTS['host0'].items() if k != 'eth3')
+    sync_host(pruned)
+    budget(17, POST=0, PATCH=8)
+
+
+def host(hostname, interfaces):
+    resources = {'devices': [{'hostname': hostname, 'attributes': {}}],
+                 'networks': [], 'interfaces': []}
+    for name, (mac, addr) in sorted(interfaces.items()):
+        resources['networks'].append({
+            'network_address': addr, 'prefix_length': 32, 'is_ip': True,
+            'state': 'assigned', 'attributes': {}})
+        resources['interfaces'].append({
+            'device': hostname, 'name': name, 'mac_address': mac,
+            'addresses': ['%s/32' % addr], 'attributes': {}})
+    return resources
+
+
+def fleet(hosts):
+    merged = dict((rtype, []) for rtype in ('devices', 'networks',
+                                            'interfaces'))
+    for hostname, interfaces in sorted(hosts.items()):
+        for rtype, items in host(hostname, interfaces).items():
+            merged[rtype].extend(items)
+    return merged
+
+
+def test_bulk_driver_budget(nsot, budget, tmpdir):
+    seed(nsot)
+    driver = AggregateDriver(click_ctx=context())
+
+    # One write per type, after a lookup per device and per new address
+    driver.apply(fleet(HOSTS))
+    budget(21, POST=4)
+
+    # Unchanged hosts cost a device lookup each
+    driver.apply(fleet(HOSTS))
+    budget(4, POST=0, PATCH=0)
+
+    hosts = dict(HOSTS)
+    hosts['host1'] = dict(hosts['host1'],
+                          eth1=('00:00:5e:00:01:01', '10.1.9.1'))
+    driver.apply(fleet(hosts))
+    budget(13, POST=1, PATCH=4)
+
+    # Deleting a host's interfaces, as replayed from the spool, costs a
+    # lookup and a DELETE each
+    spool = Spool(str(tmpdir.join('spool')))
+    for name in sorted(HOSTS['host2']):
+        spool.append('delete', 'interfaces', 'host2:%s' % name,
+                     {'device': 'host2', 'name': name}, 1)
+    ReplayDriver(click_ctx=context(SPOOL_DIR=spool.path)).handle_resources()
+    budget(9, DELETE=4)
+    assert len(nsot.objects['interfaces']) == 8
@@ -0,0 +1,62 @@
+import click
+from nsot_sync.cache import LookupCache
+from nsot_sync.cli import cli
+from nsot_sync.drivers.base_driver import BaseDriver
+
+
+def test_read_write_expire(tmpdir):
+    path = str(tmpdir.join('cache.db'))
+    cache = LookupCache(path, ttl=60)
+    cache.set(1, 'devices', 'foo', {'id': 4, 'hostname': 'foo'})
+
+    # Another run on the same host sees it through its own connection
+    sibling = LookupCache(path, ttl=60)
+    assert sibling.get(1, 'devices', 'foo') == {'id': 4, 'hostname': 'foo'}
+    assert sibling.get(2, 'devices', 'foo') is None
+
+    sibling.invalidate(1, 'devices', 'foo')
+    assert cache.get(1, 'devices', 'foo') is None
+
+    cache.ttl = -1
+    cache.set(1, 'devices', 'bar', {'id': 5, 'hostname': 'bar'})
+    assert cache.get(1, 'devices', 'bar') is None
+
+
+class Driver(BaseDriver):
+    FINGERPRINT = False
+    REQUIRED_ATTRS = [{'name': 'desc', 'resource_name': 'Device',
+                       'required': False}]
+
+    def get_resources(self):
+        return {
+            'devices': [{'hostname': 'foo', 'attributes': {'desc': 'foo'}}],
+            'networks': [{'network_address': '10.0.0.1', 'prefix_length': 32,
+                          'attributes': {}}],
+            'interfaces': [{'device': 'foo', 'name': 'eth0',
+                            'addresses': ['10.0.0.1/32'], 'attributes': {}}],
+        }
+
+
+def sync(cache=None):
+    ctx = click.Context(cli, obj={
+        'SITE_ID': 1, 'NOOP': False, 'PROGRESS_INTERVAL': 0,
+        'EXTRA_ATTRS': {}, 'WORKERS': 1, 'TOKEN_CACHE': '', 'CACHE': cache,
+    })
+    Driver(click_ctx=ctx).handle_resources()
+
+
+def test_driver_lookups(nsot, tmpdir, budget):
+    path = str(tmpdir.join('cache.db'))
+    sync(path)
+    nsot.reset_counts()
+
+    # A run without the cache looks up the attribute and the network
+    sync()
+    budget(7, GET=4)
+
+    # One with it finds both in what the first run cached. The device and
+    # its interfaces are still prefetched
+    sync(path)
+    calls = budget(5, GET=2)
+    assert ('GET', '/api/sites/<id>/attributes/') not in calls
+    assert ('GET', '/api/sites/<id>/networks/') not in calls
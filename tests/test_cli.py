@@ -9,6 +9,9 @@ def test_basic_exec():
         'main_help': runner.invoke(cli, ['--help']),
         'simple_help': runner.invoke(cli, ['--help', 'simple']),
         'facter_help': runner.invoke(cli, ['--help', 'facter']),
+        'replay_help': runner.invoke(cli, ['--help', 'replay']),
+        'run_help': runner.invoke(cli, ['--help', 'run']),
+        'serve_help': runner.invoke(cli, ['--help', 'serve']),
     }
     exit_codes = set(result.exit_code for result in results.values())
     all_zero = len(exit_codes) == 1 and 0 in exit_codes
@@ -0,0 +1,70 @@
+import os
+import stat
+import pytest
+from pynsot import dotfile
+from pynsot.util import get_result
+from nsot_sync.client import TOKEN_MARGIN, TokenCache, make_client
+
+Dotfile = dotfile.Dotfile
+
+PYNSOTRC = '''[pynsot]
+url = %s
+auth_method = auth_token
+email = me@localhost
+secret_key = secret
+default_site = 1
+'''
+
+
+def test_token_cache(tmpdir):
+    path = str(tmpdir.join('nsot_sync', 'tokens'))
+    cache = TokenCache(path, expiry=600)
+    assert cache.get('http://nsot/api', 'me@localhost') is None
+
+    cache.set('http://nsot/api', 'me@localhost', 'abc')
+    assert cache.get('http://nsot/api', 'me@localhost') == 'abc'
+    assert cache.get('http://nsot/api', 'you@localhost') is None
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+    # Tokens about to expire aren't handed out
+    cache.expiry = 30
+    assert cache.get('http://nsot/api', 'me@localhost') is None
+
+    cache.expiry = 600
+    cache.invalidate('http://nsot/api', 'me@localhost')
+    assert cache.get('http://nsot/api', 'me@localhost') is None
+
+
+@pytest.fixture
+def auth_token(nsot, tmpdir, monkeypatch):
+    '''Points the client at the fake NSoT, logging in with auth_token'''
+    rc = tmpdir.join('pynsotrc_token')
+    rc.write(PYNSOTRC % nsot.url)
+    rc.chmod(0o600)
+    monkeypatch.setattr(dotfile, 'Dotfile',
+                        lambda: Dotfile(filepath=str(rc)))
+    return str(tmpdir.join('tokens'))
+
+
+def devices(token_cache):
+    site = make_client(token_cache=token_cache).sites(1)
+    return get_result(site.devices.get())
+
+
+def test_cached_token(nsot, auth_token):
+    # Only the first client logs in
+    assert devices(TokenCache(auth_token)) == []
+    assert devices(TokenCache(auth_token)) == []
+    assert nsot.requests[('POST', 'authenticate')] == 1
+
+    # A rejected token is replaced, and the request sent again once
+    nsot.tokens.clear()
+    assert devices(TokenCache(auth_token)) == []
+    assert nsot.requests[('GET', 'unauthorized')] == 1
+    assert nsot.requests[('POST', 'authenticate')] == 2
+    assert TokenCache(auth_token).get(nsot.url, 'me@localhost') in nsot.tokens
+
+    # As is one about to expire, before it's used
+    assert devices(TokenCache(auth_token, expiry=TOKEN_MARGIN)) == []
+    assert nsot.requests[('POST', 'authenticate')] == 3
+    assert nsot.requests[('GET', 'unauthorized')] == 1
@@ -0,0 +1,147 @@
+import json
+import click
+from io import BytesIO
+from nsot_sync.cli import cli
+from nsot_sync.drivers.csvimport import (PRESETS, CSVImportDriver, Row,
+                                         compile_mapping, normalize_network,
+                                         read_rows)
+
+
+def test_normalize_network():
+    net = normalize_network({'network_address': '10.1.2.3',
+                             'prefix_length': '255.255.255.0'})
+    assert net == {'network_address': '10.1.2.0', 'prefix_length': 24,
+                   'is_ip': False}
+    net = normalize_network({'network_address': '2001:db8::1'})
+    assert net['prefix_length'] == 128 and net['is_ip']
+    net = normalize_network({'network_address': '10.0.0.0/8'})
+    assert net['prefix_length'] == 8
+
+
+def test_infoblox_rules():
+    rules = compile_mapping(PRESETS['infoblox'])
+    row = Row({'header-hostrecord': 'hostrecord', 'fqdn*': 'web1',
+               'addresses': '10.0.0.1, 10.0.0.2', 'comment': ''})
+    made = [(rule.rtype, r) for rule in rules for r in rule.apply(row)]
+    assert made == [
+        ('devices', {'hostname': 'web1', 'attributes': {}}),
+        ('networks', {'network_address': '10.0.0.1',
+                      'attributes': {'desc': 'web1'}}),
+        ('networks', {'network_address': '10.0.0.2',
+                      'attributes': {'desc': 'web1'}}),
+    ]
+
+    # Network rules don't match host rows, and vice versa
+    row = Row({'header-network': 'network', 'address*': '10.0.0.0',
+               'netmask*': '255.0.0.0', 'comment': 'ten'})
+    made = [(rule.rtype, r) for rule in rules for r in rule.apply(row)]
+    assert made == [('networks', {'network_address': '10.0.0.0',
+                                  'prefix_length': '255.0.0.0',
+                                  'attributes': {'desc': 'ten'}})]
+
+
+def test_mixed_headers():
+    f = BytesIO(b'\xef\xbb\xbfheader-network,address*\n'
+                b'network,10.0.0.0\n'
+                b'header-hostrecord,fqdn*\n'
+                b'hostrecord,web1\n'
+                b'network,10.1.0.0\n')
+    rows = [row for _, row in read_rows(f)]
+    assert rows == [
+        {'header-network': 'network', 'address*': '10.0.0.0'},
+        {'header-hostrecord': 'hostrecord', 'fqdn*': 'web1'},
+        {'header-network': 'network', 'address*': '10.1.0.0'},
+    ]
+
+
+MAPPING = {
+    'networks': [
+        {'when': {'Type': 'subnet'},
+         'fields': {'network_address': '{Address}',
+                    'prefix_length': '{CIDR}'}},
+        {'when': {'Type': 'host'},
+         'fields': {'network_address': '{Address}'},
+         'attributes': {'desc': '{Host}'}},
+    ],
+    'devices': [{'when': {'Type': 'host'}, 'fields': {'hostname': '{Host}'}}],
+}
+
+# Seven resources once the repeated subnet and device are dropped
+EXPORT = (b'Type,Address,CIDR,Host\n'
+          b'subnet,10.0.0.0,24,\n'
+          b'host,10.0.0.5,,web1\n'
+          b'host,10.0.0.6,,web2\n'
+          b'subnet,10.0.0.0,24,\n'
+          b'subnet,10.1.0.0,16,\n'
+          b'host,10.1.0.5,,web1\n')
+
+
+class FirstBatchOnly(object):
+    '''Deadline that's up once the first batch has started'''
+
+    checks = 0
+
+    def expired(self):
+        self.checks += 1
+        return self.checks > 1
+
+
+def make_driver():
+    ctx = click.Context(cli, obj={
+        'SITE_ID': 1, 'NOOP': False, 'PROGRESS_INTERVAL': 0,
+        'EXTRA_ATTRS': {}, 'WORKERS': 1, 'TOKEN_CACHE': '',
+    })
+    driver = CSVImportDriver(click_ctx=ctx, files=[BytesIO(EXPORT)],
+                             mapping=MAPPING, batch_size=3)
+    driver.SCOPED_FETCH_MAX = 2
+    return driver
+
+
+def test_batches(nsot):
+    batches = [dict((k, v) for k, v in b.items() if v)
+               for b in make_driver().batches()]
+    assert [sum(len(v) for v in b.values()) for b in batches] == [3, 3, 1]
+    assert batches[0]['devices'] == [{'hostname': 'web1', 'attributes': {}}]
+
+    # Networks come before those inside them within a batch
+    assert [n['network_address'] for n in batches[1]['networks']] == [
+        '10.1.0.0', '10.0.0.6']
+
+
+def test_import(nsot):
+    make_driver().handle_resources()
+    assert sorted(d['hostname'] for d in nsot.objects['devices'].values()
+                  ) == ['web1', 'web2']
+    assert sorted('%(network_address)s/%(prefix_length)s' % n
+                  for n in nsot.objects['networks'].values()) == [
+        '10.0.0.0/24', '10.0.0.5/32', '10.0.0.6/32', '10.1.0.0/16',
+        '10.1.0.5/32']
+
+    # The first batch lists the site, after which batches only write: one
+    # request per type in each. Attributes are listed again to validate
+    assert sorted(nsot.requests.items()) == [
+        (('GET', 'attributes'), 2), (('GET', 'devices'), 1),
+        (('GET', 'interfaces'), 1), (('GET', 'networks'), 1),
+        (('POST', 'attributes'), 1), (('POST', 'devices'), 2),
+        (('POST', 'networks'), 3)]
+
+
+def test_deadline(nsot):
+    driver = make_driver()
+    driver.deadline = FirstBatchOnly()
+    driver.handle_resources()
+    assert [d['hostname'] for d in nsot.objects['devices'].values()
+            ] == ['web1']
+    assert len(nsot.objects['networks']) == 2
+
+
+def test_noop_ndjson(nsot, capfd):
+    driver = make_driver()
+    driver.click_ctx.obj.update(NOOP=True, OUTPUT_FORMAT='ndjson')
+    driver.noop()
+    out = capfd.readouterr()[0]
+    lines = [json.loads(line) for line in out.splitlines()]
+    assert len(lines) == 7
+    assert sorted(line['resource']['hostname'] for line in lines
+                  if line['resource_type'] == 'devices') == ['web1', 'web2']
+    assert nsot.count() == 0
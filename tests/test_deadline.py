@@ -0,0 +1,91 @@
+import click
+from nsot_sync import deadline
+from nsot_sync.cli import cli
+from nsot_sync.drivers.base_driver import BaseDriver
+from nsot_sync.deadline import (CHANGED, DEVICES, UNCHANGED, Deadline,
+                                ResumeFile, priority)
+
+
+def test_priority():
+    net = {'network_address': '10.0.0.0', 'prefix_length': 24,
+           'attributes': {}}
+    existing = dict(net, id=1, state='allocated')
+    intf = {'device': 'foo', 'name': 'eth0', 'attributes': {}}
+
+    assert priority('devices', {'hostname': 'foo'}, None) == (DEVICES, True)
+    assert priority('networks', net, None) == (CHANGED, True)
+    assert priority('networks', net, existing) == (UNCHANGED, True)
+    assert priority('networks', net, existing, resumed=True) == (
+        UNCHANGED, False)
+    assert priority('interfaces', intf, dict(intf, device=4)) == (
+        UNCHANGED, True)
+    assert sorted([(UNCHANGED, True), (UNCHANGED, False), (CHANGED, True)]) \
+        == [(CHANGED, True), (UNCHANGED, False), (UNCHANGED, True)]
+
+
+def test_deadline():
+    assert not Deadline(60, margin=1).expired()
+    deadline = Deadline(60)
+    deadline.started -= 55
+    assert deadline.expired()
+    deadline.started += 55
+    assert deadline.expired()
+
+
+def test_resume_file(tmpdir):
+    resume = ResumeFile(str(tmpdir.join('resume', 'simpledriver-1.json')))
+    assert resume.load() == set()
+    resume.save(set([('networks', '10.0.0.0/24')]))
+    assert resume.load() == set([('networks', '10.0.0.0/24')])
+    resume.save(set())
+    assert not tmpdir.join('resume', 'simpledriver-1.json').exists()
+
+
+class Driver(BaseDriver):
+    '''Syncs .addresses, running out of time after .budget writes'''
+
+    FINGERPRINT = False
+    budget = None
+
+    def get_resources(self):
+        return {'networks': [{'network_address': addr, 'prefix_length': 32,
+                              'attributes': {}} for addr in self.addresses]}
+
+    def handle_network(self, network):
+        self.written.append(network['network_address'])
+        super(Driver, self).handle_network(network)
+        if self.budget is not None and len(self.written) >= self.budget:
+            self.deadline.passed = True
+
+
+def sync(addresses, budget=None):
+    ctx = click.Context(cli, obj={
+        'SITE_ID': 1, 'NOOP': False, 'PROGRESS_INTERVAL': 0, 'DEADLINE': 600,
+        'EXTRA_ATTRS': {}, 'WORKERS': 1, 'TOKEN_CACHE': '',
+    })
+    driver = Driver(click_ctx=ctx)
+    driver.addresses = addresses
+    driver.budget = budget
+    driver.written = []
+    driver.handle_resources()
+    return driver
+
+
+def test_deadline_resume(nsot, tmpdir, monkeypatch):
+    monkeypatch.setattr(deadline, 'RESUME_DIR', str(tmpdir))
+    first = ['10.0.0.%d' % i for i in range(5, 10)]
+    driver = sync(first, budget=2)
+    assert len(nsot.objects['networks']) == 2
+    left = set(first) - set(driver.written)
+    assert driver.deferred == set(('networks', '%s/32' % a) for a in left)
+    assert driver.report.counts[('networks', 'deferred')] == 3
+    assert ResumeFile.for_driver(driver).load() == driver.deferred
+
+    # What was left goes first, ahead of what's new this run
+    # What was left goes first, ahead of what's new this run, and with
+    # everything done there's nothing left to resume
+    driver = sync(['10.0.0.1', '10.0.0.2'] + first)
+    assert set(driver.written[:3]) == left
+    assert driver.written[3:5] == ['10.0.0.1', '10.0.0.2']
+    assert len(nsot.objects['networks']) == 7
+    assert ResumeFile.for_driver(driver).load() == set()
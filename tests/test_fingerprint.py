@@ -0,0 +1,36 @@
+from nsot_sync.fingerprint import ATTR_NAME, fingerprints
+
+
+def staged():
+    return {
+        'devices': [{'hostname': 'foo', 'attributes': {}}],
+        'networks': [
+            {'network_address': '10.0.0.1', 'prefix_length': 32,
+             'attributes': {}},
+            {'network_address': '10.0.0.0', 'prefix_length': 24,
+             'attributes': {}},
+        ],
+        'interfaces': [
+            {'device': 'foo', 'name': 'eth0', 'addresses': ['10.0.0.1/32'],
+             'attributes': {}},
+            {'device': 'foo', 'name': 'eth1', 'addresses': [],
+             'attributes': {}},
+        ],
+    }
+
+
+def test_fingerprints():
+    digest, owned = fingerprints(staged())['foo']
+    assert owned == set([('devices', 'foo'), ('interfaces', 'foo:eth0'),
+                         ('interfaces', 'foo:eth1'),
+                         ('networks', '10.0.0.1/32')])
+
+    # Order, IDs, and the fingerprint itself don't count
+    resources = staged()
+    resources['interfaces'].reverse()
+    resources['devices'][0].update(id=4, site_id=1)
+    resources['devices'][0]['attributes'][ATTR_NAME] = digest
+    assert fingerprints(resources)['foo'][0] == digest
+
+    resources['interfaces'][1]['addresses'] = []
+    assert fingerprints(resources)['foo'][0] != digest
@@ -0,0 +1,97 @@
+import socket
+import struct
+import netifaces
+import pytest
+from nsot_sync import netlink
+
+
+def rtattr(kind, value):
+    length = netlink.RTATTR.size + len(value)
+    pad = b'\0' * (netlink.align(length) - length)
+    return netlink.RTATTR.pack(length, kind) + value + pad
+
+
+def message(kind, body):
+    return netlink.NLMSGHDR.pack(netlink.NLMSGHDR.size + len(body), kind, 2,
+                                 1, 0) + body
+
+
+def link(index, name, mac=None):
+    body = netlink.IFINFOMSG.pack(socket.AF_UNSPEC, 1, index, 0, 0)
+    body += rtattr(netlink.IFLA_IFNAME, name + b'\0')
+    if mac is not None:
+        body += rtattr(netlink.IFLA_ADDRESS, mac)
+    return message(netlink.RTM_NEWLINK, body)
+
+
+def address(index, addr, family=socket.AF_INET, label=None, peer=None):
+    body = netlink.IFADDRMSG.pack(family, 24, 0, 0, index)
+    raw = socket.inet_pton(family, addr)
+    if peer is not None:
+        body += rtattr(netlink.IFA_ADDRESS, socket.inet_pton(family, peer))
+        body += rtattr(netlink.IFA_LOCAL, raw)
+    else:
+        body += rtattr(netlink.IFA_ADDRESS, raw)
+    if label is not None:
+        body += rtattr(netlink.IFA_LABEL, label + b'\0')
+    return message(netlink.RTM_NEWADDR, body)
+
+
+def error(errno):
+    return message(netlink.NLMSG_ERROR, struct.pack('=i', errno) +
+                   b'\0' * netlink.NLMSGHDR.size)
+
+
+DONE = message(netlink.NLMSG_DONE, struct.pack('=i', 0))
+
+
+class FakeSocket(object):
+    '''Answers each recv() with the next of the datagrams given'''
+
+    def __init__(self, *datagrams):
+        self.datagrams = list(datagrams)
+        self.sent = []
+
+    def send(self, data):
+        self.sent.append(data)
+
+    def recv(self, size):
+        return self.datagrams.pop(0)
+
+
+def test_read_ifaddresses():
+    sock = FakeSocket(
+        link(1, b'lo') + link(2, b'eth0', b'\x00\x00\x5e\x00\x53\x01') + DONE,
+        # Replies can span several datagrams, and acks are skipped
+        address(2, '10.0.0.1', label=b'eth0') +
+        address(2, '10.0.0.2', label=b'eth0:1') + error(0),
+        address(2, 'fe80::1', family=socket.AF_INET6) +
+        address(1, '127.0.0.1', label=b'lo', peer='127.0.0.9') +
+        address(7, '10.9.9.9') + DONE,
+    )
+    assert netlink.read_ifaddresses(sock) == {
+        'lo': {netifaces.AF_INET: [{'addr': '127.0.0.1'}]},
+        'eth0': {
+            netifaces.AF_LINK: [{'addr': '00:00:5e:00:53:01'}],
+            netifaces.AF_INET: [{'addr': '10.0.0.1'}],
+            netifaces.AF_INET6: [{'addr': 'fe80::1'}],
+        },
+        # Aliases are their own interface, as netifaces has them
+        'eth0:1': {netifaces.AF_INET: [{'addr': '10.0.0.2'}]},
+    }
+    assert [struct.unpack_from('=H', m, 4)[0] for m in sock.sent] == [
+        netlink.RTM_GETLINK, netlink.RTM_GETADDR]
+
+
+def test_dump_errors():
+    sock = FakeSocket(link(1, b'lo') + error(-1))
+    with pytest.raises(netlink.NetlinkError):
+        list(netlink.dump(sock, netlink.RTM_GETLINK, b'', 1))
+
+    sock = FakeSocket(link(1, b'lo')[:-4])
+    with pytest.raises(netlink.NetlinkError):
+        list(netlink.dump(sock, netlink.RTM_GETLINK, b'', 1))
+
+    # An attribute shorter than its own header ends them
+    assert netlink.parse_attrs(rtattr(1, b'ab') + struct.pack('=HH', 0, 2),
+                               0) == {1: b'ab'}
@@ -0,0 +1,65 @@
+import click
+from click.testing import CliRunner
+from nsot_sync.cli import cli
+from nsot_sync.drivers.pipeline import (find_driver, merge_resources,
+                                        PipelineDriver)
+from nsot_sync.drivers.simple import SimpleDriver
+
+
+def test_find_driver():
+    assert find_driver('simple') is SimpleDriver
+    for name in ('nope', 'pipeline', 'base_driver'):
+        try:
+            find_driver(name)
+        except ValueError:
+            pass
+        else:
+            assert False, '%s is not a driver' % name
+
+
+def test_merge_resources():
+    collected = {
+        'devices': [{'hostname': 'foo', 'attributes': {'desc': 'foo'}}],
+        'networks': [],
+        'interfaces': [
+            {'device': 'foo', 'name': 'eth0', 'addresses': ['10.0.0.1/32'],
+             'attributes': {'desc': 'eth0'}},
+        ],
+    }
+    layered = {
+        'devices': [{'hostname': 'foo', 'attributes': {'role': 'web'}}],
+        'interfaces': [
+            {'device': 'foo', 'name': 'eth0',
+             'attributes': {'desc': 'uplink'}},
+            {'device': 'foo', 'name': 'eth1', 'attributes': {}},
+        ],
+    }
+    merged = merge_resources([collected, layered])
+    assert merged['devices'] == [
+        {'hostname': 'foo', 'attributes': {'desc': 'foo', 'role': 'web'}}]
+    assert merged['interfaces'][0] == {
+        'device': 'foo', 'name': 'eth0', 'addresses': ['10.0.0.1/32'],
+        'attributes': {'desc': 'uplink'}}
+    assert [i['name'] for i in merged['interfaces']] == ['eth0', 'eth1']
+    assert merged['networks'] == []
+
+
+def test_run_refuses_drivers_needing_options():
+    runner = CliRunner()
+    for name in ('csvimport', 'replay', 'aggregate'):
+        result = runner.invoke(cli, ['run', 'simple', name], obj={})
+        assert result.exit_code == 2
+        assert '%s needs options of its own' % name in result.output
+
+
+def test_collect_only(nsot):
+    ctx = click.Context(cli, obj={
+        'SITE_ID': 1, 'NOOP': False, 'PROGRESS_INTERVAL': 0,
+        'EXTRA_ATTRS': {}, 'WORKERS': 1, 'TOKEN_CACHE': '',
+    })
+    driver = PipelineDriver(click_ctx=ctx, drivers=[
+        SimpleDriver(click_ctx=ctx, collect_only=True)])
+
+    # Only the pipeline prints a summary
+    assert ctx._close_callbacks == [driver.report.summary]
+    assert driver.get_resources()['devices'][0]['hostname']
@@ -0,0 +1,75 @@
+import click
+from nsot_sync.cli import cli
+from nsot_sync.drivers.base_driver import BaseDriver
+
+
+class Driver(BaseDriver):
+    def get_resources(self):
+        return {}
+
+
+def network(cidr):
+    address, plen = cidr.split('/')
+    return {'network_address': address, 'prefix_length': int(plen),
+            'attributes': {}}
+
+
+def seed(nsot):
+    '''Device foo with eth0, its address inside 10.0.0.0/24'''
+    foo = nsot.create('devices', {'hostname': 'foo'})
+    for cidr in ('10.0.0.0/24', '10.0.0.1/32', '10.0.0.2/32', '10.0.0.3/32'):
+        nsot.create('networks', network(cidr))
+    nsot.create('interfaces', {'device': foo['id'], 'name': 'eth0',
+                               'addresses': ['10.0.0.1/32']})
+    nsot.reset_counts()
+
+
+def staged(*cidrs):
+    return {
+        'devices': [{'hostname': 'foo'}, {'hostname': 'bar'}],
+        'interfaces': [{'device': 'foo', 'name': 'eth0'},
+                       {'device': 'foo', 'name': 'eth1'},
+                       {'device': 'bar', 'name': 'eth0'}],
+        'networks': [network(cidr) for cidr in cidrs],
+    }
+
+
+def prefetch(resources):
+    ctx = click.Context(cli, obj={
+        'SITE_ID': 1, 'NOOP': False, 'PROGRESS_INTERVAL': 0,
+        'EXTRA_ATTRS': {}, 'WORKERS': 1, 'TOKEN_CACHE': '',
+    })
+    driver = Driver(click_ctx=ctx)
+    driver.prefetch_scoped(resources)
+    return driver.prefetched
+
+
+def test_prefetch_scoped(nsot):
+    seed(nsot)
+    found = prefetch(staged('10.0.0.1/32', '10.0.0.2/32', '10.0.0.3/32',
+                            '10.9.9.9/32'))
+
+    # Misses of devices and their interfaces are known, as everything of a
+    # device found was listed
+    assert found['devices']['bar'] is None
+    assert found['devices']['foo']['hostname'] == 'foo'
+    assert found['interfaces']['foo:eth0']['name'] == 'eth0'
+    assert found['interfaces']['foo:eth1'] is None
+    assert found['interfaces']['bar:eth0'] is None
+
+    # More addresses than twice their parents, so the parent's children are
+    # listed. Networks it doesn't have are left for a lookup of their own
+    assert sorted(found['networks']) == [
+        '10.0.0.1/32', '10.0.0.2/32', '10.0.0.3/32']
+    assert sorted(nsot.requests.items()) == [
+        (('GET', 'devices'), 2), (('GET', 'interfaces'), 1),
+        (('GET', 'networks'), 2)]
+
+
+def test_prefetch_scoped_few_networks(nsot):
+    seed(nsot)
+
+    # Listing the parent would cost as much as looking them up
+    found = prefetch(staged('10.0.0.1/32', '10.0.0.2/32'))
+    assert found['networks'] == {}
+    assert nsot.count('GET', 'networks') == 0
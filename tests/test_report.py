@@ -0,0 +1,22 @@
+from nsot_sync.report import Reporter, Sample
+
+
+def test_sample():
+    assert str(Sample(['a', 'b'], 3)) == 'a, b'
+    assert str(Sample(['a', 'b', 'c', 'd', 'e'], 3)) == 'a, b, c and 2 more'
+
+
+def test_counts(capsys):
+    report = Reporter(interval=0)
+    report.expect({'devices': [{}], 'networks': [{}, {}], 'interfaces': []})
+    report.record('devices', 'updated', ['foo'])
+    report.record('networks', 'created', ['10.0.0.1/32', '10.0.0.2/32'])
+    report.record('networks', 'failed', [])
+    assert report.expected == 3
+    assert report.done() == 3
+
+    report.summary()
+    err = capsys.readouterr()[1]
+    assert 'devices: 1 updated' in err
+    assert 'networks: 2 created' in err
+    assert 'failed' not in err
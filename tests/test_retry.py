@@ -0,0 +1,128 @@
+import click
+import pytest
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, ContentDecodingError
+from nsot_sync import retry
+from nsot_sync.cli import cli
+from nsot_sync.client import get_session
+from nsot_sync.drivers.base_driver import BaseDriver
+
+
+@pytest.fixture
+def session(nsot):
+    policy = retry.RetryPolicy(retries=2, backoff=0)
+    session = get_session(policy=policy)
+    yield session
+    session.close()
+
+
+def test_retries(nsot, session):
+    base = nsot.url + '/sites/1/'
+    stats = session.get_adapter(base).stats
+    before = stats.snapshot()
+
+    # Idempotent requests are retried until they work
+    nsot.errors = [503, 502]
+    assert session.get(base + 'devices/').status_code == 200
+    assert nsot.requests[('GET', 'devices')] == 3
+
+    # POSTs only on a 503, as anything else may have been applied
+    nsot.errors = [502]
+    assert session.post(base + 'devices/', json={'hostname': 'a'}
+                        ).status_code == 502
+    nsot.errors = [503]
+    assert session.post(base + 'devices/', json={'hostname': 'a'}
+                        ).status_code == 201
+    assert nsot.requests[('POST', 'devices')] == 3
+
+    # Retries run out
+    nsot.errors = [500] * 3
+    assert session.get(base + 'devices/').status_code == 500
+    assert stats.since(before) == {'retried': 5, 'recovered': 2,
+                                   'exhausted': 2}
+
+
+def test_circuit_breaker(nsot, session):
+    base = nsot.url + '/sites/1/'
+    adapter = session.get_adapter(base)
+    adapter.breaker = retry.CircuitBreaker(threshold=3, reset=60,
+                                           stats=adapter.stats)
+
+    nsot.errors = [503] * 3
+    assert session.get(base + 'devices/').status_code == 503
+
+    # Open, so nothing else is sent until it's time to try again
+    with pytest.raises(retry.CircuitOpenError):
+        session.get(base + 'devices/')
+    assert nsot.requests[('GET', 'devices')] == 3
+
+    adapter.breaker.opened -= 60
+    assert session.get(base + 'devices/').status_code == 200
+    assert adapter.breaker.opened is None
+
+
+class Driver(BaseDriver):
+    FINGERPRINT = False
+    REQUIRED_ATTRS = [{'name': 'role', 'resource_name': 'Device',
+                       'required': False}]
+
+    def get_resources(self):
+        return {'devices': [{'hostname': 'a', 'attributes': {}}]}
+
+
+def test_server_errors(nsot):
+    # Every attempt at finding the attribute fails, then at prefetching and
+    # looking up the device, but neither is taken as missing and created
+    nsot.errors = [500] * 6
+    ctx = click.Context(cli, obj={
+        'SITE_ID': 1, 'NOOP': False, 'PROGRESS_INTERVAL': 0, 'RETRIES': 1,
+        'EXTRA_ATTRS': {}, 'WORKERS': 1, 'TOKEN_CACHE': '',
+    })
+    driver = Driver(click_ctx=ctx)
+    adapter = driver.client._store['session'].get_adapter(nsot.url)
+    adapter.policy.backoff = 0
+    adapter.breaker.threshold = 10
+    driver.handle_resources()
+    assert nsot.count('POST') == 0
+    assert driver.report.counts[('devices', 'failed')] == 1
+
+
+def test_circuit_breaker_trial_raises(nsot, session, monkeypatch):
+    base = nsot.url + '/sites/1/'
+    adapter = session.get_adapter(base)
+
+    # Open, and due another try
+    adapter.breaker.opened = 0
+
+    # The trial request fails with something that's neither a response nor
+    # a connection error, but the next is still let through
+    def broken(*args, **kwargs):
+        raise ContentDecodingError('broken')
+    monkeypatch.setattr(HTTPAdapter, 'send', broken)
+    with pytest.raises(ContentDecodingError):
+        session.get(base + 'devices/')
+    monkeypatch.undo()
+    assert session.get(base + 'devices/').status_code == 200
+
+
+def test_timeouts(nsot, tmpdir):
+    # NSoT never answers in time, so the run spools rather than crashing,
+    # and doesn't take its lookups for misses
+    nsot.stall = 0.5
+    spool_dir = str(tmpdir.join('spool'))
+    ctx = click.Context(cli, obj={
+        'SITE_ID': 1, 'NOOP': False, 'PROGRESS_INTERVAL': 0, 'RETRIES': 1,
+        'TIMEOUT': 0.2, 'SPOOL_DIR': spool_dir, 'EXTRA_ATTRS': {},
+        'WORKERS': 1, 'TOKEN_CACHE': '',
+    })
+    driver = Driver(click_ctx=ctx)
+    adapter = driver.client._store['session'].get_adapter(nsot.url)
+    adapter.policy.backoff = 0
+    with pytest.raises(retry.TimedOutError):
+        driver.client.devices.get()
+    assert issubclass(retry.TimedOutError, ConnectionError)
+
+    driver.handle_resources()
+    assert driver.offline
+    assert [e['key'] for e in driver.spool.pending()] == ['a']
+    assert nsot.count('POST') == 0
@@ -0,0 +1,69 @@
+import threading
+from nsot_sync.scheduler import CycleError, DependencyGraph, resource_graph
+
+
+def test_resource_graph():
+    resources = {
+        'devices': [{'hostname': 'foo'}],
+        'networks': [
+            {'network_address': '10.0.0.1', 'prefix_length': 32},
+            {'network_address': '10.0.0.0', 'prefix_length': 24},
+            {'network_address': '10.0.0.0', 'prefix_length': 8},
+        ],
+        'interfaces': [
+            {'device': 'foo', 'name': 'eth0', 'addresses': ['10.0.0.1/32']},
+        ],
+    }
+    graph = resource_graph(resources)
+    assert graph.deps[('networks', '10.0.0.1/32')] == set([
+        ('networks', '10.0.0.0/24')])
+    assert graph.deps[('networks', '10.0.0.0/24')] == set([
+        ('networks', '10.0.0.0/8')])
+    assert graph.deps[('interfaces', 'foo:eth0')] == set([
+        ('devices', 'foo'), ('networks', '10.0.0.1/32')])
+
+
+def test_run_order():
+    graph = DependencyGraph()
+    graph.add('intf', ['device', 'addr'])
+    graph.add('addr', ['net'])
+    graph.add('device')
+    graph.add('net', ['already-in-nsot'])
+
+    order = []
+    lock = threading.Lock()
+
+    def record(node):
+        with lock:
+            order.append(node)
+
+    graph.run(record, workers=4)
+    assert sorted(order) == ['addr', 'device', 'intf', 'net']
+    assert order.index('net') < order.index('addr') < order.index('intf')
+    assert order.index('device') < order.index('intf')
+
+    graph.add('net', ['intf'])
+    try:
+        graph.run(record)
+    except CycleError:
+        pass
+    else:
+        assert False, 'cycle should have been detected'
+
+
+def test_run_priority_and_stop():
+    graph = DependencyGraph()
+    graph.add('low', priority=2)
+    graph.add('parent', priority=2)
+    graph.add('child', ['parent'], priority=0)
+    graph.add('high', priority=1)
+
+    order = []
+    assert graph.run(order.append) == []
+    # The parent of an urgent node is as urgent as it
+    assert order == ['parent', 'child', 'high', 'low']
+
+    order = []
+    unrun = graph.run(order.append, stop=lambda: len(order) >= 2)
+    assert order == ['parent', 'child']
+    assert unrun == ['low', 'high']
@@ -0,0 +1,77 @@
+import click
+import pytest
+from nsot_sync.cli import cli
+from nsot_sync.drivers.base_driver import BaseDriver
+from nsot_sync.selection import Selection
+
+
+def network(cidr):
+    address, plen = cidr.split('/')
+    return {'network_address': address, 'prefix_length': int(plen),
+            'attributes': {}}
+
+
+RESOURCES = {
+    'devices': [{'hostname': 'a', 'attributes': {}}],
+    'networks': [network('10.0.0.0/24'), network('10.0.0.1/32'),
+                 network('192.168.0.0/24'), network('fd00::/64')],
+    'interfaces': [
+        {'device': 'a', 'name': 'eth0', 'addresses': ['10.0.0.1/32'],
+         'attributes': {}},
+        {'device': 'a', 'name': 'lo', 'addresses': [], 'attributes': {}},
+    ],
+}
+
+
+def test_selection():
+    assert not Selection()
+    assert Selection().apply(RESOURCES) is RESOURCES
+
+    only = Selection(['networks', 'interfaces'], ['eth*', 'bond?'],
+                     ['10.0.0.0/8'])
+    selected = only.apply(RESOURCES)
+    assert selected['devices'] == []
+    assert [n['network_address'] for n in selected['networks']] == [
+        '10.0.0.0', '10.0.0.1']
+    assert [i['name'] for i in selected['interfaces']] == ['eth0']
+    assert only.wants_attr({'name': 'x', 'resource_name': 'Interface'})
+    assert not only.wants_attr({'name': 'x', 'resource_name': 'Device'})
+
+    with pytest.raises(ValueError):
+        Selection(['routers'])
+    with pytest.raises(ValueError):
+        Selection(cidrs=['10.0.0.0/33'])
+
+
+class Driver(BaseDriver):
+    SCOPED_FETCH_MAX = 0
+    REQUIRED_ATTRS = [
+        {'name': 'role', 'resource_name': 'Device', 'required': False},
+        {'name': 'vlan', 'resource_name': 'Interface', 'required': False},
+    ]
+
+    def get_resources(self):
+        return {
+            'devices': [dict(d) for d in RESOURCES['devices']],
+            'networks': [dict(n) for n in RESOURCES['networks']],
+            'interfaces': [dict(i) for i in RESOURCES['interfaces']],
+        }
+
+
+def test_partial_sync(nsot):
+    ctx = click.Context(cli, obj={
+        'SITE_ID': 1, 'NOOP': False, 'PROGRESS_INTERVAL': 0,
+        'EXTRA_ATTRS': {}, 'WORKERS': 1, 'TOKEN_CACHE': '',
+        'ONLY': ['networks'], 'ONLY_NETWORKS': ['192.168.0.0/16'],
+    })
+    driver = Driver(click_ctx=ctx)
+    driver.handle_resources()
+
+    # No attributes were ensured and no devices or interfaces listed, nor
+    # any fingerprint saved. The site's attributes are only listed to
+    # validate against
+    assert [n['network_address'] for n in nsot.objects['networks'].values()
+            ] == ['192.168.0.0']
+    assert sorted(nsot.requests.items()) == [(('GET', 'attributes'), 1),
+                                             (('GET', 'networks'), 1),
+                                             (('POST', 'networks'), 1)]
@@ -0,0 +1,61 @@
+from pynsot.util import get_result
+from nsot_sync import serializers
+from nsot_sync.client import get_client
+
+RESOURCES = {
+    'devices': [{'hostname': 'foo', 'attributes': {'desc': 'a/b "c"'}}],
+    'networks': [],
+    'interfaces': [{'device': 'foo', 'name': 'eth0',
+                    'addresses': ['10.0.0.1/32'], 'attributes': {}}],
+}
+
+
+class Output(list):
+    '''File-like collecting what's written'''
+
+    def flush(self):
+        pass
+
+    write = list.append
+
+    def getvalue(self):
+        return ''.join(self)
+
+
+def stream(resources, fmt):
+    fp = Output()
+    serializers.stream(resources, fp, fmt)
+    return fp.getvalue()
+
+
+def test_stream():
+    assert serializers.loads(stream(RESOURCES, 'json')) == RESOURCES
+
+    lines = [serializers.loads(line)
+             for line in stream(RESOURCES, 'ndjson').splitlines()]
+    parsed = dict((rtype, []) for rtype in RESOURCES)
+    for line in lines:
+        parsed[line['resource_type']].append(line['resource'])
+    assert parsed == RESOURCES
+
+    # Lists can be generators, and written more than a chunk at a time
+    many = {'networks': ({'n': i} for i in range(1200))}
+    assert len(serializers.loads(stream(many, 'json'))['networks']) == 1200
+
+
+def test_stdlib_fallback(monkeypatch):
+    monkeypatch.setattr(serializers, 'ujson', None)
+    assert serializers.loads(serializers.dumps(RESOURCES)) == RESOURCES
+    assert serializers.loads(stream(RESOURCES, 'json')) == RESOURCES
+
+
+def test_install(nsot):
+    site = get_client().sites(1)
+    serializers.install(site)
+    serializer = site._store['serializer']
+    assert isinstance(serializer.get_serializer(),
+                      serializers.FastJsonSerializer)
+
+    site.devices.post({'hostname': 'foo', 'attributes': {}})
+    found = get_result(site.devices.get(hostname='foo'))
+    assert [d['hostname'] for d in found] == ['foo']
@@ -0,0 +1,61 @@
+import click
+import netifaces
+from nsot_sync import netlink
+from nsot_sync.cli import cli
+from nsot_sync.drivers.simple import SimpleDriver
+
+
+def families(mac, *addrs):
+    return {netifaces.AF_LINK: [{'addr': mac}],
+            netifaces.AF_INET: [{'addr': a} for a in addrs]}
+
+
+class Host(SimpleDriver):
+    '''SimpleDriver with canned addresses, in two namespaces'''
+
+    USE_NETLINK = False
+
+    def get_ifaddresses(self):
+        return {'eth0': families('00:00:5e:00:53:01', '10.0.0.1')}
+
+    def get_netns_ifaddresses(self):
+        return {
+            'blue': {'eth0': families('00:00:5e:00:53:02', '10.1.0.1')},
+            # The same address up in two namespaces
+            'red': {'eth0': families('00:00:5e:00:53:03', '10.1.0.1'),
+                    'lo': families('00:00:00:00:00:00', '127.0.0.1')},
+        }
+
+
+def driver(cls=Host, **kwargs):
+    ctx = click.Context(cli, obj={'SITE_ID': 1, 'EXTRA_ATTRS': {}})
+    return cls(click_ctx=ctx, collect_only=True, scan_netns=True, **kwargs)
+
+
+def test_netns():
+    d = driver()
+    assert d.NETNS_ATTR in d.REQUIRED_ATTRS
+    resources = d.get_networks_and_interfaces()
+    assert [(i['name'], i['attributes'], i['addresses'])
+            for i in resources['interfaces']] == [
+        ('eth0', {}, ['10.0.0.1/32']),
+        ('blue/eth0', {'netns': 'blue'}, ['10.1.0.1/32']),
+        ('red/eth0', {'netns': 'red'}, ['10.1.0.1/32']),
+    ]
+    assert [n['network_address'] for n in resources['networks']] == [
+        '10.0.0.1', '10.1.0.1']
+
+
+def test_netns_unreadable(tmpdir):
+    # Not a namespace, so entering it fails in the worker
+    tmpdir.join('bad').write('')
+    d = driver(SimpleDriver)
+    d.NETNS_DIR = str(tmpdir)
+    assert d.get_netns_ifaddresses() == {}
+
+
+def test_netns_without_setns(monkeypatch):
+    def setns(path):
+        raise AttributeError('setns')
+    monkeypatch.setattr(netlink, 'setns', setns)
+    assert netlink.netns_ifaddresses('/x') == ('/x', None, 'setns')
@@ -0,0 +1,99 @@
+import click
+import fake_nsot
+from nsot_sync.cli import cli
+from nsot_sync.drivers.base_driver import BaseDriver
+from nsot_sync.drivers.replay import ReplayDriver
+from nsot_sync.spool import Spool
+
+
+def test_coalesce_keeps_latest_write():
+    spool = Spool.coalesce([
+        {'site_id': 1, 'resource_type': 'devices', 'key': 'a', 'op': 'create',
+         'resource': {'hostname': 'a', 'attributes': {'desc': 'old'}}},
+        {'site_id': 1, 'resource_type': 'devices', 'key': 'b', 'op': 'create',
+         'resource': {'hostname': 'b', 'attributes': {}}},
+        {'site_id': 1, 'resource_type': 'devices', 'key': 'a', 'op': 'update',
+         'resource': {'hostname': 'a', 'attributes': {'desc': 'new'}}},
+    ])
+    assert [e['key'] for e in spool] == ['b', 'a']
+    assert spool[1]['resource']['attributes'] == {'desc': 'new'}
+
+
+def test_drain_empties_journal(tmpdir):
+    spool = Spool(str(tmpdir))
+    spool.append('create', 'devices', 'a', {'hostname': 'a', 'id': 3}, 1)
+    spool.append('delete', 'devices', 'a', {'hostname': 'a'}, 1)
+
+    with spool.drain() as entries:
+        assert [e['op'] for e in entries] == ['delete']
+        # Runs spooling during a replay land in a fresh journal
+        spool.append('create', 'devices', 'b', {'hostname': 'b'}, 1)
+
+    assert [e['key'] for e in spool.pending()] == ['b']
+
+
+def test_failed_drain_is_kept(tmpdir):
+    spool = Spool(str(tmpdir))
+    spool.append('create', 'devices', 'a', {'hostname': 'a'}, 1)
+    try:
+        with spool.drain():
+            raise RuntimeError
+    except RuntimeError:
+        pass
+
+    assert [e['key'] for e in spool.pending()] == ['a']
+    assert 'id' not in spool.pending()[0]['resource']
+
+
+class Driver(BaseDriver):
+    '''Loses NSoT right after writing its device'''
+
+    def get_resources(self):
+        return {
+            'devices': [{'hostname': 'foo', 'attributes': {}}],
+            'networks': [{'network_address': '10.0.0.1', 'prefix_length': 32,
+                          'attributes': {}}],
+            'interfaces': [{'device': 'foo', 'name': 'eth0',
+                            'addresses': ['10.0.0.1/32'], 'attributes': {}}],
+        }
+
+    def handle_device(self, device):
+        super(Driver, self).handle_device(device)
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def context(spool_dir):
+    return click.Context(cli, obj={
+        'SITE_ID': 1, 'NOOP': False, 'PROGRESS_INTERVAL': 0, 'RETRIES': 0,
+        'SPOOL_DIR': spool_dir, 'EXTRA_ATTRS': {}, 'WORKERS': 1,
+        'TOKEN_CACHE': '',
+    })
+
+
+def test_spool_and_replay(nsot, tmpdir):
+    spool_dir = str(tmpdir.join('spool'))
+    driver = Driver(click_ctx=context(spool_dir))
+    driver.server = nsot.server
+    port = nsot.server.server_address[1]
+    driver.handle_resources()
+
+    # Everything after the device was spooled
+    assert driver.offline
+    assert [h['hostname'] for h in nsot.objects['devices'].values()] == [
+        'foo']
+    assert sorted((e['resource_type'], e['key'])
+                  for e in Spool(spool_dir).pending()) == [
+        ('interfaces', 'foo:eth0'), ('networks', '10.0.0.1/32')]
+
+    # Once NSoT is back, replaying applies them
+    server = fake_nsot.serve(port, nsot)
+    try:
+        replay = ReplayDriver(click_ctx=context(spool_dir))
+        replay.handle_resources()
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert Spool(spool_dir).pending() == []
+    intf, = nsot.objects['interfaces'].values()
+    assert (intf['name'], intf['addresses']) == ('eth0', ['10.0.0.1/32'])
@@ -0,0 +1,94 @@
+import click
+from nsot_sync.cli import cli
+from nsot_sync.drivers.base_driver import BaseDriver
+from nsot_sync.staging import StagingStore, same
+
+
+def network(cidr, **attrs):
+    address, plen = cidr.split('/')
+    return {'network_address': address, 'prefix_length': int(plen),
+            'attributes': attrs}
+
+
+def test_staging_store(tmpdir):
+    store = StagingStore(str(tmpdir.join('staging.db')))
+    store.add([
+        ('networks', network('10.0.0.0/24', desc='first')),
+        ('networks', network('10.0.0.0/8')),
+        ('networks', network('10.0.0.0/24', desc='dup', owner='dup')),
+        ('devices', {'hostname': 'foo', 'attributes': {}}),
+    ])
+    store.add_existing('networks', [('10.0.0.0/8', dict(network('10.0.0.0/8'),
+                                                        id=1))])
+    assert store.counts() == {'devices': 1, 'networks': 2, 'interfaces': 0}
+    assert store.count('networks', new=True) == 1
+
+    # Parents first, the first duplicate wins, one batch at a time
+    batches = list(store.batches('networks', 1))
+    assert [b[0][0] for b in batches] == ['10.0.0.0/8', '10.0.0.0/24']
+    key, resource, existing = batches[1][0]
+    assert resource['attributes'] == {'desc': 'first'}
+    assert existing is None
+    assert batches[0][0][2]['id'] == 1
+    store.close()
+
+
+def test_staging_store_replace():
+    store = StagingStore()
+    store.add([('networks', network('10.0.0.0/24', desc='first'))])
+    store.add([('networks', network('10.0.0.0/24', owner='later'))],
+              replace=True)
+    [[(_, resource, _)]] = store.batches('networks', 10)
+    assert resource['attributes'] == {'owner': 'later'}
+    store.close()
+
+
+def test_same():
+    existing = dict(network('10.0.0.0/24', desc='x'), id=3, state='allocated',
+                    site_id=1)
+    assert same({'network_address': '10.0.0.0', 'prefix_length': '24',
+                 'attributes': {'desc': 'x'}, 'site_id': 1}, existing)
+    assert not same(network('10.0.0.0/24', desc='y'), existing)
+    assert same({'addresses': ['b', 'a']}, {'addresses': ['a', 'b']})
+
+
+class Driver(BaseDriver):
+    REQUIRED_ATTRS = [{'name': 'desc', 'resource_name': 'Network',
+                       'required': False}]
+
+    def get_resources(self):
+        return {
+            'devices': [{'hostname': 'foo', 'attributes': {}}],
+            'networks': [network('10.0.0.0/8'),
+                         network('10.0.0.1/32', desc='eth0')],
+            'interfaces': [{'device': 'foo', 'name': 'eth0',
+                            'addresses': ['10.0.0.1/32'], 'attributes': {}}],
+        }
+
+
+def sync_staged(path):
+    ctx = click.Context(cli, obj={
+        'SITE_ID': 1, 'NOOP': False, 'PROGRESS_INTERVAL': 0,
+        'EXTRA_ATTRS': {}, 'WORKERS': 1, 'TOKEN_CACHE': '', 'STAGING': path,
+    })
+    driver = Driver(click_ctx=ctx)
+    driver.handle_resources()
+    return driver
+
+
+def test_staged_sync(nsot, tmpdir):
+    path = str(tmpdir.join('staging.db'))
+    driver = sync_staged(path)
+    assert driver.report.counts[('networks', 'created')] == 2
+    assert len(nsot.objects['interfaces']) == 1
+    # Nothing is fingerprinted, so there's no attribute for it
+    assert [a['name'] for a in nsot.objects['attributes'].values()] == [
+        'desc']
+
+    # Everything is found unchanged by the diff, and nothing is written
+    nsot.reset_counts()
+    driver = sync_staged(path)
+    assert dict((k, v) for k, v in driver.report.counts.items() if v) == {
+        ('devices', 'unchanged'): 1, ('networks', 'unchanged'): 2,
+        ('interfaces', 'unchanged'): 1}
+    assert nsot.count('POST') == nsot.count('PATCH') == 0
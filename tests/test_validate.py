@@ -0,0 +1,111 @@
+import json
+import click
+from nsot_sync.cli import cli
+from nsot_sync.drivers.base_driver import BaseDriver
+from nsot_sync.validate import Validator
+
+
+def interface(device, name, mac=None, addresses=()):
+    return {'device': device, 'name': name, 'mac_address': mac,
+            'addresses': list(addresses), 'attributes': {}}
+
+
+def network(cidr, **attrs):
+    address, plen = cidr.split('/')
+    return {'network_address': address, 'prefix_length': int(plen),
+            'attributes': attrs}
+
+
+def test_validator():
+    attributes = [
+        {'name': 'dc', 'resource_name': 'Device', 'required': True},
+        {'name': 'vlans', 'resource_name': 'Interface', 'multi': True,
+         'required': False, 'constraints': {'pattern': '^[0-9]+$'}},
+    ]
+    v = Validator(attributes, known_attrs=True, networks=['10.0.0.0/8'])
+    valid, invalid = v.validate({
+        'devices': [{'hostname': 'a', 'attributes': {'dc': 'x'}},
+                    {'hostname': 'b', 'attributes': {}},
+                    {'hostname': 'c', 'attributes': {'dc': 'x', 'y': 'z'}}],
+        # Children are listed first, but checked after their parents
+        'networks': [network('192.168.0.1/32'), network('192.168.0.0/24'),
+                     network('172.16.0.1/32'), network('10.0.0.1/24')],
+        'interfaces': [
+            interface('a', 'eth0', '00:11:22:33:44:55', ['10.1.1.1/32']),
+            interface('a', 'eth0'),
+            interface('a', 'eth1', 'not-a-mac'),
+            interface('a', 'eth2', addresses=['172.16.0.1/32']),
+            interface('b', 'eth0'),
+            dict(interface('a', 'eth3'), attributes={'vlans': ['1', 'x']}),
+        ],
+    })
+    assert [d['hostname'] for d in valid['devices']] == ['a']
+    assert [n['network_address'] for n in valid['networks']] == [
+        '192.168.0.1', '192.168.0.0']
+    assert [i['name'] for i in valid['interfaces']] == ['eth0']
+    assert [(rtype, key, reason) for rtype, key, reason, _ in invalid] == [
+        ('devices', 'b', 'missing required attribute dc'),
+        ('devices', 'c', 'unknown attribute y'),
+        ('networks', '10.0.0.1/24', 'host bits set'),
+        ('networks', '172.16.0.1/32', 'no base network'),
+        ('interfaces', 'a:eth0', 'duplicate name on device'),
+        ('interfaces', 'a:eth1', 'invalid MAC address'),
+        ('interfaces', 'a:eth2', 'address outside any known network'),
+        ('interfaces', 'b:eth0', 'device invalid'),
+        ('interfaces', 'a:eth3', 'invalid value for attribute vlans'),
+    ]
+
+
+def test_validator_without_site():
+    # Nothing known about the site, so only local checks apply
+    v = Validator()
+    valid, invalid = v.validate({
+        'networks': [network('172.16.0.1/32')],
+        'interfaces': [interface('a', 'eth0', addresses=['1.1.1.1/32']),
+                       interface('a', 'eth1', mac='zz')],
+    })
+    assert len(valid['networks']) == 1
+    assert [i['name'] for i in valid['interfaces']] == ['eth0']
+    assert [reason for _, _, reason, _ in invalid] == ['invalid MAC address']
+
+
+class Driver(BaseDriver):
+    SCOPED_FETCH_MAX = 0
+    FINGERPRINT = False
+
+    def get_resources(self):
+        return {
+            'devices': [{'hostname': 'a', 'attributes': {}}],
+            'networks': [network('10.0.0.1/32'), network('172.16.0.1/32')],
+            'interfaces': [
+                interface('a', 'eth0', addresses=['10.0.0.1/32']),
+                interface('a', 'eth1', addresses=['172.16.0.1/32']),
+                interface('a', 'eth2', mac='zz'),
+            ],
+        }
+
+
+def test_driver_quarantine(nsot, tmpdir):
+    nsot.create('networks', network('10.0.0.0/24'))
+    quarantine = tmpdir.join('quarantine')
+    ctx = click.Context(cli, obj={
+        'SITE_ID': 1, 'NOOP': False, 'PROGRESS_INTERVAL': 0,
+        'QUARANTINE': str(quarantine), 'EXTRA_ATTRS': {}, 'WORKERS': 1,
+        'TOKEN_CACHE': '',
+    })
+    driver = Driver(click_ctx=ctx)
+    driver.handle_resources()
+
+    # Nothing doomed was sent
+    assert len(nsot.objects['networks']) == 2
+    assert [i['name'] for i in nsot.objects['interfaces'].values()] == [
+        'eth0']
+    assert nsot.requests[('POST', 'interfaces')] == 1
+
+    entries = [json.loads(line) for line in quarantine.readlines()]
+    assert [(e['key'], e['reason']) for e in entries] == [
+        ('172.16.0.1/32', 'no base network'),
+        ('a:eth1', 'address outside any known network'),
+        ('a:eth2', 'invalid MAC address'),
+    ]
+    assert driver.report.counts[('interfaces', 'invalid')] == 2